@@ -0,0 +1,72 @@
+"""Compare the linear search_commands scan against SearchIndex.
+
+Usage: python benchmarks/bench_search.py [--sizes 1000,100000,1000000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from command_utils import search_commands
+from search_index import SearchIndex
+
+WORDS = ['git', 'docker', 'kubectl', 'grep', 'find', 'tar', 'ssh', 'rsync', 'curl',
+         'systemctl', 'journalctl', 'awk', 'sed', 'lsblk', 'df', 'du', 'ps', 'top',
+         'status', 'logs', 'push', 'pull', 'build', 'restart', 'deploy', 'backup']
+CATEGORIES = ['Linux', 'Windows', 'Network', 'Storage', 'Build', 'Uncategorized']
+QUERIES = ['docker', 'kubectl logs', 'rest', 'cmd-4242', 'df -h', 'zz-no-match']
+
+
+def make_commands(size, seed=0):
+    """Build a synthetic command library of the given size."""
+    rng = random.Random(seed)
+    commands = {}
+    for i in range(size):
+        words = rng.sample(WORDS, 4)
+        commands[f"cmd-{i}"] = {
+            "command": f"{words[0]} {words[1]} -h /srv/{words[2]}",
+            "description": f"{words[3]} helper number {i}",
+            "category": rng.choice(CATEGORIES),
+            "interval": 0,
+            "count": 1,
+        }
+    return commands
+
+
+def time_query(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def run(sizes, repeat):
+    print(f"{'size':>9} {'query':<14} {'linear ms':>10} {'index ms':>10} {'speedup':>8}")
+    for size in sizes:
+        commands = make_commands(size)
+        start = time.perf_counter()
+        index = SearchIndex(commands)
+        print(f"{size:>9} built index in {time.perf_counter() - start:.2f}s")
+        for query in QUERIES:
+            linear = time_query(lambda: search_commands(commands, query), max(1, repeat // 10))
+            indexed = time_query(lambda: search_commands(commands, query, index), repeat)
+            print(f"{size:>9} {query:<14} {linear * 1000:>10.3f} {indexed * 1000:>10.3f} "
+                  f"{linear / indexed if indexed else float('inf'):>7.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    run([int(size) for size in args.sizes.split(',')], args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""Benchmark suite for the storage, search, execution, scheduling and GUI paths.
+
+Usage: python benchmarks/run.py [--quick] [--only GROUP] [--output FILE]
+                                [--baseline FILE] [--update-baseline]
+
+Every case reports the best of a few repeats in seconds (lower is
+better) over fixed-seed synthetic libraries, and is compared with
+baseline.json. Fast operations are timed in bursts (JOURNAL_BURST
+puts, every query in QUERIES) and the case is the whole burst, so
+min_delta applies to time that was actually measured. A case regresses when it is slower than its baseline by
+more than the threshold (relative) and by more than min_delta seconds
+(absolute, so that sub-millisecond noise does not fail the run); the
+exit status is then 1. Cases bound by fsync or by thread wake-ups vary
+far more than the CPU-bound ones, so baseline.json gives them their
+own, wider threshold and min_delta. Baselines only mean something on the machine
+that recorded them: re-record with --update-baseline after changing
+hardware. The GUI case needs a display; on a headless machine run the
+suite under xvfb-run, otherwise it is skipped.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_search import QUERIES, make_commands
+from command_store import CommandStore
+from command_utils import load_commands, save_commands, search_commands
+from executor import CommandExecutor
+from fuzzy import FuzzyIndex
+from scheduler import Scheduler
+from search_index import SearchIndex
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_MIN_DELTA = 0.002
+SIZES = (1000, 100000)
+QUICK_SIZES = (1000, 10000)
+JOURNAL_BURST = 1000
+# Callers of the indexed search ask for at most this many results.
+SEARCH_LIMIT = 200
+EXECUTOR_RUNS = 200
+EXECUTOR_WORKERS = 8
+SCHEDULER_JOBS = 100
+SCHEDULER_SECONDS = 3.0
+
+
+class Skipped(Exception):
+    pass
+
+
+def measure(func, repeat):
+    """Best wall time of func() over repeat calls; the minimum is the least noisy estimate.
+
+    As in timeit, the garbage collector is off while timing, so a
+    collection triggered by an earlier case's garbage is not charged here.
+    """
+    samples = []
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+    finally:
+        if enabled:
+            gc.enable()
+    return min(samples)
+
+
+def bench_store(workdir, size, repeat):
+    commands = make_commands(size)
+    path = os.path.join(workdir, f'commands-{size}.json')
+    save_commands(commands, path)
+    results = {
+        f'store.save_commands[{size}]': measure(lambda: save_commands(commands, path), repeat),
+        f'store.load_commands[{size}]': measure(lambda: load_commands(path), repeat),
+    }
+    store = CommandStore(path, compact_threshold=10 ** 9)
+    try:
+        details = {"command": "echo benchmark", "description": "journal append", "category": "Bench"}
+        results[f'store.journal_put[{size}]'] = measure(
+            lambda: [store.put(f"bench-{i}", details) for i in range(JOURNAL_BURST)], repeat)
+    finally:
+        store.close()
+    return results
+
+
+def bench_search(size, repeat):
+    commands = make_commands(size)
+    index = SearchIndex(commands)
+    fuzzy = FuzzyIndex(commands)
+    fuzzy.prepare()
+
+    def each_query(func):
+        return lambda: [func(query) for query in QUERIES]
+
+    try:
+        return {
+            f'search.linear[{size}]': measure(each_query(lambda query: search_commands(commands, query)),
+                                              repeat),
+            f'search.index[{size}]': measure(
+                each_query(lambda query: search_commands(commands, query, index, SEARCH_LIMIT)), repeat),
+            f'search.fuzzy[{size}]': measure(each_query(lambda query: fuzzy.search(query)), repeat),
+        }
+    finally:
+        fuzzy.close()
+
+
+def bench_executor(repeat):
+    """Wall time for EXECUTOR_RUNS concurrent trivial commands."""
+    def run_all():
+        executor = CommandExecutor(EXECUTOR_WORKERS)
+        try:
+            runs = [executor.submit(f"bench-{i}", "true") for i in range(EXECUTOR_RUNS)]
+            for run in runs:
+                run.wait()
+        finally:
+            executor.shutdown()
+
+    return {f'executor.throughput[{EXECUTOR_RUNS}]': measure(run_all, repeat)}
+
+
+def bench_scheduler(workdir):
+    """How late interval jobs fire: p95 and max lateness over SCHEDULER_SECONDS."""
+    path = os.path.join(workdir, 'schedules.json')
+    created = time.time()
+    jobs = [{"id": f"job{i}", "name": f"bench-{i}", "interval": 1, "created": created, "last_run": None}
+            for i in range(SCHEDULER_JOBS)]
+    with open(path, 'w') as file:
+        json.dump(jobs, file)
+    # With 'all', each run is due exactly one interval after the last due
+    # time, so the k-th run of every job is due at created + k.
+    scheduler = Scheduler(path, catch_up='all')
+    fired = {}
+    lateness = []
+
+    def callback(name):
+        now = time.time()
+        fired[name] = fired.get(name, 0) + 1
+        lateness.append(now - (created + fired[name]))
+
+    scheduler.start(callback)
+    time.sleep(SCHEDULER_SECONDS)
+    scheduler.stop()
+    scheduler.thread.join()
+    if not lateness:
+        raise Skipped("no scheduled run fired")
+    lateness.sort()
+    return {
+        'scheduler.jitter_p95': lateness[int(0.95 * (len(lateness) - 1))],
+        'scheduler.jitter_max': lateness[-1],
+    }
+
+
+def bench_gui(workdir, size, repeat):
+    """Category and command list refresh of the real window at size commands."""
+    try:
+        import tkinter as tk
+
+        tk.Tk().destroy()
+    except Exception as e:
+        raise Skipped(f"no display ({e})")
+    from command_storage_tool import CommandStorageTool
+
+    directory = os.path.join(workdir, 'gui')
+    os.makedirs(directory)
+    save_commands(make_commands(size), os.path.join(directory, 'commands.json'))
+    cwd = os.getcwd()
+    os.chdir(directory)
+    app = None
+    try:
+        app = CommandStorageTool()
+        deadline = time.monotonic() + 120
+        while app.core is None:
+            if time.monotonic() > deadline:
+                raise Skipped("library did not load")
+            app.update()
+            time.sleep(0.01)
+        names = list(app.commands)
+
+        def refresh_list():
+            app.update_command_listbox(commands=names)
+            app.update_idletasks()
+
+        def refresh_categories():
+            app.refresh_categories()
+            app.update_idletasks()
+
+        return {
+            f'gui.command_list_refresh[{size}]': measure(refresh_list, repeat),
+            f'gui.category_refresh[{size}]': measure(refresh_categories, repeat),
+        }
+    finally:
+        if app is not None:
+            if app.core is not None:
+                app.core.close()
+            app.destroy()
+        os.chdir(cwd)
+
+
+def run_suite(sizes, repeat, only=None):
+    workdir = tempfile.mkdtemp(prefix='cst-bench-')
+    cases = []
+    for size in sizes:
+        cases.append(('store', lambda size=size: bench_store(workdir, size, repeat)))
+    for size in sizes:
+        cases.append(('search', lambda size=size: bench_search(size, repeat)))
+    cases.append(('executor', lambda: bench_executor(max(1, repeat // 2))))
+    cases.append(('scheduler', lambda: bench_scheduler(workdir)))
+    cases.append(('gui', lambda: bench_gui(workdir, sizes[-1], repeat)))
+    results, skipped = {}, {}
+    try:
+        for group, case in cases:
+            if only and not any(group.startswith(prefix) for prefix in only):
+                continue
+            try:
+                for name, value in case().items():
+                    results[name] = value
+                    print(f"{name:<36} {value * 1000:>12.3f} ms", flush=True)
+            except Skipped as e:
+                skipped[group] = str(e)
+                print(f"{group:<36} {'skipped':>15}: {e}", flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results, skipped
+
+
+def machine():
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+def compare(results, baseline):
+    """Return the regressed cases as (name, value, baseline value, limit) tuples."""
+    regressions = []
+    print(f"\n{'case':<36} {'baseline ms':>12} {'now ms':>12} {'change':>8}")
+    for name, value in results.items():
+        entry = baseline.get('cases', {}).get(name)
+        if entry is None:
+            print(f"{name:<36} {'-':>12} {value * 1000:>12.3f} {'new':>8}")
+            continue
+        threshold = entry.get('threshold', baseline.get('threshold', DEFAULT_THRESHOLD))
+        min_delta = entry.get('min_delta', baseline.get('min_delta', DEFAULT_MIN_DELTA))
+        limit = max(entry['value'] * (1 + threshold), entry['value'] + min_delta)
+        change = (value - entry['value']) / entry['value'] if entry['value'] else 0
+        flag = "  REGRESSION" if value > limit else ""
+        print(f"{name:<36} {entry['value'] * 1000:>12.3f} {value * 1000:>12.3f} {change:>+8.0%}{flag}")
+        if value > limit:
+            regressions.append((name, value, entry['value'], limit))
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def update_baseline(path, results, baseline):
+    """Record results as the new baseline, keeping per-case thresholds."""
+    cases = baseline.get('cases', {})
+    for name, value in results.items():
+        cases[name] = dict(cases.get(name, {}), value=round(value, 6))
+    baseline.update(machine=machine(), recorded=time.strftime("%Y-%m-%d"), cases=dict(sorted(cases.items())))
+    baseline.setdefault('threshold', DEFAULT_THRESHOLD)
+    baseline.setdefault('min_delta', DEFAULT_MIN_DELTA)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(baseline, file, indent=4)
+        file.write("\n")
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help=f"library sizes {QUICK_SIZES} instead of {SIZES}")
+    parser.add_argument('--sizes', help="comma-separated library sizes, overriding --quick")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', action='append',
+                        help="run only cases in this group (store, search, executor, scheduler, gui); repeatable")
+    parser.add_argument('--output', help="also write the results as JSON to this file")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help="record these results as the baseline")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')] if args.sizes else (QUICK_SIZES if args.quick else SIZES)
+
+    print(f"Python {platform.python_version()} on {platform.platform()}, {os.cpu_count()} CPUs\n")
+    results, skipped = run_suite(sizes, args.repeat, args.only)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'machine': machine(), 'results': results, 'skipped': skipped}, file, indent=4)
+    baseline = load_baseline(args.baseline)
+    if args.update_baseline:
+        update_baseline(args.baseline, results, baseline)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+    if not baseline:
+        print(f"\nNo baseline at {args.baseline}; record one with --update-baseline.")
+        return 0
+    regressions = compare(results, baseline)
+    for name, value, base, limit in regressions:
+        print(f"{name}: {value * 1000:.3f} ms exceeds the limit of {limit * 1000:.3f} ms "
+              f"(baseline {base * 1000:.3f} ms)", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+DEFAULT_CATEGORY = 'Uncategorized'
+SEPARATOR = '/'
+
+
+def category_of(details):
+    return details.get('category') or DEFAULT_CATEGORY
+
+
+def tags_of(details):
+    """Return a command's tags; accepts a list or a comma-separated string."""
+    tags = details.get('tags') or []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    return tuple(dict.fromkeys(tag.strip() for tag in tags if tag.strip()))
+
+
+def ancestors(category):
+    """'a/b/c' -> ['a', 'a/b', 'a/b/c']."""
+    parts = category.split(SEPARATOR)
+    return [SEPARATOR.join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def lift_category(category, removed):
+    """Where category goes when removed is deleted and its children move up one level.
+
+    lift_category('a/b/c', 'a/b') -> 'a/c'; commands directly in removed go
+    to its parent, or to the default category at the top level.
+    """
+    parent = removed.rpartition(SEPARATOR)[0]
+    if category == removed:
+        return parent or DEFAULT_CATEGORY
+    if not category.startswith(removed + SEPARATOR):
+        return category
+    rest = category[len(removed) + 1:]
+    return f"{parent}{SEPARATOR}{rest}" if parent else rest
+
+
+class CategoryIndex:
+    """Category and tag membership of stored commands, kept up to date.
+
+    Categories may be nested as 'parent/child'. Every category keeps the
+    names in its whole subtree, so listing a category or counting it
+    costs O(k) in its size instead of a scan over the library. Names are
+    kept in dicts so they list in insertion order. Register on_change
+    as a CommandStore listener to follow edits.
+    """
+
+    def __init__(self, commands=None):
+        self.entries = {}
+        self.members = {}
+        self.subtree = {}
+        self.tags = {}
+        for name, details in (commands or {}).items():
+            self.add(name, details)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, name, details):
+        if name in self.entries:
+            self.remove(name)
+        category, tags = category_of(details), tags_of(details)
+        self.entries[name] = (category, tags)
+        self.members.setdefault(category, {})[name] = None
+        for path in ancestors(category):
+            self.subtree.setdefault(path, {})[name] = None
+        for tag in tags:
+            self.tags.setdefault(tag, {})[name] = None
+
+    def remove(self, name):
+        entry = self.entries.pop(name, None)
+        if entry is None:
+            return
+        category, tags = entry
+        self._discard(self.members, category, name)
+        for path in ancestors(category):
+            self._discard(self.subtree, path, name)
+        for tag in tags:
+            self._discard(self.tags, tag, name)
+
+    def on_change(self, name, details):
+        """CommandStore listener: reindex or drop a changed command."""
+        if details is None:
+            self.remove(name)
+        else:
+            self.add(name, details)
+
+    def names(self, category, recursive=True):
+        """Names in category, including its subcategories unless recursive is False."""
+        return list((self.subtree if recursive else self.members).get(category, ()))
+
+    def tagged(self, tag):
+        return list(self.tags.get(tag, ()))
+
+    def count(self, category, recursive=True):
+        return len((self.subtree if recursive else self.members).get(category, ()))
+
+    def categories(self):
+        """Every category that holds commands, parents included, sorted so children follow parents."""
+        return sorted(self.subtree, key=lambda path: path.lower().split(SEPARATOR))
+
+    def tag_counts(self):
+        return {tag: len(names) for tag, names in sorted(self.tags.items())}
+
+    @staticmethod
+    def _discard(mapping, key, name):
+        names = mapping.get(key)
+        if names is not None:
+            names.pop(name, None)
+            if not names:
+                del mapping[key]
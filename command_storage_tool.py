@@ -1,15 +1,31 @@
+import startup_profile
+startup_profile.enable_if_requested()
+
 import tkinter as tk
 from tkinter import simpledialog, filedialog, messagebox, ttk
-from command_utils import load_commands, save_commands, get_categories, search_commands
-import subprocess
+from category_index import category_of, lift_category, tags_of
+from command_utils import get_categories, search_commands
+from core import CommandCore
+from output_log import unified_diff
+from remote import resolve_hosts
+from result_cache import cache_keys_of, invalid_cache_keys
+from ui_dispatch import UIDispatcher
+from virtual_list import VirtualListbox
+import sys
 import threading
 import time
-import json
-import schedule
 from gui_utils import show_message
-import base64
-from bs4 import BeautifulSoup  # Ensure this line is included
-import requests
+from import_export import export_file, plan_import
+
+HISTORY_PAGE_SIZE = 5000
+# Search-as-you-type waits this long after the last keystroke.
+SEARCH_DEBOUNCE_MS = 120
+FUZZY_RESULT_LIMIT = 200
+SEARCH_RESULT_LIMIT = 1000
+# How often the library is checked for edits made by other instances.
+LIBRARY_SYNC_MS = 1000
+IMPORT_FILETYPES = [("JSON files", "*.json"), ("NDJSON files", "*.ndjson *.jsonl"),
+                    ("Compressed files", "*.gz"), ("All files", "*")]
 
 class CommandStorageTool(tk.Tk):
     def __init__(self):
@@ -18,19 +34,62 @@ class CommandStorageTool(tk.Tk):
         self.geometry("1350x600")  # Adjusted window size to better fit widgets
         self.style = ttk.Style(self)
         self.style.theme_use('clam')  # Use a modern theme
-        self.commands = load_commands()
-        self.categories = get_categories(self.commands)
+        # The command library is loaded in the background; until then the
+        # buttons that need it stay disabled and a placeholder is shown.
+        self.core = None
+        self.commands = {}
+        self.categories = []
+        self.category_keys = []
+        self.added_categories = []
         self.progress_info = {}
-        self.command_history = []
+        self.library_buttons = []
+        self._online_search = None
 
         self.create_widgets()
-        threading.Thread(target=self.run_schedule, daemon=True).start()
+        startup_profile.mark("widgets created")
+        self.after_idle(startup_profile.mark, "first paint")
+        threading.Thread(target=self.load_library, daemon=True).start()
 
     def create_widgets(self):
         self.create_sidebar()
         self.create_main_frame()
         self.create_search_frame()
-        self.update_category_listbox()
+        self.category_listbox.insert(tk.END, "Loading commands...")
+
+    def load_library(self):
+        try:
+            core = CommandCore()
+            # Build the indexes here rather than on the main thread
+            core.search_index
+            core.category_index
+            core.fuzzy_index.prepare()
+        except Exception as e:
+            self.ui_dispatcher.call(show_message, "Error", f"Failed to load commands: {e}", "error")
+            return
+        self.ui_dispatcher.call(self.on_library_loaded, core)
+
+    def on_library_loaded(self, core):
+        self.core = core
+        self.store = core.store
+        self.commands = core.commands
+        self.category_index = core.category_index
+        self.search_index = core.search_index
+        for button in self.library_buttons:
+            button.state(['!disabled'])
+        self.refresh_categories()
+        self.after(LIBRARY_SYNC_MS, self.sync_library)
+        self.core.scheduler.start(self.execute_command_scheduled)
+        startup_profile.mark("command library loaded")
+        if startup_profile.enabled:
+            print(startup_profile.report(), file=sys.stderr)
+
+    @property
+    def online_search(self):
+        if self._online_search is None:
+            from online_search import OnlineSearchClient
+
+            self._online_search = OnlineSearchClient()
+        return self._online_search
 
     def create_sidebar(self):
         self.sidebar_frame = ttk.Frame(self, padding="10")
@@ -38,15 +97,18 @@ class CommandStorageTool(tk.Tk):
 
         self.category_listbox = tk.Listbox(self.sidebar_frame)
         self.category_listbox.grid(row=0, column=0, padx=10, pady=10, sticky='nsew')
-        self.category_listbox.bind("<<ListboxSelect>>", self.update_command_listbox)
+        self.category_listbox.bind("<<ListboxSelect>>", self.on_category_select)
 
         sidebar_buttons = [("Add Category", self.add_category),
                            ("Delete Category", self.delete_category),
                            ("Export Config", self.export_config),
                            ("Import Config", self.import_config),
-                           ("Command History", self.show_history_window)]
+                           ("Command History", self.show_history_window),
+                           ("Command Stats", self.show_stats_window)]
         for i, (text, command) in enumerate(sidebar_buttons, 1):
-            ttk.Button(self.sidebar_frame, text=text, command=command).grid(row=i, column=0, padx=10, pady=5, sticky='ew')
+            button = ttk.Button(self.sidebar_frame, text=text, command=command, state='disabled')
+            button.grid(row=i, column=0, padx=10, pady=5, sticky='ew')
+            self.library_buttons.append(button)
 
         self.sidebar_frame.grid_rowconfigure(0, weight=1)
         self.sidebar_frame.grid_columnconfigure(0, weight=1)
@@ -58,16 +120,24 @@ class CommandStorageTool(tk.Tk):
         main_buttons = [("Add Command", self.add_command_window),
                         ("Delete Command", self.delete_command),
                         ("Execute Command", self.start_command_thread),
+                        ("Run on Hosts", self.run_on_hosts),
+                        ("Stop Command", self.stop_command),
                         ("Show Progress", self.show_progress_window),
                         ("Clear Output", self.clear_output),
                         ("Exit", self.quit),
                         ("Schedule Command", self.schedule_command_window)]
         for i, (text, command) in enumerate(main_buttons, 1):
-            ttk.Button(self.main_frame, text=text, command=command).pack(fill='x', padx=10, pady=5)
+            button = ttk.Button(self.main_frame, text=text, command=command)
+            button.pack(fill='x', padx=10, pady=5)
+            if command not in (self.show_progress_window, self.clear_output, self.quit):
+                button.state(['disabled'])
+                self.library_buttons.append(button)
 
         self.output_text = tk.Text(self.main_frame, height=10, wrap='word')
         self.output_text.pack(fill='both', padx=10, pady=10, expand=True)
         self.output_text.config(state=tk.DISABLED)
+        self.ui_dispatcher = UIDispatcher(self, self.output_text)
+        self.ui_dispatcher.start()
 
     def create_search_frame(self):
         self.search_frame = ttk.Frame(self, padding="10")
@@ -79,6 +149,7 @@ class CommandStorageTool(tk.Tk):
 
         self.online_search_entry = ttk.Entry(self.online_search_frame)
         self.online_search_entry.grid(row=0, column=0, padx=10, pady=5, sticky='ew')
+        self.online_search_entry.bind("<Return>", lambda event: self.perform_online_search())
         ttk.Button(self.online_search_frame, text="Search Online", command=self.perform_online_search).grid(row=0, column=1, padx=5, pady=5, sticky='ew')
 
         self.online_command_listbox = tk.Listbox(self.online_search_frame)
@@ -94,9 +165,16 @@ class CommandStorageTool(tk.Tk):
 
         self.search_entry = ttk.Entry(self.local_search_frame)
         self.search_entry.grid(row=0, column=0, padx=10, pady=5, sticky='ew')
-        ttk.Button(self.local_search_frame, text="Search Local", command=self.perform_local_search).grid(row=0, column=1, padx=5, pady=5, sticky='ew')
-
-        self.local_command_listbox = tk.Listbox(self.local_search_frame)
+        self.search_entry.bind("<KeyRelease>", self.schedule_fuzzy_search)
+        self.search_after_id = None
+        # Bumped whenever the list is replaced, so late fuzzy results are dropped.
+        self.fuzzy_generation = 0
+        search_button = ttk.Button(self.local_search_frame, text="Search Local", command=self.perform_local_search, state='disabled')
+        search_button.grid(row=0, column=1, padx=5, pady=5, sticky='ew')
+        self.library_buttons.append(search_button)
+
+        self.local_command_listbox = VirtualListbox(self.local_search_frame, formatter=self.format_command_row)
+        self.local_command_listbox.bind("<Double-Button-1>", self.modify_command_window)
         self.local_command_listbox.grid(row=1, column=0, padx=10, pady=10, sticky='nsew', columnspan=2)
 
         self.local_search_frame.grid_rowconfigure(1, weight=1)
@@ -111,12 +189,18 @@ class CommandStorageTool(tk.Tk):
         self.progress_frame = ttk.Frame(self.progress_window, padding="10")
         self.progress_frame.pack(pady=10, fill='both', expand=True)
 
+        self.progress_bars = {}
         for name, info in self.progress_info.items():
-            self.create_progress_bar(name, info)
+            self.update_progress_window(name, info['progress'], info['max'])
+
+        self.ui_dispatcher.add_progress_listener(self.update_progress_window)
+        self.progress_window.bind("<Destroy>", self.close_progress_window)
 
-        self.update_progress_window()
+    def close_progress_window(self, event):
+        if event.widget is self.progress_window:
+            self.ui_dispatcher.remove_progress_listener(self.update_progress_window)
 
-    def create_progress_bar(self, name, info):
+    def create_progress_bar(self, name):
         progress_frame = ttk.Frame(self.progress_frame)
         progress_frame.pack(pady=5, fill='x')
 
@@ -125,40 +209,86 @@ class CommandStorageTool(tk.Tk):
 
         progress_bar = ttk.Progressbar(progress_frame, orient='horizontal', mode='determinate', length=400)
         progress_bar.pack(side='left', padx=10, fill='x', expand=True)
-        percentage_label = ttk.Label(progress_frame, text=f"{int((info['progress'] / info['max']) * 100)}%")
+        percentage_label = ttk.Label(progress_frame)
         percentage_label.pack(side='right')
 
-        progress_bar['maximum'] = info['max']
-        progress_bar['value'] = info['progress']
-        info['progress_bar'] = progress_bar
-        info['percentage_label'] = percentage_label
+        self.progress_bars[name] = (progress_bar, percentage_label)
+        return self.progress_bars[name]
 
-    def update_progress_window(self):
-        for info in self.progress_info.values():
-            progress_bar = info['progress_bar']
-            percentage_label = info['percentage_label']
-            progress_bar['value'] = info['progress']
-            percentage_label.config(text=f"{int((info['progress'] / info['max']) * 100)}%")
-
-        self.progress_window.after(1000, self.update_progress_window)
+    def update_progress_window(self, name, progress, maximum):
+        if name in self.progress_bars:
+            progress_bar, percentage_label = self.progress_bars[name]
+        else:
+            progress_bar, percentage_label = self.create_progress_bar(name)
+        progress_bar['maximum'] = maximum
+        progress_bar['value'] = progress
+        percentage_label.config(text=f"{int((progress / maximum) * 100)}%")
 
     def clear_output(self):
         self.output_text.config(state=tk.NORMAL)
         self.output_text.delete(1.0, tk.END)
         self.output_text.config(state=tk.DISABLED)
 
+    def refresh_categories(self):
+        self.categories = get_categories(self.commands, self.category_index)
+        self.categories += [category for category in self.added_categories
+                            if not self.category_index.count(category)]
+        self.update_category_listbox()
+
     def update_category_listbox(self, event=None):
+        # Subcategories are indented under their parent; tags follow as "#tag".
         self.category_listbox.delete(0, tk.END)
+        self.category_keys = []
         for category in self.categories:
-            self.category_listbox.insert(tk.END, category)
+            depth = category.count('/')
+            label = category.rsplit('/', 1)[-1]
+            self.category_listbox.insert(tk.END, f"{'    ' * depth}{label} ({self.category_index.count(category)})")
+            self.category_keys.append(category)
+        for tag, count in self.category_index.tag_counts().items():
+            self.category_listbox.insert(tk.END, f"#{tag} ({count})")
+            self.category_keys.append('#' + tag)
+
+    def sync_library(self):
+        """Apply edits made by other instances (another window, the CLI) and redraw."""
+        try:
+            if self.store.poll():
+                selected = self.selected_category()
+                self.refresh_categories()
+                if selected in self.category_keys:
+                    index = self.category_keys.index(selected)
+                    self.category_listbox.activate(index)
+                    self.category_listbox.selection_set(index)
+                if self.search_entry.get().strip():
+                    self.perform_fuzzy_search()
+                else:
+                    self.update_command_listbox()
+        finally:
+            self.after(LIBRARY_SYNC_MS, self.sync_library)
+
+    def selected_category(self):
+        index = self.category_listbox.index(tk.ACTIVE)
+        return self.category_keys[index] if 0 <= index < len(self.category_keys) else None
+
+    def on_category_select(self, event=None):
+        self.cancel_fuzzy_search()
+        self.update_command_listbox()
 
     def update_command_listbox(self, event=None, commands=None):
-        self.local_command_listbox.delete(0, tk.END)
-        selected_category = self.category_listbox.get(tk.ACTIVE) if commands is None else None
-        commands = commands or {name: details for name, details in self.commands.items() if details.get('category', 'Uncategorized') == selected_category}
-        for name, details in commands.items():
-            command_info = f"Name: {name}, Command: {details['command']}, Description: {details.get('description', 'No description')}"
-            self.local_command_listbox.insert(tk.END, command_info)
+        if commands is None:
+            key = self.selected_category()
+            if key is None:
+                commands = []
+            elif key.startswith('#'):
+                commands = self.category_index.tagged(key[1:])
+            else:
+                commands = self.category_index.names(key)
+        self.local_command_listbox.set_keys(commands)
+
+    def format_command_row(self, name):
+        details = self.commands.get(name)
+        if details is None:
+            return f"Name: {name}"
+        return f"Name: {name}, Command: {details['command']}, Description: {details.get('description', 'No description')}"
 
     def perform_local_search(self):
         query = self.search_entry.get().strip().lower()
@@ -166,17 +296,48 @@ class CommandStorageTool(tk.Tk):
             show_message("Error", "Search query cannot be empty.", "error")
             return
 
-        search_results = search_commands(self.commands, query)
+        self.cancel_fuzzy_search()
+        search_results = search_commands(self.commands, query, self.search_index, SEARCH_RESULT_LIMIT)
         if not search_results:
             show_message("Search Results", "No commands found matching the query.")
         else:
             self.update_local_command_listbox(commands=search_results)
 
+    def schedule_fuzzy_search(self, event=None):
+        if self.core is None:
+            return
+        if self.search_after_id is not None:
+            self.after_cancel(self.search_after_id)
+        self.search_after_id = self.after(SEARCH_DEBOUNCE_MS, self.perform_fuzzy_search)
+
+    def perform_fuzzy_search(self):
+        self.cancel_fuzzy_search()
+        query = self.search_entry.get().strip()
+        if not query:
+            self.update_command_listbox()
+            return
+        generation = self.fuzzy_generation
+        # Runs on the fuzzy index's worker; a newer query makes this one stale
+        self.core.fuzzy_index.search_async(
+            query,
+            lambda query, names: self.ui_dispatcher.call(self.show_fuzzy_results, generation, names),
+            FUZZY_RESULT_LIMIT)
+
+    def cancel_fuzzy_search(self):
+        """Forget pending search-as-you-type work, including results already posted to the UI."""
+        if self.search_after_id is not None:
+            self.after_cancel(self.search_after_id)
+        self.search_after_id = None
+        self.fuzzy_generation += 1
+        if self.core is not None:
+            self.core.fuzzy_index.cancel()
+
+    def show_fuzzy_results(self, generation, names):
+        if generation == self.fuzzy_generation:
+            self.local_command_listbox.set_keys(names)
+
     def update_local_command_listbox(self, commands):
-        self.local_command_listbox.delete(0, tk.END)
-        for name, details in commands.items():
-            command_info = f"Name: {name}, Command: {details['command']}, Description: {details.get('description', 'No description')}"
-            self.local_command_listbox.insert(tk.END, command_info)
+        self.local_command_listbox.set_keys(commands)
 
     def perform_online_search(self):
         query = self.online_search_entry.get().strip().lower()
@@ -187,40 +348,27 @@ class CommandStorageTool(tk.Tk):
         self.search_online_commands(query)
 
     def search_online_commands(self, query):
-        # Encode the query in base64 format
-        base64_query = base64.urlsafe_b64encode(query.encode()).decode()
+        # Runs on a worker thread; results come back through the UI dispatcher
+        self.online_search.search_async(
+            query,
+            lambda commands: self.ui_dispatcher.call(self.show_online_results, commands),
+            lambda error: self.ui_dispatcher.call(self.show_online_search_error, error))
+
+    def show_online_results(self, commands):
+        if commands:
+            self.display_online_commands(commands)
+        else:
+            show_message("Search Results", "No commands found matching the query on the web.")
 
-        api_url = f"https://www.commandlinefu.com/commands/matching/{query}/{base64_query}/json"
-        try:
-            response = requests.get(api_url)
-            response.raise_for_status()  # Raise an exception for HTTP errors
+    def show_online_search_error(self, error):
+        import requests
 
-            if 'application/json' in response.headers.get('Content-Type', ''):
-                commands = response.json()
-                if commands:
-                    self.display_online_commands(commands)
-                else:
-                    show_message("Search Results", "No commands found matching the query on the web.")
-            else:
-                # Handle HTML response
-                soup = BeautifulSoup(response.text, 'html.parser')
-                command_elements = soup.find_all('div', class_='command')
-                commands = []
-                for elem in command_elements:
-                    command_text_elem = elem.find('pre', class_='command')
-                    summary_text_elem = elem.find('div', class_='description')
-                    if command_text_elem and summary_text_elem:
-                        command_text = command_text_elem.text.strip()
-                        summary_text = summary_text_elem.text.strip()
-                        commands.append({'command': command_text, 'summary': summary_text})
-                if commands:
-                    self.display_online_commands(commands)
-                else:
-                    show_message("Search Results", "No commands found matching the query on the web.")
-        except requests.exceptions.RequestException as e:
-            show_message("Error", f"Failed to fetch commands: {e}", "error")
-        except ValueError:
+        if isinstance(error, requests.exceptions.RequestException):
+            show_message("Error", f"Failed to fetch commands: {error}", "error")
+        elif isinstance(error, ValueError):
             show_message("Error", "Invalid JSON response received.", "error")
+        else:
+            show_message("Error", f"Online search failed: {error}", "error")
 
     def display_online_commands(self, commands):
         self.online_command_listbox.delete(0, tk.END)
@@ -234,7 +382,8 @@ class CommandStorageTool(tk.Tk):
             show_message("Error", "Search query cannot be empty.", "error")
             return
 
-        local_search_results = search_commands(self.commands, query)
+        self.cancel_fuzzy_search()
+        local_search_results = search_commands(self.commands, query, self.search_index, SEARCH_RESULT_LIMIT)
         if local_search_results:
             self.update_command_listbox(commands=local_search_results)
         else:
@@ -245,23 +394,35 @@ class CommandStorageTool(tk.Tk):
         if not category or category in self.categories:
             show_message("Error", "Invalid or duplicate category name.", "error")
             return
-        self.categories.append(category)
-        self.update_category_listbox()
+        self.added_categories.append(category)
+        self.refresh_categories()
         show_message("Success", f"Category '{category}' added successfully!")
 
     def delete_category(self):
-        selected_category = self.category_listbox.get(tk.ACTIVE)
+        selected_category = self.selected_category()
         if not selected_category or selected_category == 'Uncategorized':
             show_message("Error", "Invalid category selection.", "error")
             return
 
-        if messagebox.askyesno("Delete Category", f"Are you sure you want to delete the category '{selected_category}' and move its commands to 'Uncategorized'?"):
-            for name, details in self.commands.items():
-                if details.get('category', 'Uncategorized') == selected_category:
-                    self.commands[name]['category'] = 'Uncategorized'
-            self.categories.remove(selected_category)
-            save_commands(self.commands)
-            self.update_category_listbox()
+        if selected_category.startswith('#'):
+            tag = selected_category[1:]
+            if messagebox.askyesno("Delete Tag", f"Are you sure you want to remove the tag '{tag}' from its commands?"):
+                untagged = {name: dict(self.commands[name], tags=[other for other in tags_of(self.commands[name]) if other != tag])
+                            for name in self.category_index.tagged(tag)}
+                self.store.batch(puts=untagged)
+                self.refresh_categories()
+                self.update_command_listbox()
+            return
+
+        # Commands in the category and its subcategories move up one level.
+        parent = lift_category(selected_category, selected_category)
+        if messagebox.askyesno("Delete Category", f"Are you sure you want to delete the category '{selected_category}' and move its commands to '{parent}' and its subcategories up one level?"):
+            moved = {name: dict(self.commands[name], category=lift_category(category_of(self.commands[name]), selected_category))
+                     for name in self.category_index.names(selected_category)}
+            self.store.batch(puts=moved)
+            self.added_categories = [lift_category(category, selected_category)
+                                     for category in self.added_categories if category != selected_category]
+            self.refresh_categories()
             self.update_command_listbox()
             show_message("Success", f"Category '{selected_category}' deleted successfully!")
 
@@ -269,17 +430,16 @@ class CommandStorageTool(tk.Tk):
         self.command_window("Add Command", self.add_command)
 
     def modify_command_window(self, event):
-        selected_command = self.command_listbox.get(tk.ACTIVE)
-        if not selected_command:
+        name = self.local_command_listbox.selected_key()
+        if not name:
             return
-        name = selected_command.split(",")[0].split(":")[1].strip()
         if name in self.commands:
             self.command_window("Modify Command", lambda: self.modify_command(name), name)
 
     def command_window(self, title, save_command, name=""):
         self.add_command_frame = tk.Toplevel(self)
         self.add_command_frame.title(title)
-        self.add_command_frame.geometry("300x400")
+        self.add_command_frame.geometry("300x630")
 
         tk.Label(self.add_command_frame, text="Name:").pack(pady=5)
         self.command_name_entry = tk.Entry(self.add_command_frame)
@@ -297,20 +457,36 @@ class CommandStorageTool(tk.Tk):
         tk.Label(self.add_command_frame, text="Category:").pack(pady=5)
         self.command_category_combobox = ttk.Combobox(self.add_command_frame, values=self.categories)
         self.command_category_combobox.pack(pady=5)
+        tk.Label(self.add_command_frame, text="Tags (comma separated):").pack(pady=5)
+        self.command_tags_entry = tk.Entry(self.add_command_frame)
+        self.command_tags_entry.pack(pady=5)
         tk.Label(self.add_command_frame, text="Interval (seconds):").pack(pady=5)
         self.command_interval_entry = tk.Entry(self.add_command_frame)
         self.command_interval_entry.pack(pady=5)
         tk.Label(self.add_command_frame, text="Count:").pack(pady=5)
         self.command_count_entry = tk.Entry(self.add_command_frame)
         self.command_count_entry.pack(pady=5)
+        tk.Label(self.add_command_frame, text="Timeout (seconds, 0 = none):").pack(pady=5)
+        self.command_timeout_entry = tk.Entry(self.add_command_frame)
+        self.command_timeout_entry.pack(pady=5)
+        tk.Label(self.add_command_frame, text="Cache results for (seconds, 0 = never):").pack(pady=5)
+        self.command_cache_ttl_entry = tk.Entry(self.add_command_frame)
+        self.command_cache_ttl_entry.pack(pady=5)
+        tk.Label(self.add_command_frame, text="Cache keys (file:PATH, env:NAME):").pack(pady=5)
+        self.command_cache_keys_entry = tk.Entry(self.add_command_frame)
+        self.command_cache_keys_entry.pack(pady=5)
 
         if name:
             details = self.commands[name]
             self.command_entry.insert(0, details['command'])
             self.command_description_entry.insert(0, details.get('description', ''))
             self.command_category_combobox.set(details.get('category', 'Uncategorized'))
+            self.command_tags_entry.insert(0, ", ".join(tags_of(details)))
             self.command_interval_entry.insert(0, details.get('interval', 0))
             self.command_count_entry.insert(0, details.get('count', 1))
+            self.command_timeout_entry.insert(0, details.get('timeout', 0))
+            self.command_cache_ttl_entry.insert(0, details.get('cache_ttl', 0))
+            self.command_cache_keys_entry.insert(0, ", ".join(cache_keys_of(details)))
 
         tk.Button(self.add_command_frame, text="Save", command=save_command).pack(pady=5)
         tk.Button(self.add_command_frame, text="Cancel", command=self.add_command_frame.destroy).pack(pady=5)
@@ -325,129 +501,295 @@ class CommandStorageTool(tk.Tk):
         name = self.command_name_entry.get().strip()
         command = self.command_entry.get().strip()
         description = self.command_description_entry.get().strip()
-        category = self.command_category_combobox.get().strip() or 'Uncategorized'
+        category = self.command_category_combobox.get().strip().strip('/') or 'Uncategorized'
+        tags = list(tags_of({'tags': self.command_tags_entry.get()}))
         interval = self.command_interval_entry.get().strip()
         count = self.command_count_entry.get().strip()
+        timeout = self.command_timeout_entry.get().strip() or '0'
+        cache_ttl = self.command_cache_ttl_entry.get().strip() or '0'
+        cache_keys = list(cache_keys_of({'cache_keys': self.command_cache_keys_entry.get()}))
 
-        if not name or not command or not interval.isdigit() or not count.isdigit():
+        if (not name or not command or not interval.isdigit() or not count.isdigit() or not timeout.isdigit()
+                or not cache_ttl.isdigit()):
             show_message("Error", "Invalid input values.", "error")
             return
+        if invalid_cache_keys(cache_keys):
+            show_message("Error", f"Invalid cache keys: {', '.join(invalid_cache_keys(cache_keys))}", "error")
+            return
 
-        if original_name:
-            self.commands.pop(original_name)
-        elif name in self.commands:
+        if not original_name and name in self.commands:
             show_message("Error", "A command with this name already exists.", "error")
             return
 
-        self.commands[name] = {
+        details = {
             "command": command, 
             "description": description, 
             "category": category,
             "interval": int(interval),
-            "count": int(count)
+            "count": int(count),
+            "timeout": int(timeout)
         }
-        save_commands(self.commands)
+        if tags:
+            details["tags"] = tags
+        if int(cache_ttl):
+            details["cache_ttl"] = int(cache_ttl)
+            if cache_keys:
+                details["cache_keys"] = cache_keys
+        renamed = [original_name] if original_name and original_name != name else []
+        self.store.batch(puts={name: details}, deletes=renamed)
+        self.refresh_categories()
         self.update_command_listbox()
         self.add_command_frame.destroy()
         show_message("Success", f"Command '{name}' saved successfully!")
 
     def delete_command(self):
-        selected_command = self.command_listbox.get(tk.ACTIVE)
-        if not selected_command:
+        name = self.local_command_listbox.selected_key()
+        if not name:
             return
-        name = selected_command.split(",")[0].split(":")[1].strip()
         if name in self.commands:
-            del self.commands[name]
-            save_commands(self.commands)
+            self.store.delete(name)
+            # The command may have been the last one in its category.
+            self.refresh_categories()
             self.update_command_listbox()
             show_message("Success", f"Command '{name}' deleted successfully!")
         else:
             show_message("Error", "No command found with that name.", "error")
 
     def start_command_thread(self):
-        selected_command = self.command_listbox.get(tk.ACTIVE)
-        if not selected_command:
+        name = self.local_command_listbox.selected_key()
+        if not name:
             show_message("Error", "Please select a command to execute.", "error")
             return
-        name = selected_command.split(",")[0].split(":")[1].strip()
         if name in self.commands:
-            threading.Thread(target=self.execute_command, args=(name,)).start()
+            self.execute_command(name)
         else:
             show_message("Error", "No command found with that name.", "error")
 
+    def stop_command(self):
+        name = self.local_command_listbox.selected_key()
+        if not name:
+            show_message("Error", "Please select a command to stop.", "error")
+            return
+        self.core.executor.cancel_command(name)
+
     def execute_command(self, name):
         command = self.commands[name]
         interval, count = command.get("interval", 0), command.get("count", 1)
-        self.output_text.config(state=tk.NORMAL)
-        self.progress_info[name] = {'progress': 0, 'max': count, 'output': []}
+        self.progress_info[name] = {'progress': 0, 'max': count, 'output': ''}
+        self.ui_dispatcher.post_progress(name, 0, count)
+        return self.core.run(name,
+                             on_start=self.on_command_start,
+                             on_line=self.on_command_line,
+                             on_output=self.on_command_output,
+                             on_done=self.on_command_done)
+
+    def run_on_hosts(self):
+        name = self.local_command_listbox.selected_key()
+        if not name or name not in self.commands:
+            show_message("Error", "Please select a command to run.", "error")
+            return
+        targets = simpledialog.askstring("Run on Hosts", "Hosts or groups from hosts.json ('all' for every host):")
+        if not targets or not targets.split():
+            return
+        label = f"{name} @ {targets.strip()}"
+        hosts = resolve_hosts(self.core.remote.inventory(), targets.split())
+        if not hosts:
+            show_message("Error", "No hosts matched.", "error")
+            return
+        # Registered before any host can finish and report progress.
+        self.progress_info[label] = {'progress': 0, 'max': len(hosts), 'output': ''}
+        self.ui_dispatcher.post_progress(label, 0, len(hosts))
 
-        for i in range(count):
-            try:
-                result = subprocess.run(command["command"], shell=True, capture_output=True, text=True)
-                output = result.stdout if result.stdout else result.stderr
-            except Exception as e:
-                output = str(e)
-            
-            self.output_text.insert(tk.END, f"Execution {i+1}/{count}:\n{output}\n")
-            self.output_text.see(tk.END)
-            self.progress_info[name]['progress'] = i + 1
-            self.progress_info[name]['output'].append(output)
-            time.sleep(interval)
-
-        self.progress_info[name]['progress'] = count
-        self.output_text.config(state=tk.DISABLED)
+        def on_line(run, text, stream_name):
+            host = run.name[len(name) + 1:]
+            self.ui_dispatcher.post_output("".join(f"{host}: {line}" for line in text.splitlines(True)))
+
+        def on_host_done(fan_out, host, run):
+            self.ui_dispatcher.post_output(f"{host}: exit {run.returncode}\n")
+            self.progress_info[label]['progress'] = fan_out.finished
+            self.ui_dispatcher.post_progress(label, fan_out.finished, len(fan_out.hosts))
+
+        self.core.remote.run(name, hosts, on_host_done, on_line=on_line)
+
+    def on_command_start(self, run):
+        self.ui_dispatcher.post_output(f"Execution {run.iteration + 1}/{run.count}:\n")
+
+    def on_command_line(self, run, line, stream_name):
+        if stream_name == 'cache':
+            self.ui_dispatcher.post_output(f"(cached result from {run.cache_age:.0f}s ago)\n")
+        self.ui_dispatcher.post_output(line)
 
-        # Store command execution result in history
-        self.command_history.append({
-            'name': name,
-            'command': command['command'],
-            'output': self.progress_info[name]['output'],
-            'timestamp': time.strftime("%Y-%m-%d %H:%M:%S")
-        })
+    def on_command_output(self, run, output):
+        self.ui_dispatcher.post_output("\n")
+        self.progress_info[run.name]['progress'] = run.iteration
+        # Only the latest output is kept; every iteration is in run.outputs and history.
+        self.progress_info[run.name]['output'] = output
+        self.ui_dispatcher.post_progress(run.name, run.iteration, run.count)
+
+    def on_command_done(self, run):
+        self.progress_info[run.name]['progress'] = run.count
+        self.ui_dispatcher.post_progress(run.name, run.count, run.count)
 
     def show_history_window(self):
         self.history_window = tk.Toplevel(self)
         self.history_window.title("Command History")
         self.history_window.geometry("600x400")
 
-        self.history_listbox = tk.Listbox(self.history_window)
+        nav_frame = ttk.Frame(self.history_window)
+        nav_frame.pack(side='bottom', fill='x')
+        ttk.Button(nav_frame, text="Newer", command=lambda: self.load_history_page(self.history_page - 1)).pack(side='left', padx=5, pady=5)
+        ttk.Button(nav_frame, text="Older", command=lambda: self.load_history_page(self.history_page + 1)).pack(side='right', padx=5, pady=5)
+        self.history_page_label = ttk.Label(nav_frame)
+        self.history_page_label.pack(pady=5)
+
+        self.history_listbox = VirtualListbox(self.history_window, formatter=self.format_history_row)
         self.history_listbox.pack(fill='both', expand=True)
         self.history_listbox.bind("<<ListboxSelect>>", self.show_history_details)
 
-        for entry in self.command_history:
-            self.history_listbox.insert(tk.END, f"{entry['timestamp']} - {entry['name']}")
+        self.load_history_page(0)
+
+    def load_history_page(self, page):
+        pages = max(1, -(-self.core.history.count() // HISTORY_PAGE_SIZE))
+        self.history_page = min(max(page, 0), pages - 1)
+        runs = self.core.history.list_runs(self.history_page * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE)
+        self.history_runs = {entry['id']: entry for entry in runs}
+        self.history_page_label.config(text=f"Page {self.history_page + 1}/{pages}")
+        self.history_listbox.set_keys(self.history_runs)
+
+    def format_history_row(self, run_id):
+        entry = self.history_runs[run_id]
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry['timestamp']))
+        cached = f", {entry['cached']}/{entry['iterations']} cached" if entry['cached'] else ""
+        return f"{timestamp} - {entry['name']} (exit {entry['exit_code']}{cached})"
 
     def show_history_details(self, event):
-        selected_index = self.history_listbox.curselection()
-        if not selected_index:
+        run_id = self.history_listbox.selected_key()
+        if run_id is None:
             return
-        selected_entry = self.command_history[selected_index[0]]
-        details = f"Name: {selected_entry['name']}\nCommand: {selected_entry['command']}\nTimestamp: {selected_entry['timestamp']}\n\nOutput:\n"
-        details += "\n".join(selected_entry['output'])
+        selected_entry = self.core.history.get_run(run_id)
+        if selected_entry is None:
+            return
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(selected_entry['timestamp']))
+        details = f"Name: {selected_entry['name']}\nCommand: {selected_entry['command']}\nTimestamp: {timestamp}\nExit code: {selected_entry['exit_code']}\n"
+        if selected_entry['cached']:
+            details += f"Answered from the result cache: {selected_entry['cached']} of {selected_entry['iterations']} iterations\n"
+        details += "\nOutput:\n"
 
         self.history_details_window = tk.Toplevel(self.history_window)
         self.history_details_window.title("Command History Details")
         self.history_details_window.geometry("600x400")
 
-        history_details_text = tk.Text(self.history_details_window, wrap='word')
+        ttk.Button(self.history_details_window, text="Compare with Previous Run",
+                   command=lambda: self.show_run_diff(run_id)).pack(side='bottom', pady=5)
+        history_details_text = self.create_diff_text(self.history_details_window)
         history_details_text.insert(tk.END, details)
+        # Later iterations are shown as changes against the one before.
+        outputs = selected_entry['output']
+        for iteration, output in enumerate(outputs):
+            if iteration == 0:
+                history_details_text.insert(tk.END, output)
+                continue
+            history_details_text.insert(tk.END, f"\nIteration {iteration + 1}:\n", 'header')
+            diff = unified_diff(outputs[iteration - 1], output, f"iteration {iteration}", f"iteration {iteration + 1}")
+            self.insert_diff(history_details_text, diff or "(unchanged)\n")
         history_details_text.config(state=tk.DISABLED)
-        history_details_text.pack(fill='both', expand=True)
 
-    def schedule_command(self, name, time_str):
-        command = self.commands[name]
-        schedule.every().day.at(time_str).do(self.execute_command_scheduled, name)
-        show_message("Success", f"Command '{name}' scheduled at {time_str}")
+    def show_run_diff(self, run_id):
+        previous_id = self.core.history.previous_run(run_id)
+        if previous_id is None:
+            show_message("Compare Runs", "There is no earlier run of this command.")
+            return
+        current, previous = self.core.history.get_run(run_id), self.core.history.get_run(previous_id)
+        label = lambda run: time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run['timestamp']))
+        diff = unified_diff("".join(previous['output']), "".join(current['output']), label(previous), label(current))
+
+        diff_window = tk.Toplevel(self.history_details_window)
+        diff_window.title(f"Changes in {current['name']}")
+        diff_window.geometry("600x400")
+        diff_text = self.create_diff_text(diff_window)
+        self.insert_diff(diff_text, diff or "The output did not change.\n")
+        diff_text.config(state=tk.DISABLED)
+
+    def create_diff_text(self, parent):
+        text = tk.Text(parent, wrap='word')
+        text.tag_configure('added', foreground='dark green')
+        text.tag_configure('removed', foreground='red')
+        text.tag_configure('header', foreground='blue')
+        text.pack(fill='both', expand=True)
+        return text
+
+    def insert_diff(self, text, diff):
+        for line in diff.splitlines(True):
+            if line.startswith(('+++', '---', '@@')):
+                tag = 'header'
+            else:
+                tag = {'+': 'added', '-': 'removed'}.get(line[:1])
+            text.insert(tk.END, line, tag)
+
+    def show_stats_window(self):
+        import metrics
+
+        runs = self.core.history.metrics()
+        self.stats_runs = runs
+        self.stats_window = tk.Toplevel(self)
+        self.stats_window.title("Command Stats")
+        self.stats_window.geometry("700x400")
+
+        button_frame = ttk.Frame(self.stats_window)
+        button_frame.pack(side='bottom', fill='x')
+        ttk.Button(button_frame, text="Export Prometheus", command=self.export_stats).pack(side='right', padx=5, pady=5)
+
+        columns = ('runs', 'failed', 'p50', 'p95', 'cpu', 'max_rss')
+        tree = ttk.Treeview(self.stats_window, columns=columns)
+        tree.heading('#0', text="Command / Day")
+        for column, title in zip(columns, ("Runs", "Failed", "p50", "p95", "CPU", "Max RSS")):
+            tree.heading(column, text=title)
+            tree.column(column, width=70, anchor='e')
+        scrollbar = ttk.Scrollbar(self.stats_window, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        tree.pack(fill='both', expand=True)
+
+        stats = metrics.command_stats(runs)
+        by_command = {}
+        for run in runs:
+            by_command.setdefault(run['name'], []).append(run)
+        for name, entry in sorted(stats.items(), key=lambda item: -item[1]['total_duration']):
+            parent = tree.insert('', 'end', text=name, values=(
+                entry['runs'], entry['failures'], metrics.format_seconds(entry['p50']),
+                metrics.format_seconds(entry['p95']), metrics.format_seconds(entry['cpu']),
+                metrics.format_rss(entry['max_rss'])))
+            # The per-day rows show how a command's run time trends.
+            for day, count, p50, p95 in metrics.daily_trend(by_command[name]):
+                tree.insert(parent, 'end', text=day, values=(
+                    count, '', metrics.format_seconds(p50), metrics.format_seconds(p95), '', ''))
+
+    def export_stats(self):
+        import metrics
+
+        file_path = filedialog.asksaveasfilename(defaultextension=".prom", filetypes=[("Prometheus text", "*.prom")])
+        if file_path:
+            with open(file_path, 'w') as file:
+                file.write(metrics.prometheus_text(self.stats_runs))
+            show_message("Success", "Stats exported successfully.")
+
+    def schedule_command(self, name, spec):
+        try:
+            self.core.scheduler.add_job(name, spec)
+        except ValueError as e:
+            show_message("Error", f"Invalid schedule: {e}", "error")
+            return
+        show_message("Success", f"Command '{name}' scheduled: {spec}")
 
     def execute_command_scheduled(self, name):
-        threading.Thread(target=self.execute_command, args=(name,)).start()
+        if name in self.commands:
+            self.execute_command(name)
 
     def schedule_command_window(self):
-        selected_command = self.command_listbox.get(tk.ACTIVE)
-        if not selected_command:
+        name = self.local_command_listbox.selected_key()
+        if not name:
             show_message("Error", "Please select a command to schedule.", "error")
             return
-        name = selected_command.split(",")[0].split(":")[1].strip()
         if name not in self.commands:
             show_message("Error", "No command found with that name.", "error")
             return
@@ -456,7 +798,7 @@ class CommandStorageTool(tk.Tk):
         self.schedule_command_frame.title("Schedule Command")
         self.schedule_command_frame.geometry("300x200")
 
-        tk.Label(self.schedule_command_frame, text="Time (HH:MM):").pack(pady=5)
+        tk.Label(self.schedule_command_frame, text="Time (HH:MM), interval (e.g. 15m)\nor cron expression:").pack(pady=5)
         self.schedule_time_entry = tk.Entry(self.schedule_command_frame)
         self.schedule_time_entry.pack(pady=5)
 
@@ -465,35 +807,47 @@ class CommandStorageTool(tk.Tk):
         tk.Button(self.schedule_command_frame, text="Cancel", 
                   command=self.schedule_command_frame.destroy).pack(pady=5)
 
-    def run_schedule(self):
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
-
     def export_config(self):
-        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=IMPORT_FILETYPES[:3])
         if file_path:
             try:
-                with open(file_path, "w") as file:
-                    json.dump(self.commands, file, indent=4)
-                show_message("Success", f"Configuration exported to {file_path}")
+                count = export_file(self.commands, file_path)
+                show_message("Success", f"{count} commands exported to {file_path}")
             except Exception as e:
                 show_message("Error", f"Failed to export configuration: {e}", "error")
 
     def import_config(self):
-        file_path = filedialog.askopenfilename(filetypes=[("JSON files", "*.json")])
-        if file_path:
+        file_path = filedialog.askopenfilename(filetypes=IMPORT_FILETYPES)
+        if not file_path:
+            return
+        overwrite = messagebox.askyesnocancel(
+            "Import", "Overwrite commands that already exist?\n\n"
+                      "Yes: overwrite them. No: keep both, renaming the imported ones.")
+        if overwrite is None:
+            return
+        on_conflict = 'overwrite' if overwrite else 'rename'
+
+        def work():
+            # Reading and validating happen here; the store is only changed
+            # on the UI thread, where the indexes are read.
             try:
-                with open(file_path, "r") as file:
-                    imported_commands = json.load(file)
-                self.commands.update(imported_commands)
-                self.categories = get_categories(self.commands)
-                self.update_category_listbox()
-                self.update_command_listbox()
-                save_commands(self.commands)
-                show_message("Success", f"Configuration imported from {file_path}")
+                puts, report = plan_import(self.commands, file_path, on_conflict=on_conflict)
             except Exception as e:
-                show_message("Error", f"Failed to import configuration: {e}", "error")
+                self.ui_dispatcher.call(show_message, "Error", f"Failed to import configuration: {e}", "error")
+                return
+            self.ui_dispatcher.call(self.finish_import, file_path, puts, report)
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def finish_import(self, file_path, puts, report):
+        if puts:
+            self.store.batch(puts=puts)
+            self.refresh_categories()
+            self.update_command_listbox()
+        message = f"Imported {file_path}: {report}"
+        if report.errors:
+            message += "\n\n" + "\n".join(report.errors[:5])
+        show_message("Success" if not report.invalid else "Import", message)
 
 if __name__ == "__main__":
     app = CommandStorageTool()
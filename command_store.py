@@ -0,0 +1,327 @@
+import json
+import os
+import threading
+
+from command_utils import load_commands, save_commands
+
+try:
+    import fcntl
+except ImportError:  # Windows: instances are not coordinated
+    fcntl = None
+
+
+class FileLock:
+    """A reentrant, exclusive flock() on a lock file; a no-op where fcntl is missing.
+
+    flock() is held per open file, so threads sharing one FileLock must
+    also share a thread lock around it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.depth = 0
+
+    def acquire(self, blocking=True):
+        if fcntl is None:
+            return True
+        if self.depth == 0:
+            if self.file is None:
+                self.file = open(self.path, 'a')
+            try:
+                fcntl.flock(self.file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return False
+        self.depth += 1
+        return True
+
+    def release(self):
+        if fcntl is None:
+            return
+        self.depth -= 1
+        if self.depth == 0:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def apply_record(commands, record):
+    """Apply a journal record to commands and return the (name, details) changes."""
+    if record["op"] == "batch":
+        return [change for sub_record in record["records"] for change in apply_record(commands, sub_record)]
+    if record["op"] == "generation":
+        return []
+    name = record["name"]
+    if record["op"] == "put":
+        commands[name] = record["details"]
+        return [(name, record["details"])]
+    commands.pop(name, None)
+    return [(name, None)]
+
+
+def complete_records(lines):
+    """Yield (record, length) for lines up to the first incomplete or unreadable one."""
+    for line in lines:
+        if not line.endswith(b"\n"):
+            return
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return
+        yield record, len(line)
+
+
+class CommandStore:
+    """Command library kept as a JSON snapshot plus an append-only journal.
+
+    commands.json stays the snapshot in its existing format, so a library
+    written by older versions is picked up as-is. Every mutation is
+    appended to commands.json.journal as one JSON line and fsynced, which
+    keeps a single edit constant-time. Once the journal outgrows the
+    library it is folded back into the snapshot on a background thread.
+
+    Several processes may share one library. Appends happen under an
+    flock() on commands.json.lock after reading whatever the others
+    appended, so no edit is lost. poll() applies the records other
+    processes wrote since the last call, starting from the offset read so
+    far, and notifies the listeners; it costs one stat() when nothing
+    changed. When a compaction moves the journal aside, the old file is
+    still read through its open handle before switching to the new one.
+    Every journal a compaction starts begins with its generation number;
+    a reader that finds it skipped a generation reloads the snapshot.
+    """
+
+    def __init__(self, path='commands.json', compact_threshold=1000):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.compacting_path = self.journal_path + '.compacting'
+        self.compact_threshold = compact_threshold
+        self.commands = {}
+        self.listeners = []
+        self.lock = threading.RLock()
+        self.write_lock = FileLock(path + '.lock')
+        # Held for a whole compaction, so only one process compacts at a
+        # time; a crashed compactor releases it with its process.
+        self.compact_lock = FileLock(path + '.compact.lock')
+        self.journal = None
+        self.reader = None
+        self.journal_records = 0
+        self.generation = 0
+        # Changes read by the compactor thread, passed to the listeners by
+        # the next poll() or edit instead of from that thread.
+        self.deferring = False
+        self.deferred = []
+        self.compactor = None
+        self.load()
+
+    def load(self):
+        """Rebuild the library from the snapshot and any journal records."""
+        with self.lock, self.write_lock:
+            self._close_journal()
+            self.commands.clear()
+            self.commands.update(load_commands(self.path))
+            # A journal left behind by an interrupted compaction is replayed
+            # first; records are idempotent puts and deletes, so replaying
+            # ones that already reached the snapshot is harmless.
+            try:
+                with open(self.compacting_path, 'rb') as compacting:
+                    self._read_records(compacting, notify=False)
+            except FileNotFoundError:
+                pass
+            self._open_journal()
+            self.generation = 0
+            self.journal_records = self._read_records(self.reader, notify=False)
+            # Cut off a torn last write.
+            if os.fstat(self.reader.fileno()).st_size > self.reader.tell():
+                os.truncate(self.journal_path, self.reader.tell())
+        if os.path.exists(self.compacting_path):
+            self.compact()
+
+    def add_listener(self, listener):
+        """Call listener(name, details) after each change; details is None on delete."""
+        self.listeners.append(listener)
+
+    def poll(self):
+        """Apply the changes other processes made since the last call; returns how many."""
+        with self.lock:
+            return self._flush_deferred() + self._catch_up()
+
+    def put(self, name, details):
+        self._append({"op": "put", "name": name, "details": dict(details)})
+
+    def delete(self, name):
+        if name in self.commands:
+            self._append({"op": "delete", "name": name})
+
+    def batch(self, puts=None, deletes=()):
+        """Apply several puts and deletes as a single journal record."""
+        records = [{"op": "delete", "name": name} for name in deletes if name in self.commands]
+        records += [{"op": "put", "name": name, "details": dict(details)}
+                    for name, details in (puts or {}).items()]
+        if records:
+            self._append({"op": "batch", "records": records})
+
+    def compact(self, wait=False):
+        """Fold the journal into the snapshot on a background thread."""
+        with self.lock:
+            if self.compactor is None or not self.compactor.is_alive():
+                self.compactor = threading.Thread(target=self._compact, daemon=True)
+                self.compactor.start()
+            compactor = self.compactor
+        if wait:
+            compactor.join()
+
+    def close(self):
+        if self.compactor:
+            self.compactor.join()
+        with self.lock:
+            self._close_journal()
+            self.write_lock.close()
+            self.compact_lock.close()
+
+    def _append(self, record):
+        line = json.dumps(record) + "\n"
+        with self.lock, self.write_lock:
+            self._flush_deferred()
+            self._catch_up()
+            self.journal.write(line)
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            # The reader was at the end before this write, under the lock.
+            self.reader.seek(0, os.SEEK_END)
+            self.journal_records += 1
+            self._apply(record)
+            if self.journal_records > max(self.compact_threshold, len(self.commands)):
+                self.compact()
+
+    def _catch_up(self):
+        """Apply new journal records, following a compaction to the new journal."""
+        count = self._read_records(self.reader)
+        try:
+            current = os.stat(self.journal_path)
+        except FileNotFoundError:
+            # Another process is between moving the journal and reopening it.
+            self.journal_records += count
+            return count
+        opened = os.fstat(self.reader.fileno())
+        if current.st_ino == opened.st_ino and current.st_size >= self.reader.tell():
+            self.journal_records += count
+            return count
+        if current.st_ino != opened.st_ino:
+            # Compacted: the old journal was final when it was moved, but
+            # may have grown since it was last read.
+            count += self._read_records(self.reader)
+            generation = self.generation
+            self._close_journal()
+            self._open_journal()
+            self.generation = 0
+            records = self._read_records(self.reader)
+            if self.generation == generation + 1:
+                self.journal_records = records
+                return count + records
+        # The journal was compacted more than once, or truncated, since it
+        # was last read; the journals in between only live on in the
+        # snapshot, so reload it and notify about what differs.
+        return count + self._reload()
+
+    def _reload(self):
+        previous = dict(self.commands)
+        self.load()
+        changes = [(name, self.commands.get(name)) for name in previous.keys() | self.commands.keys()
+                   if self.commands.get(name) != previous.get(name)]
+        self._notify(changes)
+        return len(changes)
+
+    def _read_records(self, journal, notify=True):
+        """Apply the complete records from journal's position on and return how many.
+
+        The position is left before the first incomplete or unreadable
+        line, which a writer may still be appending.
+        """
+        count = 0
+        offset = journal.tell()
+        for record, length in complete_records(journal):
+            offset += length
+            if record["op"] == "generation":
+                if journal is self.reader:
+                    self.generation = record["n"]
+                continue
+            self._apply(record, notify)
+            count += 1
+        journal.seek(offset)
+        return count
+
+    def _apply(self, record, notify=True):
+        changes = apply_record(self.commands, record)
+        if notify:
+            self._notify(changes)
+
+    def _notify(self, changes):
+        if self.deferring:
+            self.deferred.extend(changes)
+            return
+        for name, details in changes:
+            for listener in self.listeners:
+                listener(name, details)
+
+    def _flush_deferred(self):
+        changes, self.deferred = self.deferred, []
+        self._notify(changes)
+        return len(changes)
+
+    def _open_journal(self):
+        self.journal = open(self.journal_path, 'a')
+        self.reader = open(self.journal_path, 'rb')
+
+    def _close_journal(self):
+        for journal in (self.journal, self.reader):
+            if journal:
+                journal.close()
+        self.journal = self.reader = None
+
+    def _compact(self):
+        if not self.compact_lock.acquire(blocking=False):
+            return  # another instance is compacting
+        try:
+            with self.lock, self.write_lock:
+                # Read everything up to the current journal, which may be one
+                # another instance started, so the snapshot holds every
+                # record of the journal moved aside below. Listeners hear of
+                # the records read here from the next poll(), on the
+                # caller's thread.
+                self.deferring = True
+                try:
+                    self._catch_up()
+                finally:
+                    self.deferring = False
+                snapshot = dict(self.commands)
+                if not os.path.exists(self.compacting_path):
+                    # The new journal appears with its generation header,
+                    # so no reader ever sees it without one.
+                    new_path = self.journal_path + '.new'
+                    with open(new_path, 'w') as journal:
+                        journal.write(json.dumps({"op": "generation", "n": self.generation + 1}) + "\n")
+                        journal.flush()
+                        os.fsync(journal.fileno())
+                    self._close_journal()
+                    os.replace(self.journal_path, self.compacting_path)
+                    os.replace(new_path, self.journal_path)
+                    self._open_journal()
+                    self.journal_records = self._read_records(self.reader)
+            save_commands(snapshot, self.path)
+            # A process loading right now reads the snapshot and then this
+            # journal; the lock keeps it from disappearing in between.
+            with self.lock, self.write_lock:
+                os.remove(self.compacting_path)
+        finally:
+            self.compact_lock.release()
@@ -1,25 +1,45 @@
 import json
+import os
 
-def load_commands():
+def load_commands(path='commands.json'):
     try:
-        with open('commands.json', 'r') as file:
+        with open(path, 'r') as file:
             return json.load(file)
     except FileNotFoundError:
         return {}
 
-def save_commands(commands):
-    with open('commands.json', 'w') as file:
+def save_commands(commands, path='commands.json'):
+    """Write commands to path atomically via a temporary file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
         json.dump(commands, file, indent=4)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
 
-def get_categories(commands):
-    """Get unique categories from commands."""
+def get_categories(commands, index=None):
+    """Get unique categories from commands.
+
+    With a CategoryIndex the maintained category list is returned instead
+    of scanning every command.
+    """
+    if index is not None:
+        return index.categories()
     categories = set()
     for details in commands.values():
         categories.add(details.get('category', 'Uncategorized'))
     return list(categories)
 
-def search_commands(commands, query):
-    """Search for commands matching the query."""
+def search_commands(commands, query, index=None, limit=None):
+    """Search for commands matching the query.
+
+    When a SearchIndex is given the ranked index lookup is used instead
+    of scanning every command. With a limit at most that many commands
+    are returned: the best ranked ones from the index, the first ones
+    found by the scan.
+    """
+    if index is not None:
+        return {name: commands[name] for name in index.search(query, limit) if name in commands}
     query = query.strip().lower()
     search_results = {}
     for name, details in commands.items():
@@ -28,4 +48,6 @@ def search_commands(commands, query):
             query in details.get('description', '').lower() or
             query in details.get('category', '').lower()):
             search_results[name] = details
-    return search_results
\ No newline at end of file
+            if limit and len(search_results) >= limit:
+                break
+    return search_results
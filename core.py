@@ -0,0 +1,188 @@
+import os
+import threading
+
+from command_store import CommandStore
+from command_utils import get_categories, search_commands
+
+
+class CommandCore:
+    """GUI-free command library: store, search, executor, scheduler, workflows and history.
+
+    The Tk front end, the cst CLI and the daemon all sit on top of this
+    class. Everything beyond the command store is created on first use,
+    so short CLI invocations only pay for what they touch. The result
+    cache lives in memory, so one-shot CLI invocations turn it off with
+    use_result_cache=False rather than pay for a cache that starts empty.
+    """
+
+    def __init__(self, data_dir='.', max_workers=None, catch_up='once', use_result_cache=True):
+        self.data_dir = data_dir
+        self.max_workers = max_workers
+        self.catch_up = catch_up
+        self.use_result_cache = use_result_cache
+        self.store = CommandStore(os.path.join(data_dir, 'commands.json'))
+        self.commands = self.store.commands
+        self._search_index = None
+        self._category_index = None
+        self._fuzzy_index = None
+        self._executor = None
+        self._history = None
+        self._scheduler = None
+        self._workflows = None
+        self._remote = None
+        self._result_cache = None
+        # Components are created on first use from the GUI, executor and
+        # scheduler threads; reentrant because fuzzy_index needs history.
+        self.lock = threading.RLock()
+
+    @property
+    def search_index(self):
+        if self._search_index is None:
+            with self.lock:
+                if self._search_index is None:
+                    from search_index import SearchIndex
+
+                    index = SearchIndex(self.commands)
+                    self.store.add_listener(index.on_change)
+                    self._search_index = index
+        return self._search_index
+
+    @property
+    def category_index(self):
+        if self._category_index is None:
+            with self.lock:
+                if self._category_index is None:
+                    from category_index import CategoryIndex
+
+                    index = CategoryIndex(self.commands)
+                    self.store.add_listener(index.on_change)
+                    self._category_index = index
+        return self._category_index
+
+    @property
+    def fuzzy_index(self):
+        if self._fuzzy_index is None:
+            with self.lock:
+                if self._fuzzy_index is None:
+                    from fuzzy import FuzzyIndex
+
+                    index = FuzzyIndex(self.commands)
+                    index.set_usage(self.history.run_counts())
+                    self.store.add_listener(index.on_change)
+                    self._fuzzy_index = index
+        return self._fuzzy_index
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self.lock:
+                if self._executor is None:
+                    from executor import CommandExecutor
+
+                    self._executor = CommandExecutor(self.max_workers)
+        return self._executor
+
+    @property
+    def history(self):
+        if self._history is None:
+            with self.lock:
+                if self._history is None:
+                    from history_store import HistoryStore
+
+                    self._history = HistoryStore(os.path.join(self.data_dir, 'history.db'))
+        return self._history
+
+    @property
+    def scheduler(self):
+        if self._scheduler is None:
+            with self.lock:
+                if self._scheduler is None:
+                    from scheduler import Scheduler
+
+                    self._scheduler = Scheduler(os.path.join(self.data_dir, 'schedules.json'), self.catch_up)
+        return self._scheduler
+
+    @property
+    def workflows(self):
+        if self._workflows is None:
+            with self.lock:
+                if self._workflows is None:
+                    from workflow import WorkflowRunner
+
+                    self._workflows = WorkflowRunner(self, os.path.join(self.data_dir, 'workflows.json'),
+                                                     os.path.join(self.data_dir, 'workflow_state.json'),
+                                                     self.max_workers)
+        return self._workflows
+
+    @property
+    def remote(self):
+        if self._remote is None:
+            with self.lock:
+                if self._remote is None:
+                    from remote import RemoteRunner
+
+                    self._remote = RemoteRunner(self, os.path.join(self.data_dir, 'hosts.json'))
+        return self._remote
+
+    @property
+    def result_cache(self):
+        if self._result_cache is None:
+            with self.lock:
+                if self._result_cache is None:
+                    from result_cache import ResultCache
+
+                    self._result_cache = ResultCache()
+        return self._result_cache
+
+    def categories(self):
+        return get_categories(self.commands, self.category_index)
+
+    def search(self, query, limit=None):
+        return search_commands(self.commands, query, self.search_index, limit)
+
+    def fuzzy_search(self, query, limit=50):
+        return self.fuzzy_index.search(query, limit)
+
+    def run(self, name, on_done=None, **options):
+        """Submit a stored command to the executor and record it in history.
+
+        options are passed on to CommandExecutor.submit. Commands with a
+        cache_ttl are answered from the result cache while it is fresh,
+        unless this core was created with use_result_cache=False.
+        """
+        command = self.commands[name]
+        options.setdefault('timeout', command.get('timeout'))
+        if self.use_result_cache and command.get('cache_ttl'):
+            options.setdefault('cache', self.result_cache.for_command(command))
+
+        def finished(run):
+            if not run.cancelled or run.iteration:
+                self.history.add_run(run.name, run.command, run.outputs, run.returncode,
+                                     metrics=run.metrics, cached=run.cache_hits)
+                if self._fuzzy_index:
+                    self._fuzzy_index.record_run(run.name)
+            if on_done:
+                on_done(run)
+
+        return self.executor.submit(name, command['command'], command.get('count', 1),
+                                    command.get('interval', 0), on_done=finished, **options)
+
+    def run_scheduled(self, name):
+        """Scheduler callback: run a command if it still exists."""
+        # Pick up edits made in other instances since the last run.
+        self.store.poll()
+        if name in self.commands:
+            return self.run(name)
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown()
+        if self._remote:
+            self._remote.close()
+        if self._fuzzy_index:
+            self._fuzzy_index.close()
+        if self._scheduler:
+            self._scheduler.stop()
+        self.store.close()
+        if self._history:
+            self._history.close()
@@ -0,0 +1,94 @@
+"""Minimal five-field cron expressions (minute hour day-of-month month day-of-week)."""
+import datetime
+
+MONTH_NAMES = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+DAY_NAMES = ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
+ALIASES = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+# How far ahead next_after looks before deciding an expression never fires.
+MAX_SEARCH_DAYS = 366 * 5
+
+
+def parse_field(text, low, high, names=None):
+    """Expand one cron field into the set of values it allows."""
+    values = set()
+    for part in text.lower().split(','):
+        part, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if step < 1:
+            raise ValueError(f"Invalid step in cron field '{text}'")
+        if part == '*':
+            start, end = low, high
+        else:
+            start, _, end = part.partition('-')
+            start = parse_value(start, names)
+            end = parse_value(end, names) if end else (high if step > 1 else start)
+        if not low <= start <= high or not low <= end <= high or start > end:
+            raise ValueError(f"Cron field '{text}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_value(text, names):
+    if names and text in names:
+        return names.index(text) + (1 if names is MONTH_NAMES else 0)
+    return int(text)
+
+
+class CronExpression:
+    """A parsed cron expression that can compute its next firing time."""
+
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        fields = ALIASES.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' must have 5 fields")
+        self.minutes = parse_field(fields[0], 0, 59)
+        self.hours = parse_field(fields[1], 0, 23)
+        self.days = parse_field(fields[2], 1, 31)
+        self.months = parse_field(fields[3], 1, 12, MONTH_NAMES)
+        # Both 0 and 7 mean Sunday.
+        weekdays = parse_field(fields[4], 0, 7, DAY_NAMES)
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def __str__(self):
+        return self.expression
+
+    def matches_day(self, date):
+        day_match = date.day in self.days
+        weekday_match = (date.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_match and weekday_match
+        # Standard cron: when both day fields are restricted either may match.
+        return day_match or weekday_match
+
+    def next_after(self, timestamp):
+        """Return the first firing time (epoch seconds, local time) after timestamp."""
+        moment = datetime.datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0)
+        moment += datetime.timedelta(minutes=1)
+        limit = moment + datetime.timedelta(days=MAX_SEARCH_DAYS)
+        while moment < limit:
+            if moment.month not in self.months:
+                year, month = (moment.year + 1, 1) if moment.month == 12 else (moment.year, moment.month + 1)
+                moment = moment.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self.matches_day(moment):
+                moment = moment.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+                continue
+            if moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + datetime.timedelta(hours=1)
+                continue
+            if moment.minute not in self.minutes:
+                moment += datetime.timedelta(minutes=1)
+                continue
+            return moment.timestamp()
+        raise ValueError(f"Cron expression '{self.expression}' never fires")
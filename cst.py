@@ -0,0 +1,399 @@
+"""Command-line front end for the command storage tool.
+
+Usage: python cst.py [--data-dir DIR] {list,categories,search,run,remote,hosts,schedule,workflow,history,stats,import,export,daemon} ...
+"""
+import argparse
+import shlex
+import signal
+import sys
+import threading
+import time
+
+import import_export
+from core import CommandCore
+from scheduler import CATCH_UP_POLICIES, describe
+
+
+def format_command(name, details):
+    return f"{name}\t{details.get('category', 'Uncategorized')}\t{details['command']}"
+
+
+def cmd_list(core, args):
+    if args.category is not None:
+        names = core.category_index.names(args.category)
+    elif args.tag is not None:
+        names = core.category_index.tagged(args.tag)
+    else:
+        names = core.commands
+    for name in names:
+        print(format_command(name, core.commands[name]))
+    return 0
+
+
+def cmd_categories(core, args):
+    index = core.category_index
+    for category in index.categories():
+        print(f"{index.count(category)}\t{category}")
+    for tag, count in index.tag_counts().items():
+        print(f"{count}\t#{tag}")
+    return 0
+
+
+def cmd_search(core, args):
+    if args.fuzzy:
+        results = {name: core.commands[name] for name in core.fuzzy_search(args.query, args.limit)}
+    else:
+        results = core.search(args.query, args.limit)
+    for name, details in list(results.items())[:args.limit]:
+        print(format_command(name, details))
+    return 0 if results else 1
+
+
+def cmd_run(core, args):
+    if args.name not in core.commands:
+        print(f"No command found with the name '{args.name}'.", file=sys.stderr)
+        return 2
+
+    def on_start(run):
+        if run.count > 1:
+            print(f"Execution {run.iteration + 1}/{run.count}:", flush=True)
+
+    def on_line(run, line, stream_name):
+        stream = sys.stderr if stream_name == 'stderr' else sys.stdout
+        stream.write(line)
+        stream.flush()
+
+    options = {}
+    if args.timeout is not None:
+        options['timeout'] = args.timeout
+    run = core.run(args.name, on_start=on_start, on_line=on_line, **options)
+    try:
+        run.wait()
+    except KeyboardInterrupt:
+        core.executor.cancel(run)
+        run.wait()
+        return 130
+    return run.returncode or 0
+
+
+def cmd_remote(core, args):
+    if args.name not in core.commands:
+        print(f"No command found with the name '{args.name}'.", file=sys.stderr)
+        return 2
+    if args.ssh:
+        core.remote.ssh_command = shlex.split(args.ssh)
+    if args.parallel:
+        core.remote.max_parallel = args.parallel
+    lock = threading.Lock()
+
+    def on_line(run, text, stream_name):
+        host = run.name[len(args.name) + 1:]
+        stream = sys.stderr if stream_name == 'stderr' else sys.stdout
+        with lock:
+            for line in text.splitlines(True):
+                stream.write(f"{host}: {line}")
+            stream.flush()
+
+    def on_host_done(fan_out, host, run):
+        with lock:
+            print(f"{host}: exit {run.returncode} ({fan_out.finished}/{len(fan_out.hosts)})",
+                  file=sys.stderr, flush=True)
+
+    options = {}
+    if args.timeout is not None:
+        options['timeout'] = args.timeout
+    fan_out = core.remote.run(args.name, args.targets, on_host_done, on_line=on_line, **options)
+    if not fan_out.hosts:
+        print("No hosts matched.", file=sys.stderr)
+        return 2
+    try:
+        fan_out.wait()
+    except KeyboardInterrupt:
+        core.remote.cancel(fan_out)
+        fan_out.wait()
+        return 130
+    failed = fan_out.failed()
+    if failed:
+        print(f"Failed on {len(failed)}/{len(fan_out.hosts)} host(s): {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_hosts(core, args):
+    from remote import resolve_hosts
+
+    inventory = core.remote.inventory()
+    if args.targets:
+        print("\n".join(resolve_hosts(inventory, args.targets)))
+    else:
+        for group, hosts in inventory.items():
+            print(f"{group}\t{' '.join(hosts)}")
+    return 0
+
+
+def cmd_schedule(core, args):
+    if args.action == 'add':
+        if args.target not in core.commands:
+            print(f"No command found with the name '{args.target}'.", file=sys.stderr)
+            return 2
+        try:
+            job = core.scheduler.add_job(args.target, args.spec)
+        except ValueError as e:
+            print(f"Invalid schedule '{args.spec}': {e}", file=sys.stderr)
+            return 2
+        print(job['id'])
+    elif args.action == 'remove':
+        if not core.scheduler.remove_job(args.target):
+            print(f"No schedule with id '{args.target}'.", file=sys.stderr)
+            return 2
+    else:
+        for due, job in core.scheduler.next_runs():
+            next_run = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(due))
+            print(f"{job['id']}\t{next_run}\t{describe(job)}\t{job['name']}")
+    return 0
+
+
+def cmd_workflow(core, args):
+    from workflow import OK
+
+    workflows = core.workflows.workflows()
+    if args.action == 'list':
+        for name, definition in workflows.items():
+            print(f"{name}\t{len(definition.get('steps', []))} step(s)")
+        return 0
+    if args.name not in workflows:
+        print(f"No workflow found with the name '{args.name}'.", file=sys.stderr)
+        return 2
+    if args.action == 'status':
+        state = core.workflows.load_state().get(args.name)
+        if state is None:
+            print(f"Workflow '{args.name}' has not run yet.")
+            return 0
+        for step_id, status in state['status'].items():
+            print(f"{status}\t{step_id}")
+        return 0 if all(status == OK for status in state['status'].values()) else 1
+
+    def on_step(run, step_id, state, output):
+        print(f"== {step_id}: {state}", flush=True)
+        if output:
+            sys.stdout.write(output if output.endswith("\n") else output + "\n")
+            sys.stdout.flush()
+
+    try:
+        run = core.workflows.start(args.name, args.resume, args.continue_on_error or None, on_step)
+    except ValueError as e:
+        print(f"Invalid workflow '{args.name}': {e}", file=sys.stderr)
+        return 2
+    try:
+        run.wait()
+    except KeyboardInterrupt:
+        run.cancel()
+        run.wait()
+        return 130
+    failed = [step_id for step_id, status in run.status.items() if status != OK]
+    if failed:
+        print(f"Workflow '{args.name}' did not complete: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_history(core, args):
+    if args.show is not None:
+        run = core.history.get_run(args.show)
+        if run is None:
+            print(f"No history entry {args.show}.", file=sys.stderr)
+            return 2
+        print(f"Name: {run['name']}\nCommand: {run['command']}\nExit code: {run['exit_code']}")
+        if run['cached']:
+            print(f"Cached: {run['cached']} of {run['iterations']} iterations")
+        print()
+        if not args.diff:
+            print("\n".join(run['output']))
+            return 0
+        from output_log import unified_diff
+
+        outputs = run['output']
+        for iteration, output in enumerate(outputs):
+            if iteration == 0:
+                sys.stdout.write(output)
+            else:
+                print(f"\nIteration {iteration + 1}:")
+                sys.stdout.write(unified_diff(outputs[iteration - 1], output, f"iteration {iteration}",
+                                              f"iteration {iteration + 1}") or "(unchanged)\n")
+        return 0
+    for run in core.history.list_runs(args.offset, args.limit, name=args.name):
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run['timestamp']))
+        print(f"{run['id']}\t{timestamp}\t{run['exit_code']}\t{run['name']}")
+    return 0
+
+
+def cmd_stats(core, args):
+    import metrics
+
+    since = time.time() - args.days * 86400 if args.days else None
+    runs = core.history.metrics(name=args.name, since=since)
+    if args.prometheus:
+        sys.stdout.write(metrics.prometheus_text(runs))
+        return 0
+    if args.name:
+        for day, count, p50, p95 in metrics.daily_trend(runs):
+            print(f"{day}\t{count}\t{metrics.format_seconds(p50)}\t{metrics.format_seconds(p95)}")
+        return 0
+    print("runs\tfailed\tp50\tp95\tcpu\tmax rss\tname")
+    for name, entry in sorted(metrics.command_stats(runs).items(), key=lambda item: -item[1]['total_duration']):
+        print(f"{entry['runs']}\t{entry['failures']}\t{metrics.format_seconds(entry['p50'])}\t"
+              f"{metrics.format_seconds(entry['p95'])}\t{metrics.format_seconds(entry['cpu'])}\t"
+              f"{metrics.format_rss(entry['max_rss'])}\t{name}")
+    return 0
+
+
+def cmd_import(core, args):
+    try:
+        report = import_export.import_file(core.store, args.path, args.format, args.on_conflict,
+                                           args.category, args.min_uses, args.dry_run)
+    except (OSError, ValueError) as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+    for error in report.errors:
+        print(error, file=sys.stderr)
+    print(f"{'Would import' if args.dry_run else 'Imported'}: {report}")
+    return 1 if report.invalid else 0
+
+
+def cmd_export(core, args):
+    names = core.category_index.names(args.category) if args.category is not None else None
+    try:
+        count = import_export.export_file(core.commands, args.path, args.format, names)
+    except (OSError, ValueError) as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Exported {count} commands to {args.path}")
+    return 0
+
+
+def cmd_daemon(core, args):
+    """Execute scheduled commands until interrupted."""
+    def stop(signum, frame):
+        core.scheduler.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"cst daemon running {len(core.scheduler.jobs)} schedule(s), catch-up '{args.catch_up}'", flush=True)
+    core.scheduler.run_forever(core.run_scheduled)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cst', description="Manage and run stored commands.")
+    parser.add_argument('--data-dir', default='.', help="directory holding commands.json and history.db")
+    parser.add_argument('--workers', type=int, help="maximum number of commands running at once")
+    subparsers = parser.add_subparsers(dest='subcommand', required=True)
+
+    list_parser = subparsers.add_parser('list', help="list stored commands")
+    list_parser.add_argument('--category', help="only commands in this category or its subcategories")
+    list_parser.add_argument('--tag', help="only commands with this tag")
+    list_parser.set_defaults(func=cmd_list)
+
+    categories_parser = subparsers.add_parser('categories', help="list categories and tags with counts")
+    categories_parser.set_defaults(func=cmd_categories)
+
+    search_parser = subparsers.add_parser('search', help="search stored commands")
+    search_parser.add_argument('query')
+    search_parser.add_argument('--limit', type=int, default=50)
+    search_parser.add_argument('--fuzzy', action='store_true',
+                               help="match names fuzzily, ranked by match quality and run history")
+    search_parser.set_defaults(func=cmd_search)
+
+    run_parser = subparsers.add_parser('run', help="run a stored command")
+    run_parser.add_argument('name')
+    run_parser.add_argument('--timeout', type=float)
+    run_parser.set_defaults(func=cmd_run)
+
+    remote_parser = subparsers.add_parser('remote', help="run a stored command on inventory hosts")
+    remote_parser.add_argument('name')
+    remote_parser.add_argument('targets', nargs='+', metavar='TARGET',
+                               help="host, group from hosts.json, or 'all'")
+    remote_parser.add_argument('--parallel', type=int, help="maximum number of hosts at once")
+    remote_parser.add_argument('--ssh', help="ssh command to use, or 'local' to run on this machine")
+    remote_parser.add_argument('--timeout', type=float)
+    remote_parser.set_defaults(func=cmd_remote)
+
+    hosts_parser = subparsers.add_parser('hosts', help="list the host inventory")
+    hosts_parser.add_argument('targets', nargs='*', metavar='TARGET', help="only print the hosts these resolve to")
+    hosts_parser.set_defaults(func=cmd_hosts)
+
+    schedule_parser = subparsers.add_parser('schedule', help="manage schedules")
+    schedule_parser.add_argument('action', choices=['add', 'remove', 'list'])
+    schedule_parser.add_argument('target', nargs='?', help="command name for add, schedule id for remove")
+    schedule_parser.add_argument('spec', nargs='?', help="HH:MM, an interval such as 15m, or a cron expression")
+    schedule_parser.set_defaults(func=cmd_schedule)
+
+    workflow_parser = subparsers.add_parser('workflow', help="run workflows of stored commands")
+    workflow_parser.add_argument('action', choices=['list', 'run', 'status'])
+    workflow_parser.add_argument('name', nargs='?')
+    workflow_parser.add_argument('--resume', action='store_true',
+                                 help="skip the steps that succeeded in the previous run")
+    workflow_parser.add_argument('--continue-on-error', action='store_true',
+                                 help="keep running steps that do not depend on a failed one")
+    workflow_parser.set_defaults(func=cmd_workflow)
+
+    history_parser = subparsers.add_parser('history', help="show run history")
+    history_parser.add_argument('--name')
+    history_parser.add_argument('--limit', type=int, default=20)
+    history_parser.add_argument('--offset', type=int, default=0)
+    history_parser.add_argument('--show', type=int, metavar='ID', help="print the output of one run")
+    history_parser.add_argument('--diff', action='store_true',
+                                help="with --show, print later iterations as changes against the one before")
+    history_parser.set_defaults(func=cmd_history)
+
+    stats_parser = subparsers.add_parser('stats', help="show run time statistics per command")
+    stats_parser.add_argument('--name', help="show the daily trend of one command")
+    stats_parser.add_argument('--days', type=int, help="only include runs from the last DAYS days")
+    stats_parser.add_argument('--prometheus', action='store_true',
+                              help="print the statistics in the Prometheus text format")
+    stats_parser.set_defaults(func=cmd_stats)
+
+    import_parser = subparsers.add_parser('import', help="import commands from a file or shell history")
+    import_parser.add_argument('path', help="json, ndjson, ~/.bash_history or ~/.zsh_history, optionally gzipped")
+    import_parser.add_argument('--format', choices=import_export.FORMATS, help="default: guessed from the file name")
+    import_parser.add_argument('--on-conflict', choices=import_export.CONFLICT_POLICIES, default='skip',
+                               help="what to do with names that already exist")
+    import_parser.add_argument('--category', help="put every imported command in this category")
+    import_parser.add_argument('--min-uses', type=int, default=1,
+                               help="shell histories: only commands run at least this often")
+    import_parser.add_argument('--dry-run', action='store_true', help="validate and report without importing")
+    import_parser.set_defaults(func=cmd_import)
+
+    export_parser = subparsers.add_parser('export', help="export commands to a json or ndjson file")
+    export_parser.add_argument('path', help="a .gz suffix compresses the file")
+    export_parser.add_argument('--format', choices=['json', 'ndjson'], help="default: guessed from the file name")
+    export_parser.add_argument('--category', help="only commands in this category or its subcategories")
+    export_parser.set_defaults(func=cmd_export)
+
+    daemon_parser = subparsers.add_parser('daemon', help="run scheduled commands in the foreground")
+    daemon_parser.add_argument('--catch-up', choices=CATCH_UP_POLICIES, default='once',
+                               help="what to do with runs missed while the daemon was down")
+    daemon_parser.set_defaults(func=cmd_daemon)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.subcommand == 'schedule' and args.action != 'list' and not args.target:
+        parser.error("schedule add needs a command name, schedule remove a schedule id")
+    if args.subcommand == 'schedule' and args.action == 'add' and not args.spec:
+        parser.error("schedule add needs a schedule (HH:MM, interval or cron expression)")
+    if args.subcommand == 'workflow' and args.action != 'list' and not args.name:
+        parser.error(f"workflow {args.action} needs a workflow name")
+    # Only the daemon lives long enough for the in-memory result cache to hit.
+    core = CommandCore(args.data_dir, args.workers, getattr(args, 'catch_up', 'once'),
+                       use_result_cache=args.subcommand == 'daemon')
+    try:
+        return args.func(core, args)
+    finally:
+        core.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,266 @@
+import collections
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from output_log import OutputLog
+from runner import DEFAULT_MAX_OUTPUT, run_command, terminate
+
+
+class Run:
+    """One execution of a stored command, repeated count times."""
+
+    def __init__(self, name, command, count=1, interval=0, timeout=None,
+                 max_output=DEFAULT_MAX_OUTPUT, on_start=None, on_line=None,
+                 on_output=None, on_done=None, cache=None):
+        self.name = name
+        self.command = command
+        self.count = max(int(count), 1)
+        self.interval = max(float(interval), 0)
+        self.timeout = timeout or None
+        self.max_output = max_output
+        self.on_start = on_start
+        self.on_line = on_line
+        self.on_output = on_output
+        self.on_done = on_done
+        self.cache = cache
+        self.iteration = 0
+        self.outputs = OutputLog()
+        self.metrics = []
+        # Iterations answered from the result cache, and the age in seconds
+        # of the latest one's cached result (None when it really ran).
+        self.cache_hits = 0
+        self.cache_age = None
+        self.returncode = None
+        self.cancelled = False
+        self.running = False
+        self.finished = False
+        self.process = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+
+class CommandExecutor:
+    """Run stored commands on a fixed pool of worker threads.
+
+    Runs of the same command are queued behind each other, while runs of
+    different commands share a global ready queue served by max_workers
+    threads. Between repetitions a run sits on a timer heap rather than
+    holding a sleeping thread, so the number of threads stays bounded no
+    matter how many runs are queued or scheduled.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.condition = threading.Condition()
+        self.ready = collections.deque()
+        self.timers = []
+        self.sequence = itertools.count()
+        self.active = {}
+        self.pending = collections.defaultdict(collections.deque)
+        self.threads = []
+        self.stopped = False
+
+    def submit(self, name, command, count=1, interval=0, **options):
+        """Queue a run and return its Run handle.
+
+        options are passed to Run: timeout, max_output, the on_start,
+        on_line, on_output and on_done callbacks, and cache, a
+        result_cache.CachedCommand that can answer an iteration without
+        starting a process.
+        """
+        run = Run(name, command, count, interval, **options)
+        with self.condition:
+            if self.stopped:
+                raise RuntimeError("executor is shut down")
+            self._start_threads()
+            if name in self.active:
+                self.pending[name].append(run)
+            else:
+                self.active[name] = run
+                self.ready.append(run)
+                self.condition.notify_all()
+        return run
+
+    def cancel(self, run):
+        """Stop a run: drop it from the queues and kill its process."""
+        with self.condition:
+            run.cancelled = True
+            queue = self.pending.get(run.name)
+            if queue and run in queue:
+                queue.remove(run)
+                run.finished = True
+                run.done.set()
+                return
+            if self.active.get(run.name) is run and not run.running:
+                # Waiting in the ready queue or on a timer: wake it up so a
+                # worker retires it straight away.
+                self._schedule(run, 0)
+        process = run.process
+        if process is not None and process.returncode is None:
+            terminate(process)
+
+    def cancel_command(self, name):
+        """Cancel the active and all queued runs of a command."""
+        with self.condition:
+            runs = list(self.pending.get(name, ()))
+            if name in self.active:
+                runs.append(self.active[name])
+        for run in runs:
+            self.cancel(run)
+
+    def runs(self):
+        """Return the active runs keyed by command name."""
+        with self.condition:
+            return dict(self.active)
+
+    def shutdown(self):
+        """Cancel every run and stop the worker threads.
+
+        Queued runs and runs waiting on a timer are finished here, since
+        no worker picks them up again; running ones have their process
+        killed and finish when it exits.
+        """
+        with self.condition:
+            self.stopped = True
+            running = [run for run in self.active.values() if run.running]
+            idle = [run for run in self.active.values() if not run.running]
+            for queue in self.pending.values():
+                idle.extend(queue)
+            self.pending.clear()
+            self.ready.clear()
+            self.timers.clear()
+            for run in idle:
+                run.cancelled = True
+            self.condition.notify_all()
+        for run in idle:
+            self._finish(run)
+        for run in running:
+            self.cancel(run)
+
+    def _start_threads(self):
+        if self.threads:
+            return
+        self.threads.append(threading.Thread(target=self._timer_loop, daemon=True))
+        for _ in range(self.max_workers):
+            self.threads.append(threading.Thread(target=self._worker_loop, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def _schedule(self, run, delay):
+        if delay <= 0:
+            self.ready.append(run)
+        else:
+            heapq.heappush(self.timers, (time.monotonic() + delay, next(self.sequence), run))
+        self.condition.notify_all()
+
+    def _timer_loop(self):
+        with self.condition:
+            while not self.stopped:
+                now = time.monotonic()
+                while self.timers and self.timers[0][0] <= now:
+                    run = heapq.heappop(self.timers)[2]
+                    if run.cancelled:
+                        continue
+                    self.ready.append(run)
+                    self.condition.notify_all()
+                timeout = self.timers[0][0] - now if self.timers else None
+                self.condition.wait(timeout)
+
+    def _worker_loop(self):
+        while True:
+            with self.condition:
+                while not self.ready and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                run = self.ready.popleft()
+                if run.finished or run.running:
+                    continue
+                run.running = True
+            if run.cancelled:
+                self._finish(run)
+                continue
+            if run.on_start:
+                self._call(run.on_start, run)
+            output = self._execute(run)
+            run.iteration += 1
+            run.outputs.append(output)
+            if run.on_output:
+                self._call(run.on_output, run, output)
+            with self.condition:
+                run.running = False
+                if run.cancelled or run.iteration >= run.count:
+                    finished = True
+                else:
+                    finished = False
+                    self._schedule(run, run.interval)
+            if finished:
+                self._finish(run)
+
+    def _execute(self, run):
+        def started(process):
+            with self.condition:
+                run.process = process
+                if run.cancelled:
+                    terminate(process)
+
+        def line_received(text, stream_name):
+            run.on_line(run, text, stream_name)
+
+        run.cache_age = None
+        try:
+            if run.cancelled:
+                return ""
+            if run.cache:
+                hit = run.cache.get()
+                if hit is not None:
+                    run.returncode, output, run.cache_age = hit
+                    run.cache_hits += 1
+                    # Delivered as one piece on the 'cache' stream.
+                    if run.on_line and output:
+                        run.on_line(run, output, 'cache')
+                    return output
+            result = run_command(run.command, line_received if run.on_line else None,
+                                 run.timeout, run.max_output, started)
+            run.returncode = result.returncode
+            run.metrics.append(result.metrics())
+            if run.cache and result.returncode == 0 and not (result.timed_out or result.truncated):
+                run.cache.put(result.returncode, result.output)
+            return result.output
+        except Exception as e:
+            return str(e)
+        finally:
+            run.process = None
+
+    def _finish(self, run):
+        with self.condition:
+            if run.finished:
+                return
+            run.finished = True
+            if self.active.get(run.name) is run:
+                queue = self.pending.get(run.name)
+                if queue:
+                    self.active[run.name] = queue.popleft()
+                    self.ready.append(self.active[run.name])
+                    self.condition.notify_all()
+                else:
+                    del self.active[run.name]
+                    self.pending.pop(run.name, None)
+        if run.on_done:
+            self._call(run.on_done, run)
+        run.done.set()
+
+    @staticmethod
+    def _call(callback, *args):
+        # A failing callback is the caller's bug; it must not take a worker
+        # thread down or leave the run marked as running.
+        try:
+            callback(*args)
+        except Exception:
+            logging.exception("%s callback failed", getattr(callback, '__name__', 'run'))
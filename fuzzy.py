@@ -0,0 +1,472 @@
+"""Typo-tolerant, fzf-style fuzzy search over stored commands."""
+import array
+import bisect
+import concurrent.futures
+import heapq
+import math
+import re
+import threading
+import time
+
+from search_index import tokenize
+
+SCORE_MATCH = 16
+BONUS_FIRST = 16
+BONUS_BOUNDARY = 10
+BONUS_CONSECUTIVE = 8
+MAX_GAP_PENALTY = 8
+BOUNDARY_CHARS = frozenset(' -_./:@\t')
+# Searched fields, in the order of command_utils.search_commands; the
+# name comes first so its matches get the start-of-line bonus.
+FIELDS = ('command', 'description', 'category')
+# Matches that start after the name rank below matches in the name.
+OTHER_FIELD_PENALTY = 16
+# Matches found only through a typo-corrected word rank below real matches.
+TYPO_PENALTY = 0.5
+# Longer queries are cut here before building the subsequence pattern.
+MAX_QUERY = 32
+# Names scored per query, as a multiple of the result limit.
+CANDIDATE_FACTOR = 2
+# A query word that starts more index words than this (a one-letter
+# word, say) only collects candidates from the first of them.
+MAX_PREFIX_WORDS = 256
+# Up to this many postings, the other words of a query are checked
+# against a set of ranks rather than with a regex on each text.
+MAX_CHECK_SET = 20000
+# How many of the most-run commands are always considered for ranking.
+FREQUENT_LIMIT = 200
+RECENCY_HALF_LIFE = 7 * 86400
+
+
+def subsequence_pattern(query):
+    """Regex matching the characters of query in order within one line."""
+    return re.compile('[^\n]*?'.join(f'({re.escape(char)})' for char in query))
+
+
+def scan_pattern(query):
+    """Like subsequence_pattern, but without groups and backtracking, for scanning."""
+    parts = [re.escape(query[0])]
+    for char in query[1:]:
+        char = re.escape(char)
+        parts.append(f'[^\n{char}]*{char}')
+    return re.compile(''.join(parts))
+
+
+def score_positions(text, positions):
+    """fzf-style quality of a match at positions in text.
+
+    text is a name, optionally followed by tab-separated fields.
+    """
+    score, previous = 0, None
+    for position in positions:
+        score += SCORE_MATCH
+        if position == 0:
+            score += BONUS_FIRST
+        elif text[position - 1] in BOUNDARY_CHARS:
+            score += BONUS_BOUNDARY
+        if previous is not None:
+            if position == previous + 1:
+                score += BONUS_CONSECUTIVE
+            else:
+                score -= min(position - previous - 1, MAX_GAP_PENALTY)
+        previous = position
+    name_length = text.find('\t')
+    if name_length < 0:
+        name_length = len(text)
+    elif positions and positions[0] > name_length:
+        score -= OTHER_FIELD_PENALTY
+    # Shorter names win ties.
+    return score - name_length / 16
+
+
+def score_match(text, match, query):
+    score = score_positions(text, [match.start(group) for group in range(1, len(query) + 1)])
+    start = text.find(query)
+    if start >= 0:
+        # The leftmost subsequence is not always the best; a contiguous hit
+        # usually is.
+        score = max(score, score_positions(text, range(start, start + len(query))))
+    return score
+
+
+def score_words(text, words):
+    """Score of a query whose words match text out of order."""
+    score = 0
+    for word in words:
+        start = text.find(word)
+        score += score_positions(text, range(start, start + len(word)))
+    return score
+
+
+def deletions(word):
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def word_start_patterns(words):
+    return [re.compile(r'\b' + re.escape(word)) for word in words]
+
+
+def matcher(query, words):
+    """Predicate for the texts that match query: a name containing it,
+    as a subsequence when it is a single word, or every query word
+    starting a word in some field."""
+    if words == [query]:
+        name_pattern = scan_pattern(query)
+    else:
+        name_pattern = re.compile(re.escape(query))
+    checks = word_start_patterns(words)
+
+    def matches(text):
+        return bool(name_pattern.search(text.partition('\t')[0]) or
+                    (checks and all(check.search(text) for check in checks)))
+
+    return matches
+
+
+def merge_ranks(postings):
+    """Ascending, distinct ranks from several ascending posting arrays."""
+    previous = None
+    for rank in heapq.merge(*postings):
+        if rank != previous:
+            previous = rank
+            yield rank
+
+
+class WordPostings:
+    """Ranks of the names containing each word, for word-prefix lookups."""
+
+    def __init__(self, postings):
+        self.postings = {word: array.array('l', ranks) for word, ranks in postings.items()}
+        self.words = sorted(self.postings)
+
+    def prefixed(self, prefix):
+        """Posting arrays of up to MAX_PREFIX_WORDS words starting with prefix, and whether that is all."""
+        start = bisect.bisect_left(self.words, prefix)
+        end = bisect.bisect_left(self.words, prefix + '\uffff', start)
+        words = self.words[start:min(end, start + MAX_PREFIX_WORDS)]
+        return [self.postings[word] for word in words], end - start <= MAX_PREFIX_WORDS
+
+
+class Snapshot:
+    """Read-only search state for one version of the library.
+
+    Searches hold on to the snapshot they started with, so edits arriving
+    from other threads never change the data under a running search.
+    Names are ranked shortest first; the name words and the words of
+    every field have posting arrays of those ranks, and the lowercased
+    names are kept newline-joined so one compiled regex scans all of
+    them in C.
+    """
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.order = sorted(texts, key=lambda name: (len(name), texts[name]))
+        name_words, all_words = {}, {}
+        lines, self.offsets = [], []
+        position = 1
+        for rank, name in enumerate(self.order):
+            text = texts[name]
+            line = text.partition('\t')[0]
+            lines.append(line)
+            self.offsets.append(position)
+            position += len(line) + 1
+            words = set(tokenize(line))
+            for word in words:
+                name_words.setdefault(word, []).append(rank)
+            for word in words.union(tokenize(text[len(line):])):
+                all_words.setdefault(word, []).append(rank)
+        self.name_words = WordPostings(name_words)
+        self.all_words = WordPostings(all_words)
+        # Every line starts after a newline, so "\n" + query finds prefixes.
+        self.blob = "\n" + "\n".join(lines)
+        self.typo_index = None
+        self.word_names = None
+        # (query, candidates) of the last search that found every match.
+        self.narrowed = None
+
+    def scan(self, pattern, found, budget):
+        """Add the names whose name line pattern matches to found, up to budget; True if complete."""
+        if len(found) >= budget:
+            return False
+        for match in pattern.finditer(self.blob):
+            if len(found) >= budget:
+                return False
+            found[self.order[bisect.bisect_right(self.offsets, match.end() - 1) - 1]] = None
+        return True
+
+    def find(self, text, found, budget):
+        """scan() for a literal, with str.find, which is much faster than a regex here."""
+        if len(found) >= budget:
+            return False
+        blob, start = self.blob, 0
+        while True:
+            position = blob.find(text, start)
+            if position < 0:
+                return True
+            if len(found) >= budget:
+                return False
+            rank = bisect.bisect_right(self.offsets, position) - 1
+            found[self.order[rank]] = None
+            # Continue on the next line; this name is in.
+            start = self.offsets[rank + 1] if rank + 1 < len(self.offsets) else len(blob)
+
+    def word_hits(self, index, words, checks, found, budget):
+        """Add names where every word starts an index word to found, up to budget; True if complete."""
+        if len(found) >= budget:
+            return False
+        lists = [index.prefixed(word) for word in words]
+        # Walk the rarest word's postings and check the others on the text.
+        driver = min(range(len(words)), key=lambda i: sum(len(entries) for entries in lists[i][0]))
+        postings, complete = lists[driver]
+        rank_sets, others = [], []
+        for i, check in enumerate(checks):
+            if i == driver:
+                continue
+            other_postings, other_complete = lists[i]
+            if other_complete and sum(len(entries) for entries in other_postings) <= MAX_CHECK_SET:
+                rank_sets.append(set().union(*other_postings))
+            else:
+                others.append(check)
+        if rank_sets:
+            # Intersect in C rather than walking the postings in Python.
+            ranks = sorted(set().union(*postings).intersection(*rank_sets))
+        else:
+            ranks = merge_ranks(postings)
+        for rank in ranks:
+            name = self.order[rank]
+            if name in found:
+                continue
+            if all(check.search(self.texts[name]) for check in others):
+                if len(found) >= budget:
+                    return False
+                found[name] = None
+        return complete
+
+    def build_typo_index(self):
+        self.word_names = {}
+        for word, entries in self.all_words.postings.items():
+            # Typos in numbers are not worth matching.
+            if len(word) >= 3 and not word.isdigit():
+                self.word_names[word] = entries
+        typo_index = {}
+        for word in self.word_names:
+            for variant in deletions(word) | {word}:
+                typo_index.setdefault(variant, []).append(word)
+        self.typo_index = typo_index
+
+
+class FuzzyIndex:
+    """Ranked fuzzy matching of stored commands, kept in sync with the store.
+
+    Each command is matched on its name, command line, description and
+    category, the fields plain search looks at. A command matches when
+    every word of the query starts a word of those fields, or when the
+    query appears in its name; a one-word query may also be a
+    subsequence of the name, as in fzf. Matches are scored
+    with bonuses for word starts and consecutive runs, and matches in the
+    name rank above the other fields. Candidates come from word-prefix
+    postings and regex scans of the names, so a query only scores a few
+    hundred commands; one that extends the previous query only rechecks
+    the previous matches. Words within one typo of a word in any field
+    are found through a deletion index. Ranking adds a boost for commands
+    that were run often and recently (see set_usage).
+    """
+
+    def __init__(self, commands=None):
+        self.names = {}
+        self.usage = {}
+        self.frequent = []
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.generation = 0
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        for name, details in (commands or {}).items():
+            self.names[name] = self._text(name, details)
+
+    def on_change(self, name, details):
+        """CommandStore listener."""
+        with self.lock:
+            if details is None:
+                self.names.pop(name, None)
+            else:
+                self.names[name] = self._text(name, details)
+            self.snapshot = None
+
+    def set_usage(self, usage):
+        """usage maps name -> (run count, last run timestamp), e.g. from HistoryStore.run_counts."""
+        with self.lock:
+            self.usage = dict(usage)
+            now = time.time()
+            self.frequent = sorted(self.usage, key=lambda name: -self._boost(name, now))[:FREQUENT_LIMIT]
+
+    def record_run(self, name, timestamp=None):
+        """Count a run of name; called from executor threads."""
+        with self.lock:
+            count, _ = self.usage.get(name, (0, None))
+            self.usage[name] = (count + 1, timestamp or time.time())
+            self._update_frequent(name)
+
+    def prepare(self):
+        """Build the search state and typo index now instead of on the first search."""
+        snapshot = self._snapshot()
+        self._typo_index(snapshot)
+
+    def search(self, query, limit=50, cancelled=None):
+        """Return up to limit names matching query, best first.
+
+        cancelled is polled while scoring; when it returns True the search
+        stops early and returns None.
+        """
+        query = query.strip().lower()[:MAX_QUERY]
+        snapshot = self._snapshot()
+        words = tokenize(query)
+        if not query:
+            return []
+        checks = word_start_patterns(words)
+        candidates = self._candidates(snapshot, query, words, checks, limit * CANDIDATE_FACTOR)
+        pattern = subsequence_pattern(query)
+        single = len(words) <= 1
+        # Often-run commands are scored even when the collection stopped before them.
+        matches = matcher(query, words)
+        for name in self.frequent:
+            text = snapshot.texts.get(name)
+            if text is not None and matches(text):
+                candidates[name] = None
+        now = time.time()
+        ranked = []
+        texts = snapshot.texts
+        for count, name in enumerate(candidates):
+            if cancelled and count % 500 == 0 and cancelled():
+                return None
+            text = texts[name]
+            # Several words are scored one by one unless typed as they appear.
+            match = pattern.search(text) if single or query in text else None
+            score = score_match(text, match, query) if match else score_words(text, words)
+            ranked.append((score + self._boost(name, now), name))
+        if len(ranked) < limit:
+            seen = {name for _, name in ranked}
+            typo_penalty = SCORE_MATCH * len(query) * TYPO_PENALTY
+            typos = [name for name in self._typo_matches(snapshot, words, limit) if name not in seen]
+            ranked.extend((typo_penalty - len(name) / 16 + self._boost(name, now), name)
+                          for name in typos)
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [name for _, name in ranked[:limit]]
+
+    def search_async(self, query, callback, limit=50):
+        """Search on the worker thread; callback(query, names) runs there unless superseded."""
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+
+        def stale():
+            return generation != self.generation
+
+        def job():
+            if stale():
+                return
+            names = self.search(query, limit, stale)
+            if names is not None and not stale():
+                callback(query, names)
+
+        return self.executor.submit(job)
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+
+    def close(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
+
+    def _candidates(self, snapshot, query, words, checks, budget):
+        """Collect up to budget matching names, from the strongest kind of match down.
+
+        Words starting name words come first, then substrings of names,
+        words starting words of any field and subsequences of names.
+        Names are ranked shortest first, so stopping at the budget keeps
+        the best-scoring names of each kind.
+        """
+        narrowed = snapshot.narrowed
+        if narrowed is not None and query.startswith(narrowed[0]):
+            # The previous search found every match, and each match of the
+            # longer query is among them.
+            matches = matcher(query, words)
+            candidates = {name: None for name in narrowed[1] if matches(snapshot.texts[name])}
+            snapshot.narrowed = (query, candidates)
+            return dict(candidates)
+        found = {}
+        complete = True
+        if words:
+            complete = snapshot.word_hits(snapshot.name_words, words, checks, found, budget)
+        complete = snapshot.find(query, found, budget) and complete
+        if words:
+            complete = snapshot.word_hits(snapshot.all_words, words, checks, found, budget) and complete
+        if words == [query]:
+            # Typed as one word, the query may be an abbreviation of a name.
+            complete = snapshot.scan(scan_pattern(query), found, budget) and complete
+        snapshot.narrowed = (query, dict(found)) if complete else None
+        return found
+
+    def _typo_index(self, snapshot):
+        with self.lock:
+            if snapshot.typo_index is None:
+                snapshot.build_typo_index()
+            return snapshot.typo_index
+
+    def _typo_matches(self, snapshot, words, limit):
+        """Up to limit names whose words cover every query word, allowing one typo per word."""
+        if not words or any(len(word) < 4 for word in words):
+            return []
+        index = self._typo_index(snapshot)
+        accepted = []
+        for word in words:
+            close = set()
+            for variant in deletions(word) | {word}:
+                close.update(index.get(variant, ()))
+            if not close:
+                return []
+            accepted.append(close)
+        # Walk the postings of the rarest query word and check the others.
+        postings = [[snapshot.word_names[word] for word in close] for close in accepted]
+        driver = min(range(len(words)), key=lambda i: sum(len(entries) for entries in postings[i]))
+        others = [set().union(*entries) for i, entries in enumerate(postings) if i != driver]
+        found = []
+        if others:
+            ranks = sorted(set().union(*postings[driver]).intersection(*others))
+        else:
+            ranks = merge_ranks(postings[driver])
+        for rank in ranks:
+            found.append(snapshot.order[rank])
+            if len(found) >= limit:
+                break
+        return found
+
+    def _snapshot(self):
+        with self.lock:
+            if self.snapshot is None:
+                self.snapshot = Snapshot(dict(self.names))
+            return self.snapshot
+
+    def _update_frequent(self, name):
+        """Re-rank name against the current top commands instead of re-sorting all usage."""
+        now = time.time()
+        frequent = [other for other in self.frequent if other != name]
+        keys = [-self._boost(other, now) for other in frequent]
+        key = -self._boost(name, now)
+        position = bisect.bisect_right(keys, key)
+        if position < FREQUENT_LIMIT:
+            frequent.insert(position, name)
+        # Replaced, not mutated, so a search iterating the old list is unaffected.
+        self.frequent = frequent[:FREQUENT_LIMIT]
+
+    def _boost(self, name, now):
+        count, last = self.usage.get(name, (0, None))
+        if not count:
+            return 0
+        recency = 0.5 ** ((now - last) / RECENCY_HALF_LIFE) if last else 0
+        return 6 * math.log1p(count) + 12 * recency
+
+    @staticmethod
+    def _text(name, details):
+        fields = [name] + [str(details.get(field) or '') for field in FIELDS]
+        return "\t".join(field.lower().replace("\n", " ").replace("\t", " ") for field in fields)
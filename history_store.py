@@ -0,0 +1,216 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from output_log import OutputLog
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    command TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    exit_code INTEGER,
+    iterations INTEGER NOT NULL,
+    output BLOB,
+    started_at REAL,
+    duration REAL,
+    cpu_user REAL,
+    cpu_sys REAL,
+    max_rss INTEGER,
+    manifest BLOB,
+    cached INTEGER
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_chunks (
+    run_id INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS run_chunks_run ON run_chunks (run_id);
+CREATE INDEX IF NOT EXISTS run_chunks_hash ON run_chunks (hash);
+CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (timestamp);
+CREATE INDEX IF NOT EXISTS runs_name ON runs (name, timestamp);
+CREATE INDEX IF NOT EXISTS runs_exit_code ON runs (exit_code, timestamp);
+"""
+METRIC_COLUMNS = ('started_at', 'duration', 'cpu_user', 'cpu_sys', 'max_rss')
+RUN_COLUMNS = ('id', 'name', 'command', 'timestamp', 'exit_code', 'iterations', 'cached') + METRIC_COLUMNS
+# Columns added after the first release, created on open when missing.
+ADDED_COLUMNS = {'started_at': 'REAL', 'duration': 'REAL', 'cpu_user': 'REAL', 'cpu_sys': 'REAL',
+                 'max_rss': 'INTEGER', 'manifest': 'BLOB', 'cached': 'INTEGER'}
+PRUNE_EVERY = 500
+
+
+def summarize_metrics(metrics):
+    """Fold per-iteration metrics into the per-run columns."""
+    def total(key):
+        values = [entry[key] for entry in metrics if entry.get(key) is not None]
+        return sum(values) if values else None
+
+    rss = [entry['max_rss'] for entry in metrics if entry.get('max_rss') is not None]
+    return {'started_at': metrics[0]['started_at'] if metrics else None,
+            'duration': total('duration'),
+            'cpu_user': total('cpu_user'),
+            'cpu_sys': total('cpu_sys'),
+            'max_rss': max(rss) if rss else None}
+
+
+class HistoryStore:
+    """Command run history persisted in SQLite.
+
+    Run metadata is indexed by timestamp, name and exit code; outputs are
+    only read back when a run is opened. They are kept as zlib-compressed,
+    content-addressed chunks shared between runs, and each run stores a
+    manifest of chunk references and line deltas (see OutputLog), so
+    repeated polling output costs disk in proportion to what changed.
+    Each run also keeps its wall time, CPU time and peak RSS for the
+    stats view. Runs older than retention_days, or beyond the newest
+    max_runs, are pruned on open and periodically as new runs are added.
+    """
+
+    def __init__(self, path='history.db', retention_days=30, max_runs=100000):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_runs = max_runs
+        self.lock = threading.Lock()
+        self.added = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.upgrade()
+        self.prune()
+
+    def upgrade(self):
+        """Add the columns that databases created by older versions lack."""
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(runs)")}
+        with self.db:
+            for column, kind in ADDED_COLUMNS.items():
+                if column not in columns:
+                    self.db.execute(f"ALTER TABLE runs ADD COLUMN {column} {kind}")
+
+    def add_run(self, name, command, outputs, exit_code=None, timestamp=None, metrics=None, cached=0):
+        """Record a finished run and return its id.
+
+        outputs is a list of strings or an OutputLog. Its chunks are stored
+        once across all runs, and the run keeps only the manifest of chunk
+        references and deltas. metrics is the list of per-iteration
+        RunResult.metrics() dicts; the run is stored with the summed wall
+        and CPU times and the peak RSS. cached is the number of iterations
+        answered from the result cache, which have no metrics.
+        """
+        log = outputs if isinstance(outputs, OutputLog) else OutputLog(outputs)
+        manifest = zlib.compress(json.dumps(log.entries).encode())
+        hashes = {value for kind, value in log.entries if kind == 'c'}
+        summary = summarize_metrics(metrics or [])
+        with self.lock, self.db:
+            cursor = self.db.execute(
+                "INSERT INTO runs (name, command, timestamp, exit_code, iterations, manifest, cached,"
+                f" {', '.join(METRIC_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, command, timestamp or time.time(), exit_code, len(log), manifest, cached)
+                + tuple(summary[column] for column in METRIC_COLUMNS))
+            self.db.executemany("INSERT OR IGNORE INTO chunks (hash, data) VALUES (?, ?)",
+                                [(digest, zlib.compress(log.chunks[digest].encode())) for digest in hashes])
+            self.db.executemany("INSERT INTO run_chunks (run_id, hash) VALUES (?, ?)",
+                                [(cursor.lastrowid, digest) for digest in hashes])
+            self.added += 1
+        if self.added % PRUNE_EVERY == 0:
+            self.prune()
+        return cursor.lastrowid
+
+    def count(self, name=None, exit_code=None):
+        where, params = self._filter(name, exit_code)
+        with self.lock:
+            return self.db.execute(f"SELECT COUNT(*) FROM runs{where}", params).fetchone()[0]
+
+    def list_runs(self, offset=0, limit=100, name=None, exit_code=None):
+        """Return one page of run metadata, newest first, without outputs."""
+        where, params = self._filter(name, exit_code)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT {', '.join(RUN_COLUMNS)} FROM runs{where}"
+                " ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]).fetchall()
+        return [dict(zip(RUN_COLUMNS, row)) for row in rows]
+
+    def get_run(self, run_id):
+        """Return a run including its decompressed outputs, or None."""
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT {', '.join(RUN_COLUMNS)}, output, manifest FROM runs WHERE id = ?",
+                (run_id,)).fetchone()
+            if row is None:
+                return None
+            run = dict(zip(RUN_COLUMNS, row))
+            output, manifest = row[-2:]
+            if manifest is None:
+                # Runs recorded before chunking keep their outputs inline.
+                run['output'] = json.loads(zlib.decompress(output)) if output else []
+                return run
+            chunks = {digest: zlib.decompress(data).decode() for digest, data in self.db.execute(
+                "SELECT chunks.hash, chunks.data FROM run_chunks JOIN chunks USING (hash)"
+                " WHERE run_chunks.run_id = ?", (run_id,))}
+        run['output'] = list(OutputLog(entries=json.loads(zlib.decompress(manifest)), chunks=chunks))
+        return run
+
+    def run_counts(self):
+        """Return {name: (number of runs, last run timestamp)}."""
+        with self.lock:
+            rows = self.db.execute("SELECT name, COUNT(*), MAX(timestamp) FROM runs GROUP BY name").fetchall()
+        return {name: (count, last) for name, count, last in rows}
+
+    def previous_run(self, run_id):
+        """Return the id of the run of the same command before run_id, or None."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT previous.id FROM runs AS current JOIN runs AS previous"
+                " ON previous.name = current.name AND (previous.timestamp < current.timestamp"
+                " OR (previous.timestamp = current.timestamp AND previous.id < current.id))"
+                " WHERE current.id = ? ORDER BY previous.timestamp DESC, previous.id DESC LIMIT 1",
+                (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def metrics(self, name=None, since=None):
+        """Return run metadata with metrics, oldest first, for runs that have them."""
+        where, params = self._filter(name, None)
+        clauses = [where[len(" WHERE "):]] if where else []
+        clauses.append("duration IS NOT NULL")
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT {', '.join(RUN_COLUMNS)} FROM runs WHERE {' AND '.join(clauses)}"
+                " ORDER BY timestamp", params).fetchall()
+        return [dict(zip(RUN_COLUMNS, row)) for row in rows]
+
+    def prune(self):
+        """Apply the retention policy."""
+        with self.lock, self.db:
+            if self.retention_days:
+                cutoff = time.time() - self.retention_days * 86400
+                self.db.execute("DELETE FROM runs WHERE timestamp < ?", (cutoff,))
+            if self.max_runs:
+                self.db.execute(
+                    "DELETE FROM runs WHERE id IN (SELECT id FROM runs"
+                    " ORDER BY timestamp DESC, id DESC LIMIT -1 OFFSET ?)", (self.max_runs,))
+            self.db.execute("DELETE FROM run_chunks WHERE run_id NOT IN (SELECT id FROM runs)")
+            self.db.execute("DELETE FROM chunks WHERE hash NOT IN (SELECT hash FROM run_chunks)")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    @staticmethod
+    def _filter(name, exit_code):
+        clauses, params = [], []
+        if name is not None:
+            clauses.append("name = ?")
+            params.append(name)
+        if exit_code is not None:
+            clauses.append("exit_code = ?")
+            params.append(exit_code)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
@@ -0,0 +1,341 @@
+"""Streaming import and export of command libraries.
+
+Supported formats: "json" (the commands.json layout, {name: details}, or
+a list of objects with a "name" field), "ndjson" (one such object per
+line), and the shell histories "bash" (~/.bash_history, with or without
+HISTTIMEFORMAT timestamps) and "zsh" (plain or extended history). Any of
+them may be gzip-compressed. Files are read incrementally, so memory use
+follows the number of imported commands, not the file size.
+"""
+import gzip
+import json
+import os
+import re
+
+FORMATS = ('json', 'ndjson', 'bash', 'zsh')
+CONFLICT_POLICIES = ('skip', 'overwrite', 'rename')
+READ_SIZE = 64 * 1024
+MAX_NAME_LENGTH = 200
+# Per-field type and check; fields not listed are kept as they are.
+SCHEMA = {
+    'command': (str, lambda value: value.strip() != "", "must not be empty"),
+    'description': (str, None, None),
+    'category': (str, None, None),
+    'interval': ((int, float), lambda value: value >= 0, "must not be negative"),
+    'count': (int, lambda value: value >= 1, "must be at least 1"),
+    'timeout': ((int, float), lambda value: value >= 0, "must not be negative"),
+    'tags': ((list, str), None, None),
+    'cache_ttl': ((int, float), lambda value: value >= 0, "must not be negative"),
+    'cache_keys': ((list, str), None, None),
+}
+HISTORY_CATEGORY = 'Shell History'
+ZSH_EXTENDED_RE = re.compile(r': \d+:\d+;(.*)', re.DOTALL)
+
+
+class ImportReport:
+    """Counts of what an import did, plus the first few validation errors."""
+
+    MAX_ERRORS = 20
+
+    def __init__(self):
+        self.added = 0
+        self.overwritten = 0
+        self.renamed = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.errors = []
+
+    def error(self, message):
+        self.invalid += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append(message)
+
+    def __str__(self):
+        return (f"{self.added} added, {self.overwritten} overwritten, {self.renamed} renamed, "
+                f"{self.skipped} skipped, {self.invalid} invalid")
+
+
+def open_text(path, mode='r', compressed=None):
+    """Open path as text, gzip-(de)compressed when it is (or, for writing, is named) .gz."""
+    if compressed is None and mode == 'r':
+        with open(path, 'rb') as probe:
+            compressed = probe.read(2) == b'\x1f\x8b'
+    elif compressed is None:
+        compressed = path.endswith('.gz')
+    if compressed:
+        return gzip.open(path, mode + 't', encoding='utf-8', errors='replace')
+    return open(path, mode, encoding='utf-8', errors='replace')
+
+
+def detect_format(path):
+    base = os.path.basename(path)
+    if base.endswith('.gz'):
+        base = base[:-3]
+    if 'zsh_history' in base or base == '.histfile':
+        return 'zsh'
+    if 'bash_history' in base or base == '.history':
+        return 'bash'
+    if base.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'json'
+
+
+def validate(name, details):
+    """Return a cleaned copy of details, or raise ValueError."""
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("name must be a non-empty string")
+    if len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f"name is longer than {MAX_NAME_LENGTH} characters")
+    if not isinstance(details, dict):
+        raise ValueError("details must be an object")
+    if 'command' not in details:
+        raise ValueError("missing 'command'")
+    cleaned = dict(details)
+    for field, (types, check, problem) in SCHEMA.items():
+        if field not in cleaned:
+            continue
+        value = cleaned[field]
+        if not isinstance(value, types) or isinstance(value, bool):
+            raise ValueError(f"'{field}' has the wrong type")
+        if check and not check(value):
+            raise ValueError(f"'{field}' {problem}")
+    return cleaned
+
+
+def iter_json(file):
+    """Yield (name, details) from a JSON object or array read incrementally.
+
+    This is a small ijson-style reader: the file is read in READ_SIZE
+    chunks and each member is decoded with JSONDecoder.raw_decode as soon
+    as it is complete, so the whole document is never held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, position, eof
+        data = file.read(READ_SIZE)
+        if not data:
+            eof = True
+        buffer = buffer[position:] + data
+        position = 0
+
+    def skip(separators=" \t\r\n"):
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in separators:
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            fill()
+
+    def value():
+        nonlocal position
+        while True:
+            try:
+                result, end = decoder.raw_decode(buffer, position)
+            except ValueError as e:
+                if eof:
+                    # Offsets within the buffer mean nothing to the user.
+                    raise ValueError(f"invalid JSON: {e.msg}") from None
+                fill()
+                continue
+            if end == len(buffer) and not eof:
+                # A number may continue in the next chunk.
+                fill()
+                continue
+            position = end
+            return result
+
+    def expect(char):
+        nonlocal position
+        skip()
+        if position >= len(buffer) or buffer[position] != char:
+            raise ValueError(f"expected '{char}' at offset {position}")
+        position += 1
+
+    skip()
+    if position >= len(buffer):
+        return
+    opener = buffer[position]
+    if opener not in '{[':
+        raise ValueError("expected a JSON object or array")
+    position += 1
+    closer = '}' if opener == '{' else ']'
+    while True:
+        skip(" \t\r\n,")
+        if position >= len(buffer):
+            raise ValueError("unexpected end of file")
+        if buffer[position] == closer:
+            position += 1
+            skip()
+            if position < len(buffer):
+                raise ValueError("unexpected data after the end of the document")
+            return
+        if opener == '{':
+            name = value()
+            expect(':')
+            skip()
+            yield name, value()
+        else:
+            yield from split_entry(value())
+
+
+def split_entry(entry):
+    """Turn {"name": ..., **details} or {name: details} into (name, details) pairs."""
+    if isinstance(entry, dict) and 'name' in entry and 'command' in entry:
+        details = dict(entry)
+        yield details.pop('name'), details
+    elif isinstance(entry, dict):
+        yield from entry.items()
+    else:
+        yield None, entry
+
+
+def iter_ndjson(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield from split_entry(json.loads(line))
+
+
+def iter_bash_history(file):
+    """Yield commands from a bash history file, skipping '#<epoch>' lines."""
+    for line in file:
+        line = line.rstrip('\n')
+        if not line.strip() or (line.startswith('#') and line[1:].isdigit()):
+            continue
+        yield line
+
+
+def iter_zsh_history(file):
+    """Yield commands from a zsh history file; multi-line entries end in a backslash."""
+    pending = []
+    for line in file:
+        line = line.rstrip('\n')
+        if line.endswith('\\'):
+            pending.append(line[:-1])
+            continue
+        pending.append(line)
+        entry = "\n".join(pending)
+        pending = []
+        match = ZSH_EXTENDED_RE.match(entry)
+        command = match.group(1) if match else entry
+        if command.strip():
+            yield command
+    if pending:
+        yield "\n".join(pending)
+
+
+def history_entries(commands, source, min_uses=1):
+    """Turn shell commands into (name, details), most used first, one per distinct command."""
+    uses = {}
+    for command in commands:
+        command = command.strip()
+        uses[command] = uses.get(command, 0) + 1
+    names = {}
+    for command, count in sorted(uses.items(), key=lambda item: -item[1]):
+        if count < min_uses:
+            continue
+        words = [word.strip('-.') for word in re.findall(r'[\w.-]+', command)]
+        words = [word for word in words if word][:3]
+        name = "-".join(words)[:60] or "command"
+        # Different commands often share their first words.
+        names[name] = names.get(name, 0) + 1
+        if names[name] > 1:
+            name = f"{name}-{names[name]}"
+        yield name, {"command": command, "description": f"Imported from {source} ({count} uses)",
+                     "category": HISTORY_CATEGORY}
+
+
+def read_entries(path, fmt=None, min_uses=1):
+    """Yield (name, details) pairs from path without validating them."""
+    fmt = fmt or detect_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'")
+    with open_text(path) as file:
+        if fmt == 'json':
+            yield from iter_json(file)
+        elif fmt == 'ndjson':
+            yield from iter_ndjson(file)
+        else:
+            commands = iter_bash_history(file) if fmt == 'bash' else iter_zsh_history(file)
+            yield from history_entries(commands, os.path.basename(path), min_uses)
+
+
+def unique_name(name, *taken):
+    counter = 2
+    while any(f"{name} ({counter})" in names for names in taken):
+        counter += 1
+    return f"{name} ({counter})"
+
+
+def plan_import(commands, path, fmt=None, on_conflict='skip', category=None, min_uses=1):
+    """Validate path against commands; returns (puts, report) without changing anything.
+
+    on_conflict decides what happens to names that already exist, or that
+    appear twice in the file: 'skip' keeps the existing command,
+    'overwrite' replaces it and 'rename' imports under "name (2)" and so
+    on. category, if given, is set on every imported command.
+    """
+    if on_conflict not in CONFLICT_POLICIES:
+        raise ValueError(f"on_conflict must be one of {', '.join(CONFLICT_POLICIES)}")
+    report = ImportReport()
+    puts = {}
+    for number, (name, details) in enumerate(read_entries(path, fmt, min_uses), 1):
+        try:
+            details = validate(name, details)
+        except ValueError as e:
+            report.error(f"entry {number} ({name!r}): {e}")
+            continue
+        if category:
+            details['category'] = category
+        if name not in commands and name not in puts:
+            report.added += 1
+        elif on_conflict == 'skip':
+            report.skipped += 1
+            continue
+        elif on_conflict == 'overwrite':
+            # A name repeated within the file: the last entry wins.
+            if name not in puts:
+                report.overwritten += 1
+        elif commands.get(name) == details or puts.get(name) == details:
+            # Renaming an identical command would only make a copy.
+            report.skipped += 1
+            continue
+        else:
+            name = unique_name(name, commands, puts)
+            report.renamed += 1
+        puts[name] = details
+    return puts, report
+
+
+def import_file(store, path, fmt=None, on_conflict='skip', category=None, min_uses=1, dry_run=False):
+    """Import path into store as one batch; returns an ImportReport. See plan_import."""
+    puts, report = plan_import(store.commands, path, fmt, on_conflict, category, min_uses)
+    if puts and not dry_run:
+        store.batch(puts=puts)
+    return report
+
+
+def export_file(commands, path, fmt=None, names=None):
+    """Write commands (or only names) to path one entry at a time; returns the count."""
+    fmt = fmt or detect_format(path)
+    if fmt not in ('json', 'ndjson'):
+        raise ValueError("Commands can only be exported as json or ndjson")
+    count = 0
+    tmp_path = path + '.tmp'
+    with open_text(tmp_path, 'w', compressed=path.endswith('.gz')) as file:
+        if fmt == 'json':
+            file.write("{")
+        for name in (names if names is not None else commands):
+            details = commands[name]
+            if fmt == 'json':
+                file.write(f"{',' if count else ''}\n    {json.dumps(name)}: {json.dumps(details)}")
+            else:
+                file.write(json.dumps({"name": name, **details}) + "\n")
+            count += 1
+        if fmt == 'json':
+            file.write("\n}\n")
+    os.replace(tmp_path, path)
+    return count
@@ -0,0 +1,98 @@
+"""Per-command run statistics and a Prometheus text exposition of them."""
+import time
+
+QUANTILES = {'0.5': 'p50', '0.95': 'p95'}
+
+
+def percentile(values, fraction):
+    """Linear-interpolated percentile of values; None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def command_stats(runs):
+    """Summarize history runs (HistoryStore.metrics rows) per command name."""
+    grouped = {}
+    for run in runs:
+        grouped.setdefault(run['name'], []).append(run)
+    stats = {}
+    for name, entries in grouped.items():
+        durations = [entry['duration'] for entry in entries]
+        cpu = [(entry['cpu_user'] or 0) + (entry['cpu_sys'] or 0)
+               for entry in entries if entry['cpu_user'] is not None]
+        rss = [entry['max_rss'] for entry in entries if entry['max_rss'] is not None]
+        stats[name] = {
+            'runs': len(entries),
+            'failures': sum(1 for entry in entries if entry['exit_code']),
+            'p50': percentile(durations, 0.5),
+            'p95': percentile(durations, 0.95),
+            'total_duration': sum(durations),
+            'cpu': sum(cpu) if cpu else None,
+            'max_rss': max(rss) if rss else None,
+            'last_run': entries[-1]['timestamp'],
+        }
+    return stats
+
+
+def daily_trend(runs):
+    """Return [(YYYY-MM-DD, runs, p50, p95)] for runs, oldest day first."""
+    days = {}
+    for run in runs:
+        day = time.strftime("%Y-%m-%d", time.localtime(run['timestamp']))
+        days.setdefault(day, []).append(run['duration'])
+    return [(day, len(durations), percentile(durations, 0.5), percentile(durations, 0.95))
+            for day, durations in sorted(days.items())]
+
+
+def format_seconds(value):
+    if value is None:
+        return "-"
+    return f"{value * 1000:.0f}ms" if value < 1 else f"{value:.2f}s"
+
+
+def format_rss(kib):
+    if kib is None:
+        return "-"
+    return f"{kib / 1024:.1f} MiB"
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def prometheus_text(runs):
+    """Render history runs in the Prometheus text exposition format.
+
+    Durations are exported as a summary with p50/p95 quantiles, together
+    with run and failure counters, total CPU seconds and peak RSS per
+    command.
+    """
+    stats = command_stats(runs)
+    lines = []
+
+    def family(metric, kind, help_text, samples):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, suffix, extra, value in samples:
+            labels = f'command="{escape_label(name)}"' + extra
+            lines.append(f"{metric}{suffix}{{{labels}}} {value}")
+
+    by_name = sorted(stats.items())
+    family('cst_command_duration_seconds', 'summary', "Wall time of command runs.",
+           [(name, '', f',quantile="{q}"', entry[key]) for name, entry in by_name
+            for q, key in QUANTILES.items()]
+           + [(name, '_sum', '', entry['total_duration']) for name, entry in by_name]
+           + [(name, '_count', '', entry['runs']) for name, entry in by_name])
+    family('cst_command_failures_total', 'counter', "Runs that exited with a non-zero status.",
+           [(name, '', '', entry['failures']) for name, entry in by_name])
+    family('cst_command_cpu_seconds_total', 'counter', "User plus system CPU time of command runs.",
+           [(name, '', '', entry['cpu']) for name, entry in by_name if entry['cpu'] is not None])
+    family('cst_command_max_rss_bytes', 'gauge', "Peak resident set size of any run, sampled while it runs.",
+           [(name, '', '', entry['max_rss'] * 1024) for name, entry in by_name
+            if entry['max_rss'] is not None])
+    return "\n".join(lines) + "\n"
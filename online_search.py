@@ -0,0 +1,182 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_BASE_URL = "https://www.commandlinefu.com"
+
+
+def encode_query(query):
+    """Encode the query in the base64 format the commandlinefu API expects."""
+    return base64.urlsafe_b64encode(query.encode()).decode()
+
+
+def parse_html(text):
+    """Extract commands from a commandlinefu HTML results page."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(text, 'html.parser')
+    commands = []
+    for elem in soup.find_all('div', class_='command'):
+        command_text_elem = elem.find('pre', class_='command')
+        summary_text_elem = elem.find('div', class_='description')
+        if command_text_elem and summary_text_elem:
+            commands.append({'command': command_text_elem.text.strip(),
+                             'summary': summary_text_elem.text.strip()})
+    return commands
+
+
+class ResponseCache:
+    """On-disk cache of search results with a TTL and LRU eviction.
+
+    Each entry is one JSON file named after the base64 query; reading an
+    entry touches its mtime, so the least recently used files are the
+    ones removed once max_entries is exceeded.
+    """
+
+    def __init__(self, directory='online_cache', ttl=24 * 3600, max_entries=500):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get('created', 0) > self.ttl:
+            self._remove(path)
+            return None
+        os.utime(path)
+        return entry['commands']
+
+    def put(self, key, commands):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({'created': time.time(), 'commands': commands}, file)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            self._remove(entry.path)
+
+    def _path(self, key):
+        if len(key) > 200:
+            key = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, key + '.json')
+
+    def _evict(self):
+        with self.lock:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+            if len(entries) <= self.max_entries:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - self.max_entries]:
+                self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class OnlineSearchClient:
+    """commandlinefu search client for use from the GUI.
+
+    Requests go through one pooled requests.Session with timeouts and
+    retries, and results are cached on disk by their base64 query.
+    search_async runs lookups on a background thread; starting a new
+    search makes every older one stale, so a stale result is dropped
+    instead of being delivered.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, cache=None, timeout=(3.05, 10), retries=2):
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache if cache is not None else ResponseCache()
+        self.timeout = timeout
+        self.retries = retries
+        self.session = None
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.lock = threading.Lock()
+        self.generation = 0
+
+    def search(self, query):
+        """Return a list of {'command', 'summary'} dicts for query."""
+        key = encode_query(query)
+        commands = self.cache.get(key) if self.cache else None
+        if commands is not None:
+            return commands
+
+        api_url = f"{self.base_url}/commands/matching/{quote(query, safe='')}/{key}/json"
+        response = self._session().get(api_url, timeout=self.timeout)
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        if 'application/json' in response.headers.get('Content-Type', ''):
+            commands = [{'command': cmd['command'], 'summary': cmd.get('summary', '')}
+                        for cmd in response.json()]
+        else:
+            commands = parse_html(response.text)
+        if self.cache:
+            self.cache.put(key, commands)
+        return commands
+
+    def search_async(self, query, callback, errback=None):
+        """Search on a worker thread, calling callback(commands) unless superseded.
+
+        Both callbacks run on the worker thread.
+        """
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+
+        def job():
+            if generation != self.generation:
+                return
+            try:
+                commands = self.search(query)
+            except Exception as e:
+                if errback and generation == self.generation:
+                    errback(e)
+                return
+            if generation == self.generation:
+                callback(commands)
+
+        return self.executor.submit(job)
+
+    def cancel(self):
+        """Make any in-flight search stale."""
+        with self.lock:
+            self.generation += 1
+
+    def close(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
+        if self.session:
+            self.session.close()
+
+    def _session(self):
+        with self.lock:
+            if self.session is None:
+                retry = Retry(total=self.retries, backoff_factor=0.3,
+                              status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=("GET",))
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=retry)
+                self.session = requests.Session()
+                self.session.mount('http://', adapter)
+                self.session.mount('https://', adapter)
+            return self.session
@@ -0,0 +1,90 @@
+import difflib
+import hashlib
+
+# Outputs with more lines than this are not diffed (SequenceMatcher is
+# quadratic in the worst case); they are still deduplicated as chunks.
+MAX_DELTA_LINES = 20000
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def line_delta(previous, current):
+    """Return the replace ops that turn previous into current, by line."""
+    old, new = previous.splitlines(True), current.splitlines(True)
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    return [[i1, i2, new[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def apply_delta(previous, ops):
+    old = previous.splitlines(True)
+    lines, position = [], 0
+    for i1, i2, replacement in ops:
+        lines.extend(old[position:i1])
+        lines.extend(replacement)
+        position = i2
+    lines.extend(old[position:])
+    return "".join(lines)
+
+
+def unified_diff(previous, current, from_label='previous', to_label='current'):
+    return "".join(difflib.unified_diff(previous.splitlines(True), current.splitlines(True),
+                                        from_label, to_label))
+
+
+class OutputLog:
+    """The outputs of a repeated run, stored by what changed.
+
+    Each iteration is either a content-addressed chunk, shared by every
+    iteration with the same text, or a line delta against the iteration
+    before it, whichever is smaller. A polling command that prints
+    the same thing, or nearly the same thing, every time grows the log
+    by the change only. It behaves like a read-only list of strings
+    with append.
+    """
+
+    def __init__(self, outputs=(), entries=None, chunks=None):
+        self.entries = entries if entries is not None else []
+        self.chunks = chunks if chunks is not None else {}
+        self.last = self[-1] if self.entries else None
+        for output in outputs:
+            self.append(output)
+
+    def append(self, text):
+        previous = self.last
+        self.last = text
+        if previous is not None:
+            if text == previous:
+                self.entries.append(['d', []])
+                return
+            if previous.count("\n") < MAX_DELTA_LINES and text.count("\n") < MAX_DELTA_LINES:
+                ops = line_delta(previous, text)
+                if sum(len(line) for _, _, lines in ops for line in lines) < len(text) // 2:
+                    self.entries.append(['d', ops])
+                    return
+        digest = chunk_hash(text)
+        self.chunks.setdefault(digest, text)
+        self.entries.append(['c', digest])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        text = None
+        for kind, value in self.entries:
+            text = self.chunks[value] if kind == 'c' else apply_delta(text, value)
+            yield text
+
+    def __getitem__(self, index):
+        index = range(len(self.entries))[index]
+        start = index
+        while self.entries[start][0] != 'c':
+            start -= 1
+        text = self.chunks[self.entries[start][1]]
+        for kind, value in self.entries[start + 1:index + 1]:
+            text = apply_delta(text, value)
+        return text
+
+    def __bool__(self):
+        return bool(self.entries)
@@ -0,0 +1,148 @@
+"""Run a stored command on many hosts over multiplexed SSH connections.
+
+hosts.json is the inventory. It maps group names to lists of SSH
+destinations:
+
+    {"web": ["web1.example.com", "deploy@web2"], "db": ["ssh://db1:2222"]}
+"""
+import json
+import os
+import shlex
+import tempfile
+import threading
+
+# One master connection per host is opened on first use and kept for
+# CONTROL_PERSIST seconds, so later runs skip the SSH handshake.
+CONTROL_PERSIST = 300
+SSH_OPTIONS = ('-o', 'BatchMode=yes', '-o', 'ConnectTimeout=10', '-o', 'ControlMaster=auto',
+               '-o', f'ControlPersist={CONTROL_PERSIST}')
+DEFAULT_PARALLEL = 32
+# The "local" transport runs commands on this machine, with CST_HOST set
+# to the target. It stands in for real hosts when testing inventories.
+LOCAL = 'local'
+
+
+def load_inventory(path='hosts.json'):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def resolve_hosts(inventory, targets):
+    """Expand group names, 'all' and plain hosts into a list without duplicates."""
+    hosts = []
+    for target in targets:
+        if target == 'all':
+            members = [host for group in inventory.values() for host in group]
+        else:
+            members = inventory.get(target, [target])
+        for host in members:
+            if host not in hosts:
+                hosts.append(host)
+    return hosts
+
+
+def control_dir():
+    """Directory for the ControlMaster sockets; socket paths must stay short."""
+    path = os.path.join(tempfile.gettempdir(), f"cst-ssh-{os.getuid() if hasattr(os, 'getuid') else 0}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+
+class FanOut:
+    """A stored command running on a set of hosts; returned by RemoteRunner.run."""
+
+    def __init__(self, name, hosts):
+        self.name = name
+        self.hosts = hosts
+        self.runs = {}
+        self.finished = 0
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        if not hosts:
+            self.done.set()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def failed(self):
+        """Hosts whose run did not exit with status 0."""
+        return [host for host, run in self.runs.items() if run.returncode != 0]
+
+
+class RemoteRunner:
+    """Fans a stored command out to inventory hosts.
+
+    Every host gets its own run on a dedicated CommandExecutor of
+    max_parallel workers, so a slow host only holds one slot. SSH runs
+    with ControlMaster/ControlPersist, so repeated runs against the same
+    hosts reuse one connection per host. ssh_command defaults to $CST_SSH
+    or "ssh". It may name any wrapper that takes ssh-style arguments, or
+    "local". Each host's run is recorded in history as "<command>@<host>".
+    """
+
+    def __init__(self, core, inventory_path='hosts.json', ssh_command=None, max_parallel=DEFAULT_PARALLEL):
+        self.core = core
+        self.inventory_path = inventory_path
+        self.ssh_command = shlex.split(ssh_command or os.environ.get('CST_SSH', 'ssh'))
+        self.max_parallel = max_parallel
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            from executor import CommandExecutor
+
+            self._executor = CommandExecutor(self.max_parallel)
+        return self._executor
+
+    def inventory(self):
+        return load_inventory(self.inventory_path)
+
+    def remote_command(self, host, command):
+        """Return the local shell command line that runs command on host."""
+        if self.ssh_command == [LOCAL]:
+            return f"export CST_HOST={shlex.quote(host)}; {command}"
+        options = SSH_OPTIONS + ('-o', f"ControlPath={os.path.join(control_dir(), '%C')}")
+        return shlex.join(self.ssh_command + list(options) + [host, command])
+
+    def run(self, name, targets, on_host_done=None, **options):
+        """Start stored command name on the hosts targets resolve to.
+
+        on_host_done(fan_out, host, run) is called as each host finishes;
+        other options (on_line, on_output, timeout, ...) go to every run.
+        """
+        command = self.core.commands[name]
+        options.setdefault('timeout', command.get('timeout'))
+        fan_out = FanOut(name, resolve_hosts(self.inventory(), targets))
+
+        def finished(run):
+            host = run.name[len(name) + 1:]
+            if not run.cancelled or run.iteration:
+                self.core.history.add_run(run.name, command['command'], run.outputs, run.returncode,
+                                          metrics=run.metrics)
+            with fan_out.lock:
+                fan_out.finished += 1
+                complete = fan_out.finished == len(fan_out.hosts)
+            try:
+                if on_host_done:
+                    on_host_done(fan_out, host, run)
+            finally:
+                if complete:
+                    fan_out.done.set()
+
+        for host in fan_out.hosts:
+            fan_out.runs[host] = self.executor.submit(
+                f"{name}@{host}", self.remote_command(host, command['command']),
+                command.get('count', 1), command.get('interval', 0), on_done=finished, **options)
+        return fan_out
+
+    def cancel(self, fan_out):
+        for run in list(fan_out.runs.values()):
+            self.executor.cancel(run)
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown()
@@ -0,0 +1,134 @@
+"""Opt-in result cache for idempotent stored commands.
+
+A command opts in with "cache_ttl" (seconds). Its "cache_keys" may list
+invalidation keys: "file:/etc/hosts" changes when the file's mtime or size
+changes, "env:KUBECONFIG" when the variable does; other keys are
+ignored. Only successful runs are cached, and the cache lives in memory
+for the life of the process.
+"""
+import collections
+import os
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+def cache_keys_of(details):
+    """Return a command's invalidation keys; accepts a list or a comma-separated string."""
+    keys = details.get('cache_keys') or []
+    if isinstance(keys, str):
+        keys = keys.split(',')
+    return tuple(key.strip() for key in keys if key.strip())
+
+
+def fingerprint(keys):
+    """The current state of the invalidation keys."""
+    state = []
+    for key in keys:
+        kind, _, value = key.partition(':')
+        if kind == 'file':
+            try:
+                stat = os.stat(os.path.expanduser(value))
+                state.append((key, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                state.append((key, None, None))
+        elif kind == 'env':
+            state.append((key, os.environ.get(value)))
+    return tuple(state)
+
+
+def invalid_cache_keys(keys):
+    """Keys that are not of the form file:PATH or env:NAME."""
+    invalid = []
+    for key in keys:
+        kind, _, value = key.partition(':')
+        if kind not in ('file', 'env') or not value:
+            invalid.append(key)
+    return invalid
+
+
+class CachedCommand:
+    """A stored command bound to the cache; the cache argument of CommandExecutor.submit."""
+
+    def __init__(self, cache, command, ttl, keys):
+        self.cache = cache
+        self.command = command
+        self.ttl = ttl
+        self.keys = keys
+        self.state = None
+
+    def get(self):
+        """Return (returncode, output, age) of a fresh result, or None."""
+        # The state is taken before the run, so a key that changes while
+        # the command runs invalidates what it produced.
+        self.state = fingerprint(self.keys)
+        return self.cache.get(self.command, self.ttl, self.state)
+
+    def put(self, returncode, output):
+        self.cache.put(self.command, self.state, returncode, output)
+
+
+class ResultCache:
+    """LRU cache of command outputs, bounded by entry count and total output size.
+
+    Entries are keyed by the command line and the state of its
+    invalidation keys, so editing the command or touching a key file
+    misses the cache without any explicit invalidation.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def for_command(self, details):
+        """Return a CachedCommand for details, or None if it does not opt in."""
+        ttl = details.get('cache_ttl')
+        if not ttl or ttl <= 0:
+            return None
+        return CachedCommand(self, details['command'], ttl, cache_keys_of(details))
+
+    def get(self, command, ttl, state=()):
+        """state is the fingerprint() of the command's invalidation keys."""
+        key = (command, state)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                stored_at, returncode, output = entry
+                age = time.monotonic() - stored_at
+                if age <= ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return returncode, output, age
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, command, state, returncode, output):
+        if len(output) > self.max_bytes:
+            return
+        key = (command, state)
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (time.monotonic(), returncode, output)
+            self.size += len(output)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _drop(self, key):
+        self.size -= len(self.entries.pop(key)[2])
@@ -0,0 +1,262 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+DEFAULT_MAX_OUTPUT = 1024 * 1024
+STREAM_LIMIT = 64 * 1024
+# How often the memory of a running command is sampled from /proc.
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def terminate(process, sig=signal.SIGTERM):
+    """Signal a shell process together with the children it spawned."""
+    try:
+        if os.name == 'posix':
+            os.killpg(process.pid, sig)
+        else:
+            process.terminate()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class RunResult:
+    """Outcome and resource usage of a single streamed command execution.
+
+    started and finished are time.monotonic() readings. cpu_user and
+    cpu_sys (seconds) come from the child's rusage and stay None where
+    wait4 is not available. max_rss (KiB) is sampled by RssSampler and
+    stays None where /proc is missing or the command ended before the
+    first sample.
+    """
+
+    def __init__(self):
+        self.returncode = None
+        self.output = ""
+        self.truncated = False
+        self.timed_out = False
+        self.started_at = time.time()
+        self.started = time.monotonic()
+        self.finished = None
+        self.cpu_user = None
+        self.cpu_sys = None
+        self.max_rss = None
+
+    @property
+    def duration(self):
+        return None if self.finished is None else self.finished - self.started
+
+    def metrics(self):
+        return {'started_at': self.started_at, 'duration': self.duration,
+                'exit_code': self.returncode, 'cpu_user': self.cpu_user,
+                'cpu_sys': self.cpu_sys, 'max_rss': self.max_rss}
+
+
+async def stream_command(command, on_line=None, timeout=None, max_output=DEFAULT_MAX_OUTPUT,
+                         on_start=None):
+    """Run a shell command, passing stdout/stderr lines to on_line as they arrive.
+
+    on_line(text, stream_name) receives whole lines; lines that arrive
+    together are passed in one call. It is called from the reader, so
+    a slow consumer stops the pipes from being drained and the child blocks
+    on write instead of output piling up here. At most max_output bytes are
+    kept in the returned result; the rest is still streamed to on_line.
+    """
+    result = RunResult()
+    if hasattr(os, 'wait4'):
+        process, stdout, stderr, transports = await spawn_with_rusage(command)
+    else:
+        process = await asyncio.create_subprocess_shell(
+            command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LIMIT)
+        stdout, stderr, transports = process.stdout, process.stderr, []
+    sampler = RssSampler(process.pid)
+    if on_start:
+        on_start(process)
+    kept = []
+    kept_size = 0
+
+    def keep(data, stream_name):
+        nonlocal kept_size
+        piece = data[:max(max_output - kept_size, 0)]
+        if piece:
+            kept.append(piece)
+            kept_size += len(piece)
+        if len(piece) < len(data):
+            result.truncated = True
+        if on_line:
+            on_line(data.decode(errors='replace'), stream_name)
+
+    async def pump(stream, stream_name):
+        pending = b""
+        while True:
+            data = await stream.read(STREAM_LIMIT)
+            if not data:
+                if pending:
+                    keep(pending, stream_name)
+                return
+            data = pending + data
+            cut = data.rfind(b"\n") + 1
+            if not cut:
+                if len(data) < STREAM_LIMIT:
+                    pending = data
+                    continue
+                # An over-long line is handed on in STREAM_LIMIT pieces.
+                cut = len(data)
+            pending = data[cut:]
+            keep(data[:cut], stream_name)
+
+    # One deadline covers the whole run: a command can close its pipes
+    # long before it exits.
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout else None
+
+    async def within_deadline(awaitable):
+        remaining = None if deadline is None else max(deadline - loop.time(), 0)
+        try:
+            await asyncio.wait_for(asyncio.shield(awaitable), remaining)
+        except asyncio.TimeoutError:
+            result.timed_out = True
+            terminate(process, getattr(signal, 'SIGKILL', signal.SIGTERM))
+            await awaitable
+
+    readers = asyncio.gather(pump(stdout, 'stdout'), pump(stderr, 'stderr'))
+    try:
+        await within_deadline(readers)
+    finally:
+        for transport in transports:
+            transport.close()
+    if transports:
+        waiter = loop.run_in_executor(None, reap, process, result)
+    else:
+        waiter = asyncio.ensure_future(process.wait())
+    await within_deadline(waiter)
+    if not transports:
+        result.returncode = waiter.result()
+    result.max_rss = sampler.stop()
+    result.finished = time.monotonic()
+
+    result.output = b"".join(kept).decode(errors='replace')
+    if result.truncated:
+        result.output += f"\n[output truncated at {max_output} bytes]\n"
+    if result.timed_out:
+        result.output += f"\n[timed out after {timeout}s]\n"
+    return result
+
+
+async def spawn_with_rusage(command):
+    """Start command with subprocess.Popen and attach its pipes to the loop.
+
+    asyncio's own subprocess support reaps the child itself and discards
+    its rusage, so the child is started directly and reaped with os.wait4
+    by reap() instead.
+    """
+    loop = asyncio.get_running_loop()
+    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, start_new_session=True)
+    readers, transports = [], []
+    for pipe in (process.stdout, process.stderr):
+        reader = asyncio.StreamReader(limit=STREAM_LIMIT, loop=loop)
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader, loop=loop), pipe)
+        readers.append(reader)
+        transports.append(transport)
+    return process, readers[0], readers[1], transports
+
+
+def _own_cmdline():
+    try:
+        with open('/proc/self/cmdline', 'rb') as file:
+            return file.read()
+    except OSError:
+        return None
+
+
+OWN_CMDLINE = _own_cmdline()
+
+
+def _process_tree(pid):
+    """pid and its descendants, as far as /proc lists their children."""
+    pids, found = [pid], 0
+    while found < len(pids):
+        current = pids[found]
+        found += 1
+        try:
+            for tid in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{tid}/children') as file:
+                    pids.extend(int(child) for child in file.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def _peak_rss(pid):
+    """VmHWM of pid in KiB, or None before it has exec'd or once it has exited."""
+    try:
+        # Until exec a freshly forked child still shows this process's
+        # arguments and memory.
+        with open(f'/proc/{pid}/cmdline', 'rb') as file:
+            if file.read() == OWN_CMDLINE:
+                return None
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class RssSampler:
+    """Peak resident memory of a running command tree, sampled from /proc.
+
+    The rusage that wait4 returns cannot be used: ru_maxrss keeps the
+    high-water mark of the memory the child inherited from this process
+    across exec, so it reports the size of the tool rather than of the
+    command. Instead the VmHWM of the command and its descendants is
+    summed every interval seconds; peak is the largest sum seen, in KiB.
+    Peaks between the last sample and exit are missed.
+    """
+
+    supported = os.path.isdir('/proc/self/task')
+
+    def __init__(self, pid, interval=RSS_SAMPLE_INTERVAL):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self.stopped = threading.Event()
+        self.thread = None
+        if self.supported:
+            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stop sampling and return the peak."""
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        return self.peak
+
+    def _loop(self):
+        while True:
+            peaks = [peak for peak in map(_peak_rss, _process_tree(self.pid)) if peak is not None]
+            if peaks and (self.peak is None or sum(peaks) > self.peak):
+                self.peak = sum(peaks)
+            if self.stopped.wait(self.interval):
+                return
+
+
+def reap(process, result):
+    """Wait for process with os.wait4 and record its exit status and rusage."""
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = result.returncode = os.waitstatus_to_exitcode(status)
+    result.cpu_user = usage.ru_utime
+    result.cpu_sys = usage.ru_stime
+
+
+def run_command(command, on_line=None, timeout=None, max_output=DEFAULT_MAX_OUTPUT, on_start=None):
+    """Blocking wrapper around stream_command for use from worker threads."""
+    return asyncio.run(stream_command(command, on_line, timeout, max_output, on_start))
@@ -0,0 +1,241 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+from command_store import FileLock
+from cron import CronExpression
+
+CATCH_UP_POLICIES = ('skip', 'once', 'all')
+# How often a sleeping scheduler checks schedules.json for outside changes.
+WATCH_INTERVAL = 5.0
+# Run times are written back at most this often, and on stop.
+SAVE_INTERVAL = 30.0
+INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_schedule(spec):
+    """Turn 'HH:MM', an interval such as '90s'/'15m', or a cron expression into job fields."""
+    spec = spec.strip()
+    match = re.fullmatch(r'(\d{1,2}):(\d{2})', spec)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour > 23 or minute > 59:
+            raise ValueError(f"Invalid time '{spec}'")
+        return {"cron": f"{minute} {hour} * * *"}
+    match = re.fullmatch(r'(\d+)([smhd]?)', spec)
+    if match:
+        seconds = int(match.group(1)) * INTERVAL_UNITS[match.group(2) or 's']
+        if seconds <= 0:
+            raise ValueError("Interval must be positive")
+        return {"interval": seconds}
+    CronExpression(spec).next_after(time.time())
+    return {"cron": spec}
+
+
+def describe(job):
+    if "interval" in job:
+        return f"every {job['interval']}s"
+    return f"cron {job['cron']}"
+
+
+class Scheduler:
+    """Cron and interval schedules for stored commands on a timer heap.
+
+    Jobs live in schedules.json together with their last run time, so
+    they survive restarts and a job added from the CLI reaches a running
+    daemon. The run loop sleeps until the earliest due job instead of
+    polling, and heap updates keep adding, firing and removing jobs at
+    O(log n) for large schedule sets.
+
+    Runs missed while nothing was running are handled by catch_up:
+    'skip' waits for the next regular time, 'once' runs the job once on
+    startup, and 'all' replays every missed run.
+
+    Only one process fires jobs: the run loop holds an flock on
+    schedules.json.lock, and the others keep watching the file and take
+    over when the owner exits.
+    """
+
+    def __init__(self, path='schedules.json', catch_up='once'):
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"catch_up must be one of {', '.join(CATCH_UP_POLICIES)}")
+        self.path = path
+        self.catch_up = catch_up
+        self.jobs = {}
+        self.triggers = {}
+        self.heap = []
+        self.due = {}
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.loaded_mtime = None
+        self.dirty = False
+        self.last_save = time.monotonic()
+        self.thread = None
+        self.stopped = False
+        self.owner_lock = FileLock(path + '.lock')
+        self.owner = False
+        self.load()
+
+    def load(self):
+        """(Re)read schedules.json and rebuild the timer heap."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, 'r') as file:
+                stored = json.load(file)
+        except FileNotFoundError:
+            mtime, stored = None, []
+        now = time.time()
+        with self.condition:
+            previous = self.jobs
+            self.jobs, self.triggers, self.due, self.heap = {}, {}, {}, []
+            for job in stored:
+                if "at" in job:
+                    # Schedules written before cron support were daily HH:MM.
+                    job.update(parse_schedule(job.pop("at")))
+                job.setdefault("id", uuid.uuid4().hex[:8])
+                job.setdefault("created", now)
+                old = previous.get(job["id"])
+                if old and (old.get("last_run") or 0) > (job.get("last_run") or 0):
+                    # A run this process has not written back yet.
+                    job["last_run"] = old["last_run"]
+                self._add(job, now)
+            self.loaded_mtime = mtime
+            self.condition.notify_all()
+
+    def save(self):
+        with self.condition:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as file:
+                json.dump(list(self.jobs.values()), file, indent=4)
+            os.replace(tmp_path, self.path)
+            self.loaded_mtime = os.stat(self.path).st_mtime
+            self.dirty = False
+            self.last_save = time.monotonic()
+
+    def add_job(self, name, spec):
+        """Schedule the stored command name; spec is parsed by parse_schedule. Returns the job."""
+        job = {"id": uuid.uuid4().hex[:8], "name": name, "created": time.time(), "last_run": None}
+        job.update(parse_schedule(spec))
+        with self.condition:
+            self._sync_from_disk()
+            self._add(job, time.time())
+            self.save()
+            self.condition.notify_all()
+        return job
+
+    def remove_job(self, job_id):
+        """Remove a job by id; returns False if there is no such job."""
+        with self.condition:
+            self._sync_from_disk()
+            if self.jobs.pop(job_id, None) is None:
+                return False
+            self.triggers.pop(job_id, None)
+            self.due.pop(job_id, None)
+            self.save()
+            return True
+
+    def next_runs(self):
+        """Return (due time, job) pairs, soonest first."""
+        with self.condition:
+            runs = [(self.due[job_id][0], job) for job_id, job in self.jobs.items() if job_id in self.due]
+        return sorted(runs, key=lambda run: run[0])
+
+    def start(self, callback):
+        """Call callback(name) for due jobs on a background thread."""
+        self.thread = threading.Thread(target=self.run_forever, args=(callback,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def run_forever(self, callback):
+        try:
+            while True:
+                with self.condition:
+                    job = self._wait_for_due_job()
+                    if job is None:
+                        if self.dirty:
+                            self.save()
+                        return
+                try:
+                    callback(job["name"])
+                except Exception:
+                    # The job's next run is already scheduled; one bad run
+                    # must not stop the daemon.
+                    logging.exception("Scheduled job %s failed", job["name"])
+        finally:
+            if self.owner:
+                self.owner = False
+                self.owner_lock.release()
+            self.owner_lock.close()
+
+    def _wait_for_due_job(self):
+        while not self.stopped:
+            self._sync_from_disk()
+            if not self.owner:
+                # Another process is scheduling; try again after a while.
+                self.owner = self.owner_lock.acquire(blocking=False)
+                if not self.owner:
+                    self.condition.wait(WATCH_INTERVAL)
+                    continue
+                # Start from the run times the previous owner saved.
+                self.load()
+            if self.dirty and time.monotonic() - self.last_save >= SAVE_INTERVAL:
+                self.save()
+            while self.heap and self.due.get(self.heap[0][2]) != self.heap[0][:2]:
+                heapq.heappop(self.heap)  # removed or rescheduled job
+            if not self.heap:
+                self.condition.wait(WATCH_INTERVAL)
+                continue
+            due, _, job_id = self.heap[0]
+            now = time.time()
+            if due > now:
+                self.condition.wait(min(due - now, WATCH_INTERVAL))
+                continue
+            heapq.heappop(self.heap)
+            job = self.jobs[job_id]
+            job["last_run"] = now
+            following = due if self.catch_up == 'all' else now
+            self._push(job_id, self._next_time(job, following))
+            self.dirty = True
+            return job
+        return None
+
+    def _add(self, job, now):
+        self.jobs[job["id"]] = job
+        if "cron" in job:
+            self.triggers[job["id"]] = CronExpression(job["cron"])
+        last = job.get("last_run") or job["created"]
+        due = self._next_time(job, last)
+        if due < now:
+            if self.catch_up == 'skip':
+                due = self._next_time(job, now)
+            elif self.catch_up == 'once':
+                due = now
+        self._push(job["id"], due)
+
+    def _push(self, job_id, due):
+        entry = (due, next(self.sequence))
+        self.due[job_id] = entry
+        heapq.heappush(self.heap, entry + (job_id,))
+
+    def _next_time(self, job, after):
+        if "interval" in job:
+            return after + job["interval"]
+        return self.triggers[job["id"]].next_after(after)
+
+    def _sync_from_disk(self):
+        try:
+            changed = os.stat(self.path).st_mtime != self.loaded_mtime
+        except FileNotFoundError:
+            changed = self.loaded_mtime is not None
+        if changed:
+            self.load()
@@ -0,0 +1,206 @@
+import heapq
+import re
+
+TOKEN_RE = re.compile(r'\w+')
+# Ranking weight of a hit in name, command, description and category.
+FIELD_WEIGHTS = (8, 4, 1, 2)
+# With a limit, a query with more candidates than this (or the limit, if
+# larger) scores only the most promising of them.
+MAX_SCORED = 2000
+
+
+def tokenize(text):
+    """Split lowercased text into word tokens."""
+    return TOKEN_RE.findall(text)
+
+
+def trigrams(text):
+    """Return the set of 3-character substrings of text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """In-memory inverted and trigram index over stored commands.
+
+    Matching keeps the semantics of the linear scan in
+    command_utils.search_commands (case-insensitive substring over name,
+    command, description and category), but candidates come from the
+    trigram postings instead of a walk over every command. Names have
+    trigram postings of their own, and postings by their first one and
+    two characters, so a broad query with a limit can score the commands
+    whose name matches first.
+    """
+
+    def __init__(self, commands=None):
+        self.fields = {}
+        self.tokens = {}
+        self.grams = {}
+        self.name_grams = {}
+        self.name_starts = {}
+        for name, details in (commands or {}).items():
+            self.add(name, details)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def add(self, name, details):
+        """Index a command, replacing any previous entry with that name."""
+        if name in self.fields:
+            self.remove(name)
+        fields = (name.lower(),
+                  details.get('command', '').lower(),
+                  details.get('description', '').lower(),
+                  details.get('category', '').lower())
+        self.fields[name] = fields
+        for token in self._tokens_of(fields):
+            self.tokens.setdefault(token, set()).add(name)
+        for gram in self._grams_of(fields):
+            self.grams.setdefault(gram, set()).add(name)
+        for gram in trigrams(fields[0]):
+            self.name_grams.setdefault(gram, set()).add(name)
+        for start in self._starts_of(fields[0]):
+            self.name_starts.setdefault(start, set()).add(name)
+
+    def remove(self, name):
+        """Drop a command from the index; unknown names are ignored."""
+        fields = self.fields.pop(name, None)
+        if fields is None:
+            return
+        self._discard(self.tokens, self._tokens_of(fields), name)
+        self._discard(self.grams, self._grams_of(fields), name)
+        self._discard(self.name_grams, trigrams(fields[0]), name)
+        self._discard(self.name_starts, self._starts_of(fields[0]), name)
+
+    def on_change(self, name, details):
+        """CommandStore listener: reindex or drop a changed command."""
+        if details is None:
+            self.remove(name)
+        else:
+            self.add(name, details)
+
+    def update(self, commands):
+        """Index every entry of a {name: details} mapping."""
+        for name, details in commands.items():
+            self.add(name, details)
+
+    def clear(self):
+        self.fields.clear()
+        self.tokens.clear()
+        self.grams.clear()
+        self.name_grams.clear()
+        self.name_starts.clear()
+
+    def search(self, query, limit=None):
+        """Return names matching query, best matches first.
+
+        With a limit, at most the best limit names are returned. When a
+        query has more than MAX_SCORED candidates, the ones whose name
+        contains the query or that have it as a word are scored first,
+        so only the tail of a very broad query is approximate.
+        """
+        query = query.strip().lower()
+        if not query:
+            return list(self.fields)[:limit]
+
+        exact = self.tokens.get(query, set())
+        cap = max(limit, MAX_SCORED) if limit else None
+        candidates = self._candidates(query, cap)
+        if cap and len(candidates) >= cap:
+            candidates = self._preferred(query, candidates, exact, cap)
+        ranked = []
+        for name in candidates:
+            score = self._score(self.fields[name], query)
+            if score:
+                ranked.append((-score - 3 if name in exact else -score, name))
+        if limit:
+            ranked = heapq.nsmallest(limit, ranked)
+        else:
+            ranked.sort()
+        return [name for _, name in ranked]
+
+    def _candidates(self, query, cap=None):
+        if len(query) >= 3:
+            return self._intersect(self.grams, query)
+        if TOKEN_RE.fullmatch(query):
+            # Short queries match too many trigrams to be useful; the token
+            # vocabulary is far smaller than the command list, so scan that,
+            # exact words first, until there are cap candidates.
+            candidates = set(self.tokens.get(query, ()))
+            for token, names in self.tokens.items():
+                if cap and len(candidates) >= cap:
+                    break
+                if query in token:
+                    candidates |= names
+            return candidates
+        return self.fields
+
+    def _preferred(self, query, candidates, exact, cap):
+        """cap names to score: names matching query and exact word hits first.
+
+        Short queries prefer names starting with them. Scoring drops the
+        names that turn out not to match.
+        """
+        if len(query) >= 3:
+            in_names = self._intersect(self.name_grams, query)
+        else:
+            in_names = self.name_starts.get(query, set())
+        chosen = set()
+        for tier in (in_names & exact, in_names, exact, candidates):
+            for name in tier:
+                chosen.add(name)
+                if len(chosen) >= cap:
+                    return chosen
+        return chosen
+
+    @staticmethod
+    def _intersect(index, query):
+        postings = [index.get(gram) for gram in trigrams(query)]
+        if not all(postings):
+            return set()
+        postings.sort(key=len)
+        return set.intersection(*postings) if len(postings) > 1 else postings[0]
+
+    @staticmethod
+    def _score(fields, query):
+        """Weighted score of a substring hit, 0 when query does not match."""
+        score = 0
+        for field, weight in zip(fields, FIELD_WEIGHTS):
+            if query in field:
+                if field == query:
+                    score += weight * 5
+                elif field.startswith(query):
+                    score += weight * 3
+                else:
+                    score += weight
+        return score
+
+    @staticmethod
+    def _tokens_of(fields):
+        tokens = set()
+        for field in fields:
+            tokens.update(tokenize(field))
+        return tokens
+
+    @staticmethod
+    def _starts_of(field):
+        return {field[:1], field[:2]} if field else set()
+
+    @staticmethod
+    def _grams_of(fields):
+        grams = set()
+        for field in fields:
+            grams |= trigrams(field)
+        return grams
+
+    @staticmethod
+    def _discard(index, keys, name):
+        for key in keys:
+            names = index.get(key)
+            if names is None:
+                continue
+            names.discard(name)
+            if not names:
+                del index[key]
@@ -0,0 +1,61 @@
+"""Startup timing for the GUI.
+
+Enabled with the --profile-startup flag or CST_PROFILE_STARTUP=1. While
+active, every first-time import is timed through a wrapper around
+builtins.__import__, and the GUI records milestones such as first paint
+with mark(). report() lists both, relative to interpreter start-up of
+this module.
+"""
+import builtins
+import os
+import sys
+import time
+
+START = time.perf_counter()
+enabled = False
+marks = []
+imports = []
+_depth = 0
+_original_import = builtins.__import__
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    global _depth
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _depth -= 1
+        imports.append((name, time.perf_counter() - start, _depth))
+
+
+def enable():
+    global enabled
+    if not enabled:
+        enabled = True
+        builtins.__import__ = _timed_import
+
+
+def enable_if_requested(argv=None):
+    argv = sys.argv if argv is None else argv
+    if '--profile-startup' in argv or os.environ.get('CST_PROFILE_STARTUP') == '1':
+        enable()
+    return enabled
+
+
+def mark(label):
+    if enabled:
+        marks.append((label, time.perf_counter() - START))
+
+
+def report(limit=15):
+    """Return the timing report as text."""
+    lines = ["Startup profile", "  milestones (ms since start):"]
+    lines += [f"    {elapsed * 1000:8.1f}  {label}" for label, elapsed in marks]
+    top_level = sorted((entry for entry in imports if entry[2] == 0), key=lambda entry: -entry[1])
+    lines.append(f"  slowest top-level imports (ms, {len(imports)} modules imported):")
+    lines += [f"    {elapsed * 1000:8.1f}  {name}" for name, elapsed, _ in top_level[:limit]]
+    return "\n".join(lines)
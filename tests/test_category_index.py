@@ -0,0 +1,19 @@
+from category_index import CategoryIndex, lift_category
+
+
+def test_subtree_listing_follows_edits():
+    index = CategoryIndex({'a': {'category': 'ops/disk'}, 'b': {'category': 'ops'}, 'c': {}})
+    assert sorted(index.names('ops')) == ['a', 'b']
+    assert index.names('ops', recursive=False) == ['b']
+    assert index.names('Uncategorized') == ['c']
+    index.on_change('a', None)
+    assert index.names('ops') == ['b']
+    assert index.count('ops/disk') == 0
+
+
+def test_lift_category_moves_children_up_one_level():
+    assert lift_category('a/b', 'a/b') == 'a'
+    assert lift_category('a/b/c/d', 'a/b') == 'a/c/d'
+    assert lift_category('a', 'a') == 'Uncategorized'
+    assert lift_category('a/x', 'a') == 'x'
+    assert lift_category('ab/x', 'a') == 'ab/x'
@@ -0,0 +1,90 @@
+from command_store import CommandStore
+
+
+def open_store(tmp_path, **options):
+    return CommandStore(str(tmp_path / 'commands.json'), **options)
+
+
+def test_journal_survives_reopen(tmp_path):
+    store = open_store(tmp_path)
+    store.put('a', {'command': 'echo a'})
+    store.batch(puts={'b': {'command': 'echo b'}}, deletes=['a'])
+    store.close()
+    assert open_store(tmp_path).commands == {'b': {'command': 'echo b'}}
+
+
+def test_torn_last_write_is_dropped(tmp_path):
+    store = open_store(tmp_path)
+    store.put('a', {'command': 'echo a'})
+    store.close()
+    with open(tmp_path / 'commands.json.journal', 'a') as journal:
+        journal.write('{"op": "put", "na')
+    store = open_store(tmp_path)
+    assert list(store.commands) == ['a']
+    store.put('b', {'command': 'echo b'})
+    store.close()
+    assert sorted(open_store(tmp_path).commands) == ['a', 'b']
+
+
+def test_poll_applies_other_instances_edits(tmp_path):
+    first, second = open_store(tmp_path), open_store(tmp_path)
+    seen = []
+    second.add_listener(lambda name, details: seen.append((name, details)))
+    first.put('a', {'command': 'echo a'})
+    first.delete('a')
+    first.put('b', {'command': 'echo b'})
+    assert second.poll() == 3
+    assert seen == [('a', {'command': 'echo a'}), ('a', None), ('b', {'command': 'echo b'})]
+    assert second.poll() == 0
+
+
+def test_writes_do_not_overwrite_each_other(tmp_path):
+    first, second = open_store(tmp_path), open_store(tmp_path)
+    first.put('a', {'command': 'echo a'})
+    second.put('b', {'command': 'echo b'})
+    first.poll()
+    assert sorted(first.commands) == sorted(second.commands) == ['a', 'b']
+
+
+def test_compaction_reads_journal_started_by_another_instance(tmp_path):
+    first, second = open_store(tmp_path), open_store(tmp_path)
+    first.put('a1', {'command': 'a1'})
+    second.put('b1', {'command': 'b1'})
+    second._compact()
+    second.put('b2', {'command': 'b2'})
+    first._compact()
+    assert sorted(open_store(tmp_path).commands) == ['a1', 'b1', 'b2']
+
+
+def test_poll_after_two_compactions_reloads(tmp_path):
+    first, second = open_store(tmp_path), open_store(tmp_path)
+    seen = {}
+    second.add_listener(lambda name, details: seen.__setitem__(name, details))
+    first.put('x1', {'command': 'x1'})
+    first._compact()
+    first.put('x2', {'command': 'x2'})
+    first._compact()
+    first.put('x3', {'command': 'x3'})
+    second.poll()
+    assert sorted(second.commands) == ['x1', 'x2', 'x3']
+    assert sorted(seen) == ['x1', 'x2', 'x3']
+
+
+def test_poll_follows_a_single_compaction(tmp_path):
+    first, second = open_store(tmp_path), open_store(tmp_path)
+    first.put('x1', {'command': 'x1'})
+    first._compact()
+    first.put('x2', {'command': 'x2'})
+    assert second.poll() == 2
+    assert sorted(second.commands) == ['x1', 'x2']
+
+
+def test_compactor_defers_listener_calls_to_poll(tmp_path):
+    first, second = open_store(tmp_path), open_store(tmp_path)
+    seen = []
+    first.add_listener(lambda name, details: seen.append(name))
+    second.put('b', {'command': 'b'})
+    first.compact(wait=True)
+    assert seen == [] and 'b' in first.commands
+    assert first.poll() == 1
+    assert seen == ['b']
@@ -0,0 +1,34 @@
+import threading
+
+from core import CommandCore
+
+
+def test_components_are_created_once_under_concurrent_first_use(tmp_path):
+    core = CommandCore(str(tmp_path))
+    try:
+        barrier = threading.Barrier(8)
+        seen = []
+
+        def touch():
+            barrier.wait()
+            seen.append((core.fuzzy_index, core.search_index, core.history))
+
+        threads = [threading.Thread(target=touch) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(set(seen)) == 1
+        assert len(core.store.listeners) == 2
+    finally:
+        core.close()
+
+
+def test_run_records_history(tmp_path):
+    core = CommandCore(str(tmp_path))
+    try:
+        core.store.put('hello', {'command': 'echo hello'})
+        assert core.run('hello').wait(10)
+        assert core.history.count('hello') == 1
+    finally:
+        core.close()
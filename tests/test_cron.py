@@ -0,0 +1,49 @@
+import datetime
+
+import pytest
+
+from cron import CronExpression
+
+
+def at(*args):
+    return datetime.datetime(*args).timestamp()
+
+
+def next_after(expression, *args):
+    return datetime.datetime.fromtimestamp(CronExpression(expression).next_after(at(*args)))
+
+
+def test_next_after_steps_and_ranges():
+    assert next_after('*/15 * * * *', 2026, 10, 18, 10, 7) == datetime.datetime(2026, 10, 18, 10, 15)
+    assert next_after('*/15 * * * *', 2026, 10, 18, 10, 15) == datetime.datetime(2026, 10, 18, 10, 30)
+    assert next_after('0 9-17/4 * * *', 2026, 10, 18, 13, 30) == datetime.datetime(2026, 10, 18, 17, 0)
+    assert next_after('@daily', 2026, 12, 31, 23, 59) == datetime.datetime(2027, 1, 1, 0, 0)
+
+
+def test_month_and_day_names():
+    # 2026-10-16 is a Friday.
+    assert next_after('30 7 * * mon-fri', 2026, 10, 16, 8, 0) == datetime.datetime(2026, 10, 19, 7, 30)
+    assert next_after('0 0 1 JAN-mar *', 2026, 4, 1, 12, 0) == datetime.datetime(2027, 1, 1, 0, 0)
+    assert next_after('0 0 * * 7', 2026, 10, 17, 12, 0) == datetime.datetime(2026, 10, 18, 0, 0)
+    assert next_after('0 0 * * sun', 2026, 10, 17, 12, 0) == datetime.datetime(2026, 10, 18, 0, 0)
+
+
+def test_restricted_day_fields_match_either():
+    # Day 15 or any Friday, as in standard cron.
+    assert next_after('0 12 15 * fri', 2026, 10, 18, 0, 0) == datetime.datetime(2026, 10, 23, 12, 0)
+    assert next_after('0 12 15 * fri', 2026, 11, 14, 0, 0) == datetime.datetime(2026, 11, 15, 12, 0)
+    # With one of them '*', only the other restricts.
+    assert next_after('0 12 * * fri', 2026, 11, 14, 0, 0) == datetime.datetime(2026, 11, 20, 12, 0)
+    assert next_after('0 12 15 * *', 2026, 11, 16, 0, 0) == datetime.datetime(2026, 12, 15, 12, 0)
+
+
+@pytest.mark.parametrize('expression', ['60 * * * *', '* * *', '* * * * * *', '5-1 * * * *',
+                                        '*/0 * * * *', '* * * foo *'])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronExpression(expression)
+
+
+def test_expression_that_never_fires():
+    with pytest.raises(ValueError):
+        CronExpression('0 0 30 feb *').next_after(at(2026, 1, 1))
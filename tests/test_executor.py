@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from executor import CommandExecutor
+
+
+@pytest.fixture
+def executor():
+    executor = CommandExecutor(2)
+    yield executor
+    executor.shutdown()
+
+
+def raise_error(*args):
+    raise RuntimeError("callback bug")
+
+
+def test_runs_and_collects_output(executor):
+    run = executor.submit('hello', 'echo hello', count=2)
+    assert run.wait(10)
+    assert run.returncode == 0
+    assert list(run.outputs) == ['hello\n', 'hello\n']
+
+
+@pytest.mark.parametrize('callback', ['on_start', 'on_output', 'on_done'])
+def test_failing_callback_does_not_lose_a_worker(executor, callback):
+    runs = [executor.submit(f'run{i}', 'true', **{callback: raise_error}) for i in range(4)]
+    for run in runs:
+        assert run.wait(10)
+        assert run.finished and not run.running
+    # Both workers are still alive and serve the next run.
+    assert executor.submit('after', 'echo ok').wait(10)
+
+
+def test_runs_of_one_command_are_serialised(executor):
+    first = executor.submit('same', 'sleep 0.2')
+    second = executor.submit('same', 'true')
+    assert second.wait(10)
+    assert first.done.is_set()
+
+
+def test_cancel_kills_the_process(executor):
+    started = threading.Event()
+    run = executor.submit('slow', 'sleep 30', on_start=lambda run: started.set())
+    assert started.wait(10)
+    time.sleep(0.1)
+    executor.cancel(run)
+    assert run.wait(10)
+    assert run.cancelled
+
+
+def test_runs_in_parallel(executor):
+    start = time.monotonic()
+    runs = [executor.submit(f'run{i}', 'sleep 0.3') for i in range(2)]
+    for run in runs:
+        assert run.wait(10)
+    assert time.monotonic() - start < 0.55
+
+
+def test_shutdown_finishes_waiting_and_queued_runs():
+    executor = CommandExecutor(2)
+    started = threading.Event()
+    repeating = executor.submit('a', 'echo a', count=3, interval=5)
+    running = executor.submit('b', 'sleep 30', on_start=lambda run: started.set())
+    queued = executor.submit('b', 'echo b')
+    assert started.wait(10)
+    time.sleep(0.2)
+    executor.shutdown()
+    for run in (repeating, running, queued):
+        assert run.wait(3)
+        assert run.cancelled and run.finished
+    assert list(queued.outputs) == []
+    with pytest.raises(RuntimeError):
+        executor.submit('c', 'true')
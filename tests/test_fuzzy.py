@@ -0,0 +1,122 @@
+import threading
+
+import fuzzy
+from fuzzy import FuzzyIndex
+
+
+def test_finds_typo_and_subsequence_matches():
+    index = FuzzyIndex({'docker-compose-up': {}, 'git-status': {}, 'list-files': {}})
+    assert index.search('dcu') == ['docker-compose-up']
+    assert index.search('stauts') == ['git-status']
+
+
+def test_recorded_runs_rank_first():
+    index = FuzzyIndex({'build-fast': {}, 'build-full': {}})
+    assert index.search('build')[0] == 'build-fast'
+    index.record_run('build-full')
+    assert index.search('build')[0] == 'build-full'
+    assert index.frequent == ['build-full']
+
+
+def test_frequent_keeps_the_top_commands(monkeypatch):
+    monkeypatch.setattr(fuzzy, 'FREQUENT_LIMIT', 3)
+    index = FuzzyIndex()
+    index.set_usage({'a': (1, 1), 'b': (5, 1), 'c': (3, 1), 'd': (2, 1)})
+    assert index.frequent == ['b', 'c', 'd']
+    for _ in range(10):
+        index.record_run('a', timestamp=1)
+    assert index.frequent == ['a', 'b', 'c']
+    index.record_run('d', timestamp=1)
+    assert index.frequent == ['a', 'b', 'c']
+
+
+def test_concurrent_record_run_counts_every_run():
+    index = FuzzyIndex()
+    threads = [threading.Thread(target=lambda: [index.record_run(f'cmd{i % 5}') for i in range(200)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(count for count, _ in index.usage.values()) == 1600
+    assert sorted(index.frequent) == [f'cmd{i}' for i in range(5)]
+
+
+def test_matches_the_fields_plain_search_uses():
+    index = FuzzyIndex({
+        'up': {'command': 'docker compose up -d', 'description': 'Start the stack', 'category': 'Docker'},
+        'logs': {'command': 'journalctl -f', 'description': 'Follow the system log', 'category': 'System'},
+    })
+    assert index.search('compose') == ['up']
+    assert index.search('follow') == ['logs']
+    assert index.search('system') == ['logs']
+    assert index.search('journ') == ['logs']
+    assert index.search('jornalctl') == ['logs']
+    assert index.search('foll syst') == ['logs']
+
+
+def test_name_matches_rank_above_other_fields():
+    index = FuzzyIndex({
+        'restart-web': {'command': 'systemctl restart nginx'},
+        'deploy': {'command': 'make deploy', 'description': 'restart everything afterwards'},
+    })
+    assert index.search('restart') == ['restart-web', 'deploy']
+
+
+def test_edits_reindex_every_field():
+    index = FuzzyIndex({'a': {'command': 'echo one'}})
+    index.on_change('a', {'command': 'echo two', 'description': 'second'})
+    assert index.search('one') == []
+    assert index.search('second') == ['a']
+
+
+def test_query_words_match_in_any_order():
+    index = FuzzyIndex({'restart-web': {'command': 'systemctl restart nginx'}, 'web-logs': {}})
+    assert index.search('web restart') == ['restart-web']
+    assert index.search('nginx web') == ['restart-web']
+
+
+def test_narrowed_search_matches_a_fresh_one():
+    commands = {f'cmd-{i}': {'command': f'docker run image{i % 7}', 'description': 'kubectl logs'}
+                for i in range(300)}
+    commands['dock-build'] = {'command': 'make'}
+    index = FuzzyIndex(commands)
+    queries = ('d', 'do', 'doc', 'dock', 'dock kub')
+    typed = [index.search(query, limit=1000) for query in queries]
+    assert typed == [FuzzyIndex(commands).search(query, limit=1000) for query in queries]
+    assert typed[3][0] == 'dock-build'
+
+
+def test_limit_keeps_the_best_matches():
+    commands = {f'cmd-{i}': {'command': 'docker ps'} for i in range(1000)}
+    commands['docker'] = {}
+    index = FuzzyIndex(commands)
+    found = index.search('docker', limit=20)
+    assert len(found) == 20
+    assert found[0] == 'docker'
+
+
+def test_search_uses_a_snapshot_while_the_library_changes():
+    index = FuzzyIndex({f'cmd-{i}': {'command': 'echo hi'} for i in range(200)})
+    errors = []
+
+    def edit():
+        for i in range(200):
+            index.on_change(f'new-{i}', {'command': 'echo hi'})
+            index.on_change(f'cmd-{i}', None)
+
+    def search():
+        try:
+            for _ in range(50):
+                index.search('echo')
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=edit), threading.Thread(target=search)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert index.search('cmd') == []
+    assert len(index.search('new', limit=1000)) == 200
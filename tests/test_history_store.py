@@ -0,0 +1,131 @@
+import json
+import sqlite3
+import time
+import zlib
+
+from history_store import HistoryStore
+from output_log import OutputLog, chunk_hash
+
+
+def open_history(tmp_path, **options):
+    return HistoryStore(str(tmp_path / 'history.db'), **options)
+
+
+def chunk_hashes(history):
+    return {digest for digest, in history.db.execute("SELECT hash FROM chunks")}
+
+
+def test_repeated_output_round_trips_through_chunks(tmp_path):
+    outputs = [f"line {i}\n" * 50 + "tail\n" for i in range(3)] + ["done\n"] * 3
+    history = open_history(tmp_path)
+    try:
+        run_id = history.add_run('poll', 'watch', OutputLog(outputs), 0)
+        assert history.get_run(run_id)['output'] == outputs
+        assert history.get_run(run_id)['iterations'] == 6
+        # A second run with the same outputs adds no chunks.
+        before = chunk_hashes(history)
+        second = history.add_run('poll', 'watch', outputs, 0)
+        assert chunk_hashes(history) == before
+        assert history.get_run(second)['output'] == outputs
+        assert history.get_run(run_id + 100) is None
+    finally:
+        history.close()
+
+
+def test_outputs_survive_reopening(tmp_path):
+    history = open_history(tmp_path)
+    run_id = history.add_run('a', 'echo', ["one\n", "one\n", "two\n"], 0)
+    history.close()
+    history = open_history(tmp_path)
+    try:
+        assert history.get_run(run_id)['output'] == ["one\n", "one\n", "two\n"]
+    finally:
+        history.close()
+
+
+def test_prune_deletes_only_unreferenced_chunks(tmp_path):
+    history = open_history(tmp_path, retention_days=1)
+    try:
+        old = history.add_run('a', 'echo', ["shared\n", "only old\n"], 0, timestamp=time.time() - 3 * 86400)
+        new = history.add_run('a', 'echo', ["shared\n", "only new\n"], 0)
+        history.prune()
+        assert history.get_run(old) is None
+        assert chunk_hashes(history) == {chunk_hash("shared\n"), chunk_hash("only new\n")}
+        assert history.get_run(new)['output'] == ["shared\n", "only new\n"]
+    finally:
+        history.close()
+
+
+def add_runs(history, count, start=1000000.0):
+    for i in range(count):
+        history.add_run(f'cmd{i % 3}', f'run {i}', [f"{i}\n"], i % 2, timestamp=start + i // 2)
+
+
+def test_pages_are_newest_first_and_cover_every_run(tmp_path):
+    history = open_history(tmp_path, retention_days=0)
+    try:
+        add_runs(history, 25)
+        assert history.count() == 25
+        pages = [history.list_runs(offset, 10) for offset in (0, 10, 20)]
+        assert [len(page) for page in pages] == [10, 10, 5]
+        runs = [run for page in pages for run in page]
+        assert [run['command'] for run in runs] == [f'run {i}' for i in reversed(range(25))]
+        assert 'output' not in runs[0]
+        assert history.count(name='cmd0') == 9
+        assert history.count(name='cmd0', exit_code=1) == 4
+        failed = history.list_runs(0, 100, exit_code=1)
+        assert len(failed) == 12 and all(run['exit_code'] == 1 for run in failed)
+        assert [run['command'] for run in history.list_runs(2, 2, name='cmd1')] == ['run 16', 'run 13']
+    finally:
+        history.close()
+
+
+def test_run_counts(tmp_path):
+    history = open_history(tmp_path, retention_days=0)
+    try:
+        assert history.run_counts() == {}
+        add_runs(history, 7)
+        assert history.run_counts() == {'cmd0': (3, 1000003.0), 'cmd1': (2, 1000002.0),
+                                        'cmd2': (2, 1000002.0)}
+    finally:
+        history.close()
+
+
+def test_max_runs_keeps_the_newest(tmp_path):
+    history = open_history(tmp_path, retention_days=0, max_runs=5)
+    try:
+        add_runs(history, 8)
+        history.prune()
+        assert history.count() == 5
+        assert history.list_runs(4, 1)[0]['command'] == 'run 3'
+    finally:
+        history.close()
+
+
+def test_opens_history_written_before_chunked_outputs(tmp_path):
+    # The first layout had no metric, manifest or cached columns and kept
+    # every run's outputs inline as one compressed JSON list.
+    path = tmp_path / 'history.db'
+    db = sqlite3.connect(str(path))
+    db.executescript("""
+        CREATE TABLE runs (id INTEGER PRIMARY KEY, name TEXT NOT NULL, command TEXT NOT NULL,
+                           timestamp REAL NOT NULL, exit_code INTEGER, iterations INTEGER NOT NULL,
+                           output BLOB);
+        CREATE INDEX runs_timestamp ON runs (timestamp);
+    """)
+    db.execute("INSERT INTO runs (name, command, timestamp, exit_code, iterations, output)"
+               " VALUES (?, ?, ?, ?, ?, ?)",
+               ('old', 'echo old', time.time() - 60, 0, 2, zlib.compress(json.dumps(["a\n", "b\n"]).encode())))
+    db.commit()
+    db.close()
+    history = open_history(tmp_path)
+    try:
+        old = history.list_runs()[0]
+        assert (old['name'], old['duration'], old['cached']) == ('old', None, None)
+        assert history.get_run(old['id'])['output'] == ["a\n", "b\n"]
+        new = history.add_run('new', 'echo new', ["c\n"], 0, metrics=[{'started_at': 1.0, 'duration': 0.5}])
+        assert history.get_run(new)['output'] == ["c\n"]
+        assert history.get_run(new)['duration'] == 0.5
+        assert history.run_counts().keys() == {'old', 'new'}
+    finally:
+        history.close()
@@ -0,0 +1,117 @@
+import gzip
+import io
+import json
+import os
+
+import pytest
+
+import import_export
+from command_store import CommandStore
+from import_export import export_file, import_file, iter_json, plan_import, read_entries
+
+LIBRARY = {
+    'braces': {'command': 'echo "{ } [ ] , :"', 'description': 'quote \\" and é'},
+    'numbers': {'command': 'sleep 1', 'interval': 12345.678, 'count': 1000000},
+    'nested': {'command': 'true', 'tags': ['a', 'b'], 'cache_keys': ['env:HOME']},
+}
+
+
+def write(path, text):
+    with open(path, 'w') as file:
+        file.write(text)
+    return str(path)
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 3, 5, 7, 16, 64 * 1024])
+def test_iter_json_reads_objects_split_across_chunks(monkeypatch, read_size):
+    monkeypatch.setattr(import_export, 'READ_SIZE', read_size)
+    document = json.dumps(LIBRARY, indent=4)
+    assert dict(iter_json(io.StringIO(document))) == LIBRARY
+    as_list = json.dumps([{'name': name, **details} for name, details in LIBRARY.items()])
+    assert dict(iter_json(io.StringIO(as_list))) == LIBRARY
+
+
+@pytest.mark.parametrize('text', ['{"a": {"command": "x"}', '{"a": {"command": "x"}, "b": {"comm',
+                                  '[{"name": "a", "command": "x"},', '{"a" {"command": "x"}}',
+                                  '"just a string"', '{"a": {"command": "x"}} {"b": {}}'])
+def test_malformed_json_is_rejected_before_any_write(tmp_path, text):
+    store = CommandStore(str(tmp_path / 'commands.json'))
+    try:
+        store.put('existing', {'command': 'true'})
+        path = write(tmp_path / 'import.json', text)
+        with pytest.raises(ValueError):
+            import_file(store, path)
+        assert store.commands == {'existing': {'command': 'true'}}
+    finally:
+        store.close()
+    reopened = CommandStore(str(tmp_path / 'commands.json'))
+    assert reopened.commands == {'existing': {'command': 'true'}}
+    reopened.close()
+
+
+def test_truncated_ndjson_is_rejected(tmp_path):
+    path = write(tmp_path / 'import.ndjson', '{"name": "a", "command": "x"}\n{"name": "b", "comm')
+    with pytest.raises(ValueError):
+        plan_import({}, path)
+
+
+def test_invalid_entries_are_reported_and_skipped(tmp_path):
+    path = write(tmp_path / 'import.json', json.dumps({
+        'ok': {'command': 'true'}, 'empty': {'command': ' '}, 'count': {'command': 'x', 'count': 0},
+        'flag': {'command': 'x', 'timeout': True}, 'no-command': {'description': 'x'}}))
+    puts, report = plan_import({}, path)
+    assert list(puts) == ['ok']
+    assert (report.added, report.invalid, len(report.errors)) == (1, 4, 4)
+
+
+@pytest.mark.parametrize('policy, expected, counts', [
+    ('skip', {}, (0, 0, 0, 2)),
+    ('overwrite', {'a': 'last'}, (0, 1, 0, 0)),
+    ('rename', {'a (2)': 'new', 'a (3)': 'last'}, (0, 0, 2, 0)),
+])
+def test_conflict_policies(tmp_path, policy, expected, counts):
+    path = write(tmp_path / 'import.ndjson',
+                 '{"name": "a", "command": "new"}\n{"name": "a", "command": "last"}\n')
+    puts, report = plan_import({'a': {'command': 'old'}}, path, on_conflict=policy)
+    assert {name: details['command'] for name, details in puts.items()} == expected
+    assert (report.added, report.overwritten, report.renamed, report.skipped) == counts
+
+
+def test_rename_skips_identical_commands(tmp_path):
+    path = write(tmp_path / 'import.json', json.dumps({'a': {'command': 'same'}}))
+    puts, report = plan_import({'a': {'command': 'same'}}, path, on_conflict='rename')
+    assert puts == {} and report.skipped == 1
+
+
+def test_zsh_extended_history(tmp_path):
+    path = write(tmp_path / '.zsh_history', ': 1700000000:0;git status\n'
+                                            ': 1700000001:3;docker compose \\\nup -d\n'
+                                            'ls -la\n'
+                                            ': 1700000002:0;git status\n'
+                                            ': 1700000003:0;   \n')
+    entries = dict(read_entries(path))
+    assert entries['git-status']['command'] == 'git status'
+    assert entries['git-status']['description'] == 'Imported from .zsh_history (2 uses)'
+    assert entries['docker-compose-up']['command'] == 'docker compose \nup -d'
+    assert entries['ls-la']['category'] == 'Shell History'
+    assert len(entries) == 3
+    assert dict(read_entries(path, min_uses=2)).keys() == {'git-status'}
+
+
+def test_bash_history_with_timestamps(tmp_path):
+    path = write(tmp_path / '.bash_history', '#1700000000\nmake build\n#1700000001\nmake test\n'
+                                             '\nmake build\n')
+    entries = list(read_entries(path))
+    assert [details['command'] for _, details in entries] == ['make build', 'make test']
+    assert [name for name, _ in entries] == ['make-build', 'make-test']
+
+
+def test_export_and_import_round_trip(tmp_path):
+    for filename in ('out.json', 'out.ndjson', 'out.json.gz'):
+        path = str(tmp_path / filename)
+        assert export_file(LIBRARY, path) == len(LIBRARY)
+        puts, report = plan_import({}, path)
+        assert puts == LIBRARY and report.added == len(LIBRARY)
+    with gzip.open(tmp_path / 'out.json.gz', 'rt') as file:
+        assert json.load(file) == LIBRARY
+    assert not os.path.exists(tmp_path / 'out.json.tmp')
@@ -0,0 +1,86 @@
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+from online_search import OnlineSearchClient, ResponseCache, encode_query
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    # Status codes to answer with before the real response, e.g. [503].
+    failures = []
+    requests = []
+
+    def do_GET(self):
+        StubHandler.requests.append(self.path)
+        if self.path.startswith('/commands/matching/slow/'):
+            time.sleep(0.5)
+        if StubHandler.failures:
+            self.send_response(StubHandler.failures.pop(0))
+            self.end_headers()
+            return
+        if self.path.startswith('/commands/matching/html/'):
+            body = ('<div class="command"><pre class="command">ls -la</pre>'
+                    '<div class="description">List all files</div></div>').encode()
+            content_type = 'text/html'
+        else:
+            body = json.dumps([{'command': 'df -h', 'summary': 'Disk usage'}]).encode()
+            content_type = 'application/json'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StubHandler.failures, StubHandler.requests = [], []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server, tmp_path):
+    client = OnlineSearchClient(server, ResponseCache(str(tmp_path / 'cache')), timeout=5)
+    yield client
+    client.close()
+
+
+def test_search_parses_json_and_caches(client):
+    assert client.search('disk') == [{'command': 'df -h', 'summary': 'Disk usage'}]
+    assert client.search('disk') == [{'command': 'df -h', 'summary': 'Disk usage'}]
+    assert StubHandler.requests == [f"/commands/matching/disk/{encode_query('disk')}/json"]
+
+
+def test_search_parses_html(client):
+    assert client.search('html') == [{'command': 'ls -la', 'summary': 'List all files'}]
+
+
+def test_transient_errors_are_retried(client):
+    StubHandler.failures = [503]
+    assert client.search('disk') == [{'command': 'df -h', 'summary': 'Disk usage'}]
+    assert len(StubHandler.requests) == 2
+
+
+def test_search_async_drops_superseded_results(client):
+    results, done = [], threading.Event()
+    client.search_async('slow', results.append)
+    client.search_async('disk', lambda commands: (results.append(commands), done.set()))
+    assert done.wait(10)
+    time.sleep(1)
+    assert results == [[{'command': 'df -h', 'summary': 'Disk usage'}]]
+
+
+def test_expired_cache_entries_are_refetched(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=0)
+    cache.put('key', [{'command': 'true', 'summary': ''}])
+    assert cache.get('key') is None
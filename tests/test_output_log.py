@@ -0,0 +1,47 @@
+import output_log
+from output_log import OutputLog, apply_delta, chunk_hash, line_delta
+
+
+def polling_outputs(count=20):
+    return [''.join(f"pod-{i} Running {i * iteration % 7}\n" for i in range(30)) for iteration in range(count)]
+
+
+def test_line_delta_round_trips():
+    cases = [("", "a\n"), ("a\nb\nc\n", "a\nB\nc\nd\n"), ("a\nb\n", ""), ("x", "x\ny"), ("a\nb\n", "b\na\n")]
+    for previous, current in cases:
+        assert apply_delta(previous, line_delta(previous, current)) == current
+
+
+def test_repeated_iterations_are_stored_as_deltas():
+    outputs = polling_outputs()
+    log = OutputLog(outputs)
+    assert list(log) == outputs
+    assert [log[i] for i in range(len(outputs))] == outputs
+    assert log[-1] == outputs[-1]
+    assert len(log) == len(outputs)
+    assert len(log.chunks) < len(outputs) // 2
+    assert log.entries[0] == ['c', chunk_hash(outputs[0])]
+
+
+def test_identical_outputs_share_one_chunk():
+    log = OutputLog(["same\n"] * 5 + ["other\n", "same\n"])
+    assert list(log) == ["same\n"] * 5 + ["other\n", "same\n"]
+    assert set(log.chunks) == {chunk_hash("same\n"), chunk_hash("other\n")}
+    assert log.entries[1:5] == [['d', []]] * 4
+
+
+def test_large_outputs_are_not_diffed(monkeypatch):
+    monkeypatch.setattr(output_log, 'MAX_DELTA_LINES', 3)
+    outputs = ["1\n2\n3\n4\n", "1\n2\n3\n5\n"]
+    log = OutputLog(outputs)
+    assert [kind for kind, _ in log.entries] == ['c', 'c']
+    assert list(log) == outputs
+
+
+def test_appending_to_a_loaded_log():
+    outputs = polling_outputs(5)
+    first = OutputLog(outputs[:3])
+    loaded = OutputLog(entries=list(first.entries), chunks=dict(first.chunks))
+    for output in outputs[3:]:
+        loaded.append(output)
+    assert list(loaded) == outputs
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from core import CommandCore
+from remote import LOCAL, resolve_hosts
+
+
+@pytest.fixture
+def core(tmp_path):
+    with open(tmp_path / 'hosts.json', 'w') as file:
+        json.dump({'web': ['web1', 'web2'], 'db': ['db1', 'web1']}, file)
+    core = CommandCore(str(tmp_path))
+    core.remote.ssh_command = [LOCAL]
+    yield core
+    core.close()
+
+
+def test_resolve_hosts_expands_groups_without_duplicates():
+    inventory = {'web': ['web1', 'web2'], 'db': ['db1', 'web1']}
+    assert resolve_hosts(inventory, ['web', 'db']) == ['web1', 'web2', 'db1']
+    assert resolve_hosts(inventory, ['all']) == ['web1', 'web2', 'db1']
+    assert resolve_hosts(inventory, ['other', 'web2']) == ['other', 'web2']
+
+
+def test_fan_out_runs_on_every_host(core):
+    core.store.put('whoami', {'command': 'echo "$CST_HOST"'})
+    progress = []
+    fan_out = core.remote.run('whoami', ['all'],
+                              lambda fan_out, host, run: progress.append((host, fan_out.finished)))
+    assert fan_out.wait(10)
+    assert {host: list(run.outputs) for host, run in fan_out.runs.items()} == {
+        'web1': ['web1\n'], 'web2': ['web2\n'], 'db1': ['db1\n']}
+    assert sorted(count for host, count in progress) == [1, 2, 3]
+    assert fan_out.failed() == []
+    assert core.history.count('whoami@web1') == 1
+
+
+def test_fan_out_reports_failed_hosts(core):
+    core.store.put('check', {'command': 'test "$CST_HOST" != web2'})
+    fan_out = core.remote.run('check', ['web'])
+    assert fan_out.wait(10)
+    assert fan_out.failed() == ['web2']
+
+
+def test_no_matching_hosts_is_already_done(core, tmp_path):
+    core.store.put('noop', {'command': 'true'})
+    (tmp_path / 'hosts.json').write_text('{}')
+    fan_out = core.remote.run('noop', [])
+    assert fan_out.hosts == [] and fan_out.wait(0)
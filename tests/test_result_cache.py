@@ -0,0 +1,112 @@
+import pytest
+
+import result_cache
+from core import CommandCore
+from executor import CommandExecutor
+from result_cache import ResultCache, cache_keys_of, invalid_cache_keys
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def executor():
+    executor = CommandExecutor(1)
+    yield executor
+    executor.shutdown()
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResultCache()
+    cache.put('uname -a', (), 0, 'Linux\n')
+    clock[0] += 5
+    assert cache.get('uname -a', 10) == (0, 'Linux\n', 5)
+    clock[0] += 6
+    assert cache.get('uname -a', 10) is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_file_key_invalidates_on_change(tmp_path):
+    path = tmp_path / 'hosts'
+    path.write_text('a')
+    cached = ResultCache().for_command({'command': 'cat hosts', 'cache_ttl': 60, 'cache_keys': f'file:{path}'})
+    assert cached.get() is None
+    cached.put(0, 'a')
+    assert cached.get()[:2] == (0, 'a')
+    path.write_text('bb')
+    assert cached.get() is None
+    path.unlink()
+    assert cached.get() is None
+
+
+def test_env_key_invalidates_on_change(monkeypatch):
+    monkeypatch.setenv('KUBECONFIG', 'one')
+    cached = ResultCache().for_command({'command': 'kubectl get pods', 'cache_ttl': 60,
+                                        'cache_keys': ['env:KUBECONFIG']})
+    cached.get()
+    cached.put(0, 'pods')
+    assert cached.get()[:2] == (0, 'pods')
+    monkeypatch.setenv('KUBECONFIG', 'two')
+    assert cached.get() is None
+    monkeypatch.delenv('KUBECONFIG')
+    assert cached.get() is None
+
+
+def test_lru_eviction_by_count():
+    cache = ResultCache(max_entries=2)
+    cache.put('a', (), 0, 'a')
+    cache.put('b', (), 0, 'b')
+    assert cache.get('a', 60) is not None
+    cache.put('c', (), 0, 'c')
+    assert cache.get('b', 60) is None
+    assert cache.get('a', 60) is not None
+    assert cache.get('c', 60) is not None
+
+
+def test_lru_eviction_by_bytes():
+    cache = ResultCache(max_bytes=10)
+    cache.put('a', (), 0, 'x' * 4)
+    cache.put('b', (), 0, 'x' * 4)
+    cache.put('c', (), 0, 'x' * 4)
+    assert cache.get('a', 60) is None
+    assert cache.size == 8
+    cache.put('huge', (), 0, 'x' * 11)
+    assert cache.get('huge', 60) is None
+    assert len(cache) == 2
+
+
+def test_only_successful_runs_are_cached(executor):
+    cache = ResultCache()
+    failing = executor.submit('f', 'echo no; false', count=2,
+                              cache=cache.for_command({'command': 'echo no; false', 'cache_ttl': 60}))
+    assert failing.wait(10)
+    assert failing.cache_hits == 0 and len(cache) == 0
+    ok = executor.submit('ok', 'echo yes', count=2,
+                         cache=cache.for_command({'command': 'echo yes', 'cache_ttl': 60}))
+    assert ok.wait(10)
+    assert ok.cache_hits == 1
+    assert list(ok.outputs) == ['yes\n', 'yes\n']
+
+
+def test_cache_keys_parsing():
+    assert cache_keys_of({'cache_keys': 'file:/etc/hosts, env:HOME,'}) == ('file:/etc/hosts', 'env:HOME')
+    assert invalid_cache_keys(['file:/x', 'env:', 'url:x', 'env:A']) == ['env:', 'url:x']
+
+
+def test_core_can_run_without_the_cache(tmp_path):
+    for use_result_cache, hits in ((True, 1), (False, 0)):
+        data_dir = tmp_path / str(use_result_cache)
+        data_dir.mkdir()
+        core = CommandCore(str(data_dir), use_result_cache=use_result_cache)
+        try:
+            core.store.put('id', {'command': 'echo $$', 'cache_ttl': 60, 'count': 2})
+            run = core.run('id')
+            assert run.wait(10)
+            assert run.cache_hits == hits
+        finally:
+            core.close()
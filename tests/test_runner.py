@@ -0,0 +1,54 @@
+import sys
+
+import pytest
+
+import runner
+from runner import run_command
+
+proc_only = pytest.mark.skipif(not runner.RssSampler.supported, reason="needs /proc")
+
+
+def allocate(megabytes, seconds=0.3):
+    return (f"{sys.executable} -c \"import time; data = bytearray({megabytes} << 20); "
+            f"data[::4096] = b'1' * len(data[::4096]); time.sleep({seconds})\"")
+
+
+def test_collects_output_and_exit_status():
+    result = run_command("echo out; echo err >&2; exit 3")
+    assert result.returncode == 3
+    assert sorted(result.output.splitlines()) == ['err', 'out']
+    assert result.duration is not None
+
+
+def test_output_is_capped():
+    result = run_command("head -c 5000 /dev/zero", max_output=100)
+    assert result.truncated
+    assert result.output.startswith("\0" * 100 + "\n[output truncated")
+
+
+@proc_only
+def test_max_rss_measures_the_command_not_this_process():
+    ballast = bytearray(200 << 20)
+    ballast[::4096] = b'1' * len(ballast[::4096])
+    result = run_command("sleep 0.3")
+    assert result.max_rss is not None and result.max_rss < 50 * 1024
+    del ballast
+
+
+@proc_only
+def test_max_rss_follows_the_command():
+    result = run_command(allocate(100))
+    assert result.max_rss > 100 * 1024
+
+
+def test_timeout_kills_the_command():
+    result = run_command("sleep 5", timeout=0.3)
+    assert result.timed_out
+    assert result.duration < 2
+
+
+def test_timeout_covers_a_command_that_closed_its_pipes():
+    result = run_command("exec 1>&- 2>&-; sleep 3", timeout=0.3)
+    assert result.timed_out
+    assert result.duration < 2
+    assert result.returncode != 0
@@ -0,0 +1,85 @@
+import json
+import threading
+import time
+
+import pytest
+
+import scheduler
+from scheduler import Scheduler, parse_schedule
+
+
+def write_jobs(path, jobs):
+    with open(path, 'w') as file:
+        json.dump(jobs, file)
+
+
+def test_parse_schedule():
+    assert parse_schedule('07:30') == {'cron': '30 7 * * *'}
+    assert parse_schedule('15m') == {'interval': 900}
+    assert parse_schedule('*/5 * * * *') == {'cron': '*/5 * * * *'}
+    with pytest.raises(ValueError):
+        parse_schedule('25:00')
+
+
+def test_interval_job_fires(tmp_path):
+    path = str(tmp_path / 'schedules.json')
+    write_jobs(path, [{'id': 'a', 'name': 'tick', 'interval': 1, 'created': time.time() - 1,
+                       'last_run': None}])
+    fired = threading.Event()
+    instance = Scheduler(path)
+    instance.start(lambda name: fired.set())
+    try:
+        assert fired.wait(5)
+    finally:
+        instance.stop()
+        instance.thread.join(5)
+
+
+def test_only_one_scheduler_fires(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, 'WATCH_INTERVAL', 0.1)
+    path = str(tmp_path / 'schedules.json')
+    write_jobs(path, [{'id': 'a', 'name': 'tick', 'interval': 1, 'created': time.time() - 0.5,
+                       'last_run': None}])
+    fired = []
+    first, second = Scheduler(path), Scheduler(path)
+    first.start(lambda name: fired.append('first'))
+    time.sleep(0.2)
+    second.start(lambda name: fired.append('second'))
+    try:
+        time.sleep(1.5)
+        assert fired and set(fired) == {'first'}
+        assert first.owner and not second.owner
+        # When the owner stops, the other instance takes over.
+        first.stop()
+        first.thread.join(5)
+        deadline = time.monotonic() + 5
+        while 'second' not in fired and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert 'second' in fired
+    finally:
+        first.stop()
+        second.stop()
+        second.thread.join(5)
+
+
+def test_failing_callback_does_not_stop_the_scheduler(tmp_path):
+    path = str(tmp_path / 'schedules.json')
+    write_jobs(path, [{'id': 'a', 'name': 'tick', 'interval': 1, 'created': time.time() - 1,
+                       'last_run': None}])
+    calls = []
+    fired_again = threading.Event()
+
+    def callback(name):
+        calls.append(name)
+        if len(calls) == 1:
+            raise RuntimeError("job bug")
+        fired_again.set()
+
+    instance = Scheduler(path)
+    instance.start(callback)
+    try:
+        assert fired_again.wait(5)
+        assert instance.thread.is_alive()
+    finally:
+        instance.stop()
+        instance.thread.join(5)
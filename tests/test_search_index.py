@@ -0,0 +1,50 @@
+import search_index
+from command_utils import search_commands
+from search_index import SearchIndex
+
+COMMANDS = {
+    'docker-ps': {'command': 'docker ps -a', 'description': 'List containers', 'category': 'Docker'},
+    'logs': {'command': 'kubectl logs -f web', 'description': 'Follow pod logs', 'category': 'Kubernetes'},
+    'disk': {'command': 'df -h', 'description': 'Disk usage', 'category': 'Storage'},
+    'restart': {'command': 'systemctl restart nginx', 'description': 'Restart the web server'},
+    'x': {'command': 'xdg-open .', 'category': 'Desktop'},
+}
+
+
+def test_matches_the_linear_search():
+    index = SearchIndex(COMMANDS)
+    for query in ('docker', 'logs', 'df -h', 'web', 'd', 'x', 'de', '-h', 'st', 'zz-no-match', ' DOCKER '):
+        assert set(search_commands(COMMANDS, query, index)) == set(search_commands(COMMANDS, query)), query
+
+
+def test_short_queries_below_trigram_length():
+    index = SearchIndex(COMMANDS)
+    assert set(index.search('x')) == {'x', 'restart'}
+    assert index.search('x')[0] == 'x'
+    assert set(index.search('-h')) == {'disk'}
+    assert index.search('') == list(COMMANDS)
+
+
+def test_on_change_updates_the_index():
+    index = SearchIndex(COMMANDS)
+    index.on_change('disk', {'command': 'du -sh', 'description': 'Directory sizes'})
+    assert index.search('df -h') == []
+    assert index.search('du -sh') == ['disk']
+    index.on_change('restart', None)
+    assert 'restart' not in index
+    assert index.search('nginx') == []
+    assert index.search('web') == ['logs']
+    index.on_change('nginx', {'command': 'nginx -t'})
+    assert index.search('ngi') == ['nginx']
+
+
+def test_limit_keeps_the_best_matches(monkeypatch):
+    monkeypatch.setattr(search_index, 'MAX_SCORED', 50)
+    commands = {f'cmd-{i}': {'command': 'docker ps'} for i in range(500)}
+    commands['docker'] = {'command': 'docker ps'}
+    index = SearchIndex(commands)
+    found = index.search('docker', limit=10)
+    assert len(found) == 10
+    assert found[0] == 'docker'
+    assert index.search('d', limit=10)[0] == 'docker'
+    assert len(search_commands(commands, 'docker', limit=10)) == 10
@@ -0,0 +1,119 @@
+import json
+
+import pytest
+
+from core import CommandCore
+from workflow import CANCELLED, FAILED, OK, SKIPPED
+
+
+@pytest.fixture
+def core(tmp_path):
+    core = CommandCore(str(tmp_path), max_workers=4)
+    yield core
+    core.close()
+
+
+def add_workflow(core, tmp_path, name, steps, **options):
+    with open(tmp_path / 'workflows.json', 'w') as file:
+        json.dump({name: dict(options, steps=steps)}, file)
+
+
+def run_workflow(core, name, **options):
+    run = core.workflows.start(name, **options)
+    assert run.wait(30)
+    return run
+
+
+def test_zero_timeout_means_no_timeout(core, tmp_path):
+    core.store.put('nap', {'command': 'sleep 0.2 && echo done', 'timeout': 0})
+    add_workflow(core, tmp_path, 'wf', [{'command': 'nap'}])
+    run = run_workflow(core, 'wf')
+    assert run.status == {'nap': OK}
+
+
+def test_pipeline_with_one_zero_timeout_is_unbounded(core, tmp_path):
+    core.store.put('produce', {'command': 'sleep 0.2 && echo data', 'timeout': 0})
+    core.store.put('consume', {'command': 'cat', 'timeout': 5})
+    add_workflow(core, tmp_path, 'wf', [{'command': 'produce'},
+                                        {'command': 'consume', 'input': 'produce'}])
+    run = run_workflow(core, 'wf')
+    assert run.status == {'produce': OK, 'consume': OK}
+
+
+def test_timeout_still_applies(core, tmp_path):
+    core.store.put('slow', {'command': 'sleep 5', 'timeout': 0.2})
+    add_workflow(core, tmp_path, 'wf', [{'command': 'slow'}])
+    run = run_workflow(core, 'wf')
+    assert run.status == {'slow': FAILED}
+
+
+def test_failure_skips_dependents(core, tmp_path):
+    core.store.put('ok', {'command': 'true'})
+    core.store.put('bad', {'command': 'false'})
+    add_workflow(core, tmp_path, 'wf', [{'command': 'bad'}, {'command': 'ok', 'after': ['bad']}],
+                 continue_on_error=True)
+    run = run_workflow(core, 'wf')
+    assert run.status == {'bad': FAILED, 'ok': SKIPPED}
+    assert CANCELLED not in run.status.values()
+
+
+def test_pipeline_cleans_up_when_a_stage_fails_to_start(monkeypatch):
+    import os
+    import subprocess
+
+    import workflow
+
+    started = []
+    real_popen = subprocess.Popen
+
+    def popen(*args, **kwargs):
+        if started:
+            raise OSError("cannot start")
+        started.append(real_popen(*args, **kwargs))
+        return started[-1]
+
+    monkeypatch.setattr(workflow.subprocess, 'Popen', popen)
+    fds = len(os.listdir('/proc/self/fd'))
+    with pytest.raises(OSError):
+        workflow.run_pipeline(['sleep 30', 'cat'])
+    assert len(os.listdir('/proc/self/fd')) == fds
+    assert started[0].returncode is not None
+
+
+def test_command_deleted_after_start_fails_its_step(core, tmp_path):
+    core.store.put('first', {'command': 'sleep 0.3'})
+    core.store.put('second', {'command': 'true'})
+    add_workflow(core, tmp_path, 'wf', [{'command': 'first'}, {'command': 'second', 'after': ['first']}])
+    run = core.workflows.start('wf')
+    core.store.delete('second')
+    assert run.wait(30)
+    assert run.status == {'first': OK, 'second': FAILED}
+
+
+def test_raising_on_step_does_not_hang_the_workflow(core, tmp_path):
+    core.store.put('a', {'command': 'true'})
+    core.store.put('b', {'command': 'true'})
+    add_workflow(core, tmp_path, 'wf', [{'command': 'a'}, {'command': 'b', 'after': ['a']}])
+
+    def on_step(run, step_id, state, output):
+        raise RuntimeError("callback bug")
+
+    run = run_workflow(core, 'wf', on_step=on_step)
+    assert run.status == {'a': OK, 'b': OK}
+
+
+def test_unit_that_raises_is_marked_failed(core, tmp_path, monkeypatch):
+    core.store.put('a', {'command': 'true'})
+    core.store.put('b', {'command': 'true'})
+    add_workflow(core, tmp_path, 'wf', [{'command': 'a'}, {'command': 'b', 'after': ['a']}])
+
+    set_status = core.workflows._set_status
+
+    def failing_set_status(run, step_ids, state):
+        if state == OK:
+            raise OSError("disk full")
+        set_status(run, step_ids, state)
+
+    monkeypatch.setattr(core.workflows, '_set_status', failing_set_status)
+    run = run_workflow(core, 'wf')
+    assert run.status == {'a': FAILED, 'b': SKIPPED}
@@ -0,0 +1,83 @@
+import collections
+import tkinter as tk
+
+FRAME_INTERVAL_MS = 33
+MAX_EVENTS_PER_TICK = 10000
+
+
+class UIDispatcher:
+    """Hand output and progress from worker threads to the Tk main loop.
+
+    Tkinter widgets may only be touched from the main thread. Workers
+    append events to a deque (append and popleft are atomic, so no lock
+    is taken) and a frame-rate after() tick drains it, joining all output
+    chunks of a tick into one Text insert and passing only the latest
+    progress per command to the progress listeners.
+    """
+
+    def __init__(self, root, text_widget, interval_ms=FRAME_INTERVAL_MS, max_lines=5000):
+        self.root = root
+        self.text_widget = text_widget
+        self.interval_ms = interval_ms
+        self.max_lines = max_lines
+        self.events = collections.deque()
+        self.progress_listeners = []
+
+    def start(self):
+        self.root.after(self.interval_ms, self._tick)
+
+    def post_output(self, text):
+        self.events.append(('output', text))
+
+    def post_progress(self, name, progress, maximum):
+        self.events.append(('progress', (name, progress, maximum)))
+
+    def call(self, func, *args):
+        """Run func(*args) on the main thread at the next tick."""
+        self.events.append(('call', (func, args)))
+
+    def add_progress_listener(self, listener):
+        """Call listener(name, progress, maximum) for each progress update."""
+        self.progress_listeners.append(listener)
+
+    def remove_progress_listener(self, listener):
+        if listener in self.progress_listeners:
+            self.progress_listeners.remove(listener)
+
+    def _tick(self):
+        try:
+            self._drain()
+        finally:
+            self.root.after(self.interval_ms, self._tick)
+
+    def _drain(self):
+        chunks = []
+        progress = {}
+        for _ in range(min(len(self.events), MAX_EVENTS_PER_TICK)):
+            kind, data = self.events.popleft()
+            if kind == 'output':
+                chunks.append(data)
+            elif kind == 'progress':
+                progress[data[0]] = data
+            else:
+                # Keep output ordered relative to callbacks that may read it.
+                self._flush_output(chunks)
+                chunks = []
+                func, args = data
+                func(*args)
+        self._flush_output(chunks)
+        for name, current, maximum in progress.values():
+            for listener in list(self.progress_listeners):
+                listener(name, current, maximum)
+
+    def _flush_output(self, chunks):
+        if not chunks:
+            return
+        text = self.text_widget
+        text.config(state=tk.NORMAL)
+        text.insert(tk.END, "".join(chunks))
+        lines = int(text.index('end-1c').split('.')[0])
+        if lines > self.max_lines:
+            text.delete('1.0', f"{lines - self.max_lines + 1}.0")
+        text.see(tk.END)
+        text.config(state=tk.DISABLED)
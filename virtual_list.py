@@ -0,0 +1,143 @@
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import ttk
+
+
+class VirtualListbox(ttk.Frame):
+    """Listbox that only holds the rows currently in view.
+
+    The full list is kept as a list of row keys; formatter(key) turns a
+    key into display text and is only called for visible rows. Refreshes
+    compare the new visible rows with the rendered ones and touch only
+    the rows that changed, so the cost of a refresh depends on the window
+    height rather than on the number of rows. Selection is tracked by key
+    through selected_key().
+    """
+
+    def __init__(self, master, formatter=str, **kwargs):
+        super().__init__(master)
+        self.formatter = formatter
+        self.keys = []
+        self.first = 0
+        self.rendered = []
+        self.selected = None
+        self.row_height = None
+
+        self.listbox = tk.Listbox(self, exportselection=False, **kwargs)
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.yview)
+        self.scrollbar.pack(side='right', fill='y')
+        self.listbox.pack(side='left', fill='both', expand=True)
+
+        # The internal handlers live on their own bind tag ahead of the
+        # widget's, so bind() keeps plain Tk semantics without replacing
+        # them, and the selection is up to date when callers see an event.
+        self.bind_tag = f"VirtualListbox{self.listbox}"
+        self.listbox.bindtags((self.bind_tag,) + self.listbox.bindtags())
+        self.internal_bindings = {
+            "<Configure>": lambda event: self.render(),
+            "<<ListboxSelect>>": self.on_select,
+            "<MouseWheel>": self.on_mousewheel,
+            "<Button-4>": lambda event: self.scroll(-3),
+            "<Button-5>": lambda event: self.scroll(3),
+            "<Up>": lambda event: self.move_selection(-1),
+            "<Down>": lambda event: self.move_selection(1),
+            "<Prior>": lambda event: self.scroll(-self.visible_rows()),
+            "<Next>": lambda event: self.scroll(self.visible_rows()),
+        }
+        for sequence, func in self.internal_bindings.items():
+            self.listbox.bind_class(self.bind_tag, sequence, func)
+
+    def bind(self, sequence=None, func=None, add=None):
+        """Bind on the inner listbox, like Listbox.bind."""
+        return self.listbox.bind(sequence, func, add)
+
+    def destroy(self):
+        for sequence in self.internal_bindings:
+            self.listbox.unbind_class(self.bind_tag, sequence)
+        super().destroy()
+
+    def set_keys(self, keys):
+        """Replace the rows and redraw whatever changed in view."""
+        self.keys = list(keys)
+        if self.selected is not None and self.selected not in self.keys:
+            self.selected = None
+        self.render()
+
+    def refresh(self):
+        """Re-format the visible rows, e.g. after the underlying data changed."""
+        self.render()
+
+    def selected_key(self):
+        return self.selected
+
+    def clear(self):
+        self.set_keys([])
+
+    def visible_rows(self):
+        if self.row_height is None:
+            font = tkfont.Font(self, font=self.listbox.cget('font'))
+            self.row_height = font.metrics('linespace') + 1
+        height = self.listbox.winfo_height()
+        if height <= 1:
+            return int(self.listbox.cget('height'))
+        return max(1, height // self.row_height)
+
+    def render(self):
+        visible = self.visible_rows()
+        self.first = max(0, min(self.first, len(self.keys) - visible))
+        keys = self.keys[self.first:self.first + visible]
+        rows = [self.formatter(key) for key in keys]
+
+        for index, row in enumerate(rows):
+            if index >= len(self.rendered):
+                self.listbox.insert(tk.END, row)
+            elif self.rendered[index] != row:
+                self.listbox.delete(index)
+                self.listbox.insert(index, row)
+        if len(self.rendered) > len(rows):
+            self.listbox.delete(len(rows), tk.END)
+        self.rendered = rows
+
+        self.listbox.selection_clear(0, tk.END)
+        if self.selected is not None and self.selected in keys:
+            self.listbox.selection_set(keys.index(self.selected))
+        total = len(self.keys) or 1
+        self.scrollbar.set(self.first / total, min(1.0, (self.first + visible) / total))
+
+    def yview(self, *args):
+        if args[0] == 'moveto':
+            self.first = int(float(args[1]) * len(self.keys))
+            self.render()
+        elif args[0] == 'scroll':
+            step = self.visible_rows() if args[2] == 'pages' else 1
+            self.scroll(int(args[1]) * step)
+
+    def scroll(self, rows):
+        self.first += rows
+        self.render()
+        return "break"
+
+    def on_mousewheel(self, event):
+        return self.scroll(-1 if event.delta > 0 else 1)
+
+    def on_select(self, event):
+        selection = self.listbox.curselection()
+        if selection and self.first + selection[0] < len(self.keys):
+            self.selected = self.keys[self.first + selection[0]]
+
+    def move_selection(self, step):
+        if not self.keys:
+            return "break"
+        if self.selected is None:
+            index = self.first
+        else:
+            index = min(max(self.keys.index(self.selected) + step, 0), len(self.keys) - 1)
+        self.selected = self.keys[index]
+        visible = self.visible_rows()
+        if index < self.first:
+            self.first = index
+        elif index >= self.first + visible:
+            self.first = index - visible + 1
+        self.render()
+        self.listbox.event_generate("<<ListboxSelect>>")
+        return "break"
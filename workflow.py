@@ -0,0 +1,405 @@
+"""Workflows: named DAGs of stored commands run on a bounded worker pool.
+
+workflows.json maps a workflow name to its steps:
+
+    {"release": {"continue_on_error": false, "steps": [
+        {"id": "fetch", "command": "git-pull"},
+        {"id": "build", "command": "make", "after": ["fetch"]},
+        {"id": "lint", "command": "lint", "after": ["fetch"]},
+        {"id": "size", "command": "count-bytes", "input": "build"},
+        {"id": "deploy", "command": "deploy", "after": ["build", "lint"]}]}}
+
+command names a stored command and id defaults to it. A step starts once
+every step in after has succeeded. A step with input reads the stdout
+of that step through an OS pipe, so the two run together like a shell
+pipeline and the data never passes through Python.
+"""
+import concurrent.futures
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+
+import runner
+
+# Step states kept in workflow_state.json.
+PENDING, RUNNING, OK, FAILED, SKIPPED, CANCELLED = (
+    'pending', 'running', 'ok', 'failed', 'skipped', 'cancelled')
+
+
+def load_workflows(path='workflows.json'):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_json(data, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(data, file, indent=4)
+    os.replace(tmp_path, path)
+
+
+def build_units(definition, commands):
+    """Validate a workflow definition and group it into schedulable units.
+
+    A unit is one step, or a chain of steps joined by input pipes. Returns
+    (steps, units, depends) where steps maps step id to its definition,
+    units is a list of step-id lists in pipe order and depends maps a unit
+    index to the set of unit indexes it waits for. Raises ValueError for
+    unknown commands or steps, branching pipes and cycles.
+    """
+    steps = {}
+    for step in definition.get('steps', []):
+        step_id = step.get('id') or step['command']
+        if step_id in steps:
+            raise ValueError(f"Duplicate step '{step_id}'")
+        if step['command'] not in commands:
+            raise ValueError(f"Step '{step_id}' uses unknown command '{step['command']}'")
+        steps[step_id] = step
+    consumers = {}
+    for step_id, step in steps.items():
+        for other in list(step.get('after', [])) + ([step['input']] if step.get('input') else []):
+            if other not in steps:
+                raise ValueError(f"Step '{step_id}' depends on unknown step '{other}'")
+        if step.get('input'):
+            if step['input'] in consumers:
+                raise ValueError(f"Step '{step['input']}' can only pipe into one step")
+            consumers[step['input']] = step_id
+
+    units, unit_of = [], {}
+    for step_id, step in steps.items():
+        if step.get('input'):
+            continue
+        chain = [step_id]
+        while chain[-1] in consumers:
+            if consumers[chain[-1]] in chain:
+                raise ValueError(f"Workflow has a pipe cycle through '{step_id}'")
+            chain.append(consumers[chain[-1]])
+        for member in chain:
+            unit_of[member] = len(units)
+        units.append(chain)
+    if len(unit_of) < len(steps):
+        raise ValueError("Workflow has a pipe cycle")
+
+    depends = {index: set() for index in range(len(units))}
+    for step_id, step in steps.items():
+        for other in step.get('after', []):
+            if unit_of[other] == unit_of[step_id]:
+                raise ValueError(f"Step '{step_id}' cannot wait for '{other}' in its own pipeline")
+            depends[unit_of[step_id]].add(unit_of[other])
+
+    # Kahn's algorithm; anything left over sits on a cycle.
+    remaining = {index: set(deps) for index, deps in depends.items()}
+    ready = [index for index, deps in remaining.items() if not deps]
+    seen = 0
+    while ready:
+        index = ready.pop()
+        seen += 1
+        for other, deps in remaining.items():
+            if index in deps:
+                deps.discard(index)
+                if not deps:
+                    ready.append(other)
+    if seen < len(units):
+        raise ValueError("Workflow has a dependency cycle")
+    return steps, units, depends
+
+
+class WorkflowRun:
+    """One execution of a workflow; returned by WorkflowRunner.start.
+
+    status maps each step id to its state. on_step(run, step_id, state,
+    output) is called from worker threads whenever a step finishes.
+    """
+
+    def __init__(self, name, steps, units, depends, status, continue_on_error, on_step):
+        self.name = name
+        self.steps = steps
+        self.units = units
+        self.depends = depends
+        self.status = status
+        self.continue_on_error = continue_on_error
+        self.on_step = on_step
+        self.processes = set()
+        self.cancelled = False
+        self.stopping = False
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    @property
+    def succeeded(self):
+        return all(state == OK for state in self.status.values())
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def cancel(self):
+        """Stop the workflow; steps that have not finished are marked cancelled."""
+        self.cancelled = True
+        self.stop()
+
+    def stop(self):
+        """Kill the running steps without starting any more."""
+        with self.lock:
+            self.stopping = True
+            processes = list(self.processes)
+        for process in processes:
+            runner.terminate(process)
+
+    def _started(self, process):
+        with self.lock:
+            self.processes.add(process)
+            if self.stopping:
+                runner.terminate(process)
+
+
+class WorkflowRunner:
+    """Runs workflows from workflows.json against a CommandCore.
+
+    Units whose dependencies have succeeded are handed to a thread pool
+    of max_workers, so independent branches overlap and a workflow takes
+    roughly its critical-path time. Step states are written to
+    workflow_state.json as they change; resume=True skips the steps that
+    already succeeded and picks up from the first failure. Each step is
+    recorded in history as "<workflow>/<step>".
+    """
+
+    def __init__(self, core, path='workflows.json', state_path='workflow_state.json', max_workers=None):
+        self.core = core
+        self.path = path
+        self.state_path = state_path
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.state_lock = threading.Lock()
+
+    def workflows(self):
+        return load_workflows(self.path)
+
+    def load_state(self):
+        return load_workflows(self.state_path)
+
+    def start(self, name, resume=False, continue_on_error=None, on_step=None):
+        """Start workflow name on a background thread and return its WorkflowRun."""
+        definition = self.workflows().get(name)
+        if definition is None:
+            raise KeyError(name)
+        steps, units, depends = build_units(definition, self.core.commands)
+        status = {step_id: PENDING for step_id in steps}
+        if resume:
+            previous = self.load_state().get(name, {}).get('status', {})
+            for step_id in steps:
+                if previous.get(step_id) == OK:
+                    status[step_id] = OK
+        if continue_on_error is None:
+            continue_on_error = definition.get('continue_on_error', False)
+        run = WorkflowRun(name, steps, units, depends, status, continue_on_error, on_step)
+        self._save_status(run)
+        threading.Thread(target=self._schedule, args=(run,), daemon=True).start()
+        return run
+
+    def _schedule(self, run):
+        remaining = {index: set(deps) for index, deps in run.depends.items()
+                     if not all(run.status[step_id] == OK for step_id in run.units[index])}
+        for deps in remaining.values():
+            deps.intersection_update(remaining)
+        running = {}
+        try:
+            with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+                while remaining or running:
+                    if not run.stopping:
+                        # Units are only handed over when a worker is free, so a
+                        # failure still stops everything that has not started.
+                        ready = [index for index, deps in remaining.items() if not deps]
+                        for index in ready[:self.max_workers - len(running)]:
+                            del remaining[index]
+                            self._set_status(run, run.units[index], RUNNING)
+                            running[pool.submit(self._run_unit, run, index)] = index
+                    if not running:
+                        break
+                    finished, _ = concurrent.futures.wait(
+                        running, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        index = running.pop(future)
+                        if self._unit_succeeded(run, index, future):
+                            for deps in remaining.values():
+                                deps.discard(index)
+                            continue
+                        if run.continue_on_error:
+                            self._skip_dependents(run, remaining, index)
+                        else:
+                            run.stop()
+            # Whatever never started was skipped by a failure or cancelled.
+            leftover = [step_id for index in remaining for step_id in run.units[index]]
+            self._set_status(run, leftover, CANCELLED if run.cancelled else SKIPPED)
+        finally:
+            # Waiters such as `cst workflow run` must return even if
+            # scheduling itself failed.
+            run.done.set()
+
+    def _unit_succeeded(self, run, index, future):
+        """Result of a finished unit; a unit that raised failed its unfinished steps."""
+        try:
+            return future.result()
+        except Exception:
+            logging.exception("Workflow %s: unit %s failed", run.name, ', '.join(run.units[index]))
+            self._set_status(run, [step_id for step_id in run.units[index]
+                                   if run.status[step_id] == RUNNING], FAILED)
+            return False
+
+    def _skip_dependents(self, run, remaining, index):
+        blocked = [index]
+        while blocked:
+            current = blocked.pop()
+            for other in [other for other, deps in remaining.items() if current in deps]:
+                del remaining[other]
+                self._set_status(run, run.units[other], SKIPPED)
+                blocked.append(other)
+
+    def _run_unit(self, run, index):
+        """Run one unit and record it; returns True if every step succeeded."""
+        step_ids = run.units[index]
+        names = [run.steps[step_id]['command'] for step_id in step_ids]
+        # Commands can be deleted after the workflow was validated.
+        missing = [name for name in names if name not in self.core.commands]
+        details = [self.core.commands.get(name, {'command': ''}) for name in names]
+        # A missing or zero timeout on any stage means the unit may run unbounded.
+        timeouts = [entry.get('timeout') for entry in details]
+        timeout = max(timeouts) if all(timeouts) else None
+        try:
+            if missing:
+                results, output = [None] * len(step_ids), f"No command found with the name '{missing[0]}'."
+            elif len(step_ids) == 1:
+                result = runner.run_command(details[0]['command'], timeout=timeout,
+                                            on_start=run._started)
+                results, output = [result], result.output
+            else:
+                results, output = run_pipeline([entry['command'] for entry in details], timeout,
+                                               run._started)
+        except Exception as e:
+            results, output = [None] * len(step_ids), str(e)
+
+        ok = True
+        for position, (step_id, entry, result) in enumerate(zip(step_ids, details, results)):
+            last = position == len(step_ids) - 1
+            step_output = output if last else f"[stdout piped into {step_ids[position + 1]}]"
+            succeeded = result is not None and result.returncode == 0 and not result.timed_out
+            if run.stopping and not succeeded:
+                state = CANCELLED
+            else:
+                state = OK if succeeded else FAILED
+            ok = ok and succeeded
+            try:
+                self.core.history.add_run(f"{run.name}/{step_id}", entry['command'], [step_output],
+                                          result.returncode if result else None,
+                                          metrics=[result.metrics()] if result else None)
+            except Exception:
+                logging.exception("Workflow %s: could not record step %s", run.name, step_id)
+            self._set_status(run, [step_id], state)
+            if run.on_step:
+                try:
+                    run.on_step(run, step_id, state, step_output)
+                except Exception:
+                    logging.exception("Workflow %s: on_step failed for %s", run.name, step_id)
+        return ok
+
+    def _set_status(self, run, step_ids, state):
+        if not step_ids:
+            return
+        with self.state_lock:
+            for step_id in step_ids:
+                run.status[step_id] = state
+            self._save_status(run)
+
+    def _save_status(self, run):
+        state = self.load_state()
+        state[run.name] = {'updated': time.time(), 'status': dict(run.status)}
+        save_json(state, self.state_path)
+
+
+def run_pipeline(commands, timeout=None, on_start=None, max_output=runner.DEFAULT_MAX_OUTPUT):
+    """Run shell commands connected stdout-to-stdin with OS pipes.
+
+    The stderr of every stage and the stdout of the last stage are
+    collected into one output string, capped at max_output bytes. Returns
+    (results, output) with one runner.RunResult per stage.
+    """
+    read_end, write_end = os.pipe()
+    processes, results, samplers = [], [], []
+    # Pipe ends the parent still owns; the children hold their own copies.
+    open_fds = [read_end, write_end]
+    try:
+        stdin = None
+        for position, command in enumerate(commands):
+            last = position == len(commands) - 1
+            if last:
+                stdout = write_end
+            else:
+                next_stdin, stdout = os.pipe()
+                open_fds += [next_stdin, stdout]
+            results.append(runner.RunResult())
+            process = subprocess.Popen(command, shell=True, stdin=stdin, stdout=stdout,
+                                       stderr=write_end, start_new_session=True)
+            processes.append(process)
+            samplers.append(runner.RssSampler(process.pid))
+            if on_start:
+                on_start(process)
+            if stdin is not None:
+                os.close(stdin)
+                open_fds.remove(stdin)
+            if not last:
+                os.close(stdout)
+                open_fds.remove(stdout)
+                stdin = next_stdin
+    except BaseException:
+        # A stage failed to start: release every pipe and do not leave the
+        # earlier stages running or unreaped.
+        for fd in open_fds:
+            os.close(fd)
+        for process, sampler in zip(processes, samplers):
+            runner.terminate(process)
+            sampler.stop()
+            process.wait()
+        raise
+    os.close(write_end)
+
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        for process in processes:
+            runner.terminate(process)
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.start()
+    kept, kept_size, truncated = [], 0, False
+    with os.fdopen(read_end, 'rb') as reader:
+        while True:
+            data = reader.read1(runner.STREAM_LIMIT)
+            if not data:
+                break
+            piece = data[:max(max_output - kept_size, 0)]
+            kept.append(piece)
+            kept_size += len(piece)
+            truncated = truncated or len(piece) < len(data)
+    for process, result, sampler in zip(processes, results, samplers):
+        result.max_rss = sampler.stop()
+        if hasattr(os, 'wait4'):
+            runner.reap(process, result)
+        else:
+            result.returncode = process.wait()
+        result.finished = time.monotonic()
+        result.timed_out = timed_out.is_set()
+    if timer:
+        timer.cancel()
+
+    output = b"".join(kept).decode(errors='replace')
+    if truncated:
+        output += f"\n[output truncated at {max_output} bytes]\n"
+    if timed_out.is_set():
+        output += f"\n[timed out after {timeout}s]\n"
+    return results, output